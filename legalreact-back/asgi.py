@@ -0,0 +1,301 @@
+"""
+Async serving mode.
+
+    hypercorn asgi:app --bind 0.0.0.0:8000 --workers 2
+
+/invoke, /summarize and /translatedoc are served by a Quart app whose agents
+await the model, embedding, vector store and Azure calls (ainvoke on the graph,
+acached_invoke/acached_stream on the LLM), so a worker holds thousands of slow
+upstream calls on one event loop instead of one thread each. Every other route
+(jobs, metrics, recent documents, the UI) is the unchanged Flask app from
+main.py, run in the loop's thread pool (ASYNC_WSGI_THREADS threads).
+
+The request/response contract is the same as main.py's, including the
+?stream=sse|ndjson streaming responses. gunicorn main:app remains the sync mode.
+"""
+import os
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart, request, jsonify, Response
+from hypercorn.middleware import AsyncioWSGIMiddleware
+import main
+from main import build_workflow, parse_stream_format, encode_event, stream_mimetype, STREAM_HEADERS
+from router import aroute_query
+from llm_cache import acached_invoke
+from clients import get_async_chat_llm, aclose_loop_clients
+from subsystems import subsystem, SubsystemUnavailable
+
+ASYNC_PATHS = ("/invoke", "/summarize", "/translatedoc")
+ASYNC_WSGI_THREADS = int(os.getenv("ASYNC_WSGI_THREADS", "32"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "100")) * 1024 * 1024
+REQUEST_TIMEOUT_SECONDS = int(os.getenv("ASYNC_REQUEST_TIMEOUT", "600"))
+
+quart_app = Quart(__name__)
+# Quart's defaults (16 MB bodies, 60 s timeouts) are far below what a long contract needs
+quart_app.config.update(
+    MAX_CONTENT_LENGTH=MAX_UPLOAD_BYTES,
+    BODY_TIMEOUT=REQUEST_TIMEOUT_SECONDS,
+    RESPONSE_TIMEOUT=REQUEST_TIMEOUT_SECONDS,
+)
+
+
+async def allm_classify_query(user_input):
+    prompt = f"""
+    Classify the following user query:
+    - "case_search" if searching for similar legal cases.
+    - "verdict_prediction" if seeking a verdict prediction.
+    - "document_generation" if query is regarding any kind of drafting or creation of a document.
+
+    Query: "{user_input}"
+    Output (case_search or verdict_prediction or document_generation):
+    """
+
+    response = await acached_invoke(get_async_chat_llm(), prompt, "classify_query")
+    classification = response.content.strip().lower()
+
+    return classification if classification in ["case_search", "verdict_prediction", "document_generation"] else "unknown"
+
+
+async def aclassify_query(data):
+    user_input = data.get("user_input", "").strip() if isinstance(data, dict) else str(data).strip()
+
+    if not user_input:
+        return "unknown", data
+
+    classification = await aroute_query(user_input, allm_classify_query)
+
+    return (classification, data)
+
+
+async def acase_search_agent(data):
+    if isinstance(data, tuple):  # the graph passes the classifier's (classification, data)
+        _, data = data
+    query = data.get("user_input", "") if isinstance(data, dict) else str(data)
+    if not query:
+        return {"error": "No query provided."}
+    try:
+        result = await subsystem("case_search").asearch_cases(query)
+    except ValueError as e:  # vector store not configured
+        return {"error": str(e)}
+    return {"result": result}
+
+
+async def averdict_agent(data):
+    if isinstance(data, tuple):  # the graph passes the classifier's (classification, data)
+        _, data = data
+    case_input = data.get("user_input", "") if isinstance(data, dict) else str(data)
+    if not case_input:
+        return {"error": "No case input provided."}
+    return await subsystem("verdict").aprocess_case(case_input)
+
+
+async def adocument_generation(inputs):
+    if isinstance(inputs, tuple):
+        _, data = inputs
+    else:
+        data = inputs
+
+    if not isinstance(data, dict):
+        return {"error": "Invalid input format."}
+
+    user_query = data.get("user_input", "").strip()
+    if not user_query:
+        return {"error": "User input is missing or empty."}
+
+    formatter = subsystem("documents")
+    document_type = await formatter.aclassify_document_type(user_query)
+    if not document_type:
+        return {"error": "Could not determine document type."}
+
+    # Template lookup and rendering are local CPU/disk work; keep them off the event loop
+    template = await asyncio.to_thread(formatter.fetch_template_from_blob, document_type)
+    if not template:
+        print("Error: Template fetching failed, stopping execution.")
+        return
+
+    placeholders = formatter.extract_placeholders(template)
+    if not placeholders:
+        return {"error": "No placeholders found in the template."}
+
+    extracted_data = await formatter.aextract_entities_from_gpt(user_query, document_type, placeholders)
+    if not extracted_data:
+        return {"error": "GPT response format is incorrect."}
+
+    final_doc_path = await asyncio.to_thread(formatter.fill_document_with_gpt, template, extracted_data)
+    if not final_doc_path:
+        return {"error": "Failed to generate document."}
+
+    return {"document_path": final_doc_path}
+
+
+_workflow = None
+
+
+def get_workflow():
+    """The graph compiled with the async agents (one event loop per worker, so no lock is needed)."""
+    global _workflow
+    if _workflow is None:
+        _workflow = build_workflow(aclassify_query, acase_search_agent, averdict_agent, adocument_generation)
+    return _workflow
+
+
+async def requested_stream_format():
+    form = await request.form
+    return parse_stream_format(request.args.get("stream") or form.get("stream"), request.headers.get("Accept", ""))
+
+
+def stream_events(events, stream_format):
+    """Wraps an async iterator of (event, data) tuples in an SSE or NDJSON streaming response."""
+    async def generate():
+        async for event, data in events:
+            yield encode_event(event, data, stream_format)
+
+    return Response(generate(), mimetype=stream_mimetype(stream_format), headers=STREAM_HEADERS)
+
+
+async def invoke_events(data):
+    """Classifies the query, then streams verdict stages/tokens; other agents emit a single result."""
+    try:
+        classification, data = await aclassify_query(data)
+        data["classification"] = classification
+        yield "classified", {"classification": classification}
+
+        if classification == "verdict_prediction":
+            async for event in subsystem("verdict").aprocess_case_stream(data["user_input"]):
+                yield event
+        elif classification == "case_search":
+            yield "result", await acase_search_agent(data)
+        elif classification == "document_generation":
+            yield "result", await adocument_generation((classification, data))
+        else:
+            yield "error", {"error": "Could not classify the query."}
+    except SubsystemUnavailable as e:
+        yield "error", {"error": str(e)}
+    except Exception as e:
+        # The response has already started, so a failure has to be reported in the stream
+        print(f"❌ /invoke stream failed: {e}")
+        yield "error", {"error": str(e)}
+
+
+@quart_app.errorhandler(SubsystemUnavailable)
+async def subsystem_unavailable(e):
+    return jsonify({"error": str(e)}), 503
+
+
+@quart_app.after_request
+async def allow_cors(response):
+    # Same policy as CORS(app) on the Flask side
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    return response
+
+
+@quart_app.route("/invoke", methods=["POST"])
+async def invoke_workflow():
+    data = await request.get_json(silent=True)
+    if not data or "user_input" not in data:
+        return jsonify({"error": "user_input is required"}), 400
+
+    stream_format = await requested_stream_format()
+    if stream_format:
+        return stream_events(invoke_events(data), stream_format)
+
+    result = await get_workflow().ainvoke(data)
+    return jsonify(result)
+
+
+@quart_app.route("/summarize", methods=["POST"])
+async def summarize():
+    file = (await request.files).get("file")
+    if not file:
+        return jsonify({"error": "No file provided"}), 400
+
+    summarisation = subsystem("summarisation")
+    # Unique path: concurrent requests for the same file name must not share it
+    file_path = f"/tmp/{uuid.uuid4().hex}_{os.path.basename(file.filename)}"
+    await file.save(file_path)
+
+    stream_format = await requested_stream_format()
+    if stream_format:
+        return stream_events(removing_file(summarisation.aextract_summary_stream(file_path, file.filename), file_path), stream_format)
+
+    try:
+        result = await summarisation.aextract_summary(file_path, file.filename)
+    finally:
+        os.remove(file_path)
+    return jsonify(result)
+
+
+async def removing_file(events, file_path):
+    """Yields the events, then removes the upload once the stream ends or the client disconnects."""
+    try:
+        async for event in events:
+            yield event
+    finally:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+@quart_app.route("/translatedoc", methods=["POST"])
+async def translate_document():
+    file = (await request.files).get("file")
+    target_language = (await request.form).get("target_language")
+    if not file or not target_language:
+        return jsonify({"error": "File and target language are required."}), 400
+
+    translate = subsystem("translation")
+    # Unique path: concurrent requests for the same file name must not share it
+    file_path = f"/tmp/{uuid.uuid4().hex}_{os.path.basename(file.filename)}"
+    await file.save(file_path)
+    try:
+        document = await translate.aupload_pdf_to_blob(file_path, file.filename)
+    finally:
+        os.remove(file_path)
+
+    result = await translate.aprocess_uploaded_document(target_language, document)
+    return jsonify(result)
+
+
+@quart_app.before_serving
+async def use_wsgi_threads():
+    # The Flask routes and asyncio.to_thread both run on the loop's default executor
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=ASYNC_WSGI_THREADS))
+
+
+@quart_app.after_serving
+async def close_clients():
+    await aclose_loop_clients()
+
+
+def flask_app(environ, start_response):
+    """main.app, always yielding at least one chunk: hypercorn only sends the status line with the first chunk."""
+    body = main.app(environ, start_response)
+    try:
+        empty = True
+        for chunk in body:
+            empty = False
+            yield chunk
+        if empty:
+            yield b""
+    finally:
+        if hasattr(body, "close"):
+            body.close()
+
+
+wsgi_app = AsyncioWSGIMiddleware(flask_app, max_body_size=MAX_UPLOAD_BYTES)
+
+
+class Dispatcher:
+    """
+    Sends the async routes (and lifespan events) to Quart and everything else to
+    the Flask app. CORS preflights go to Flask too, where flask-cors answers them.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan" or (scope.get("path") in ASYNC_PATHS and scope.get("method") != "OPTIONS"):
+            await quart_app(scope, receive, send)
+        else:
+            await wsgi_app(scope, receive, send)
+
+
+app = Dispatcher()
@@ -0,0 +1,231 @@
+"""
+Load test: sync serving (gunicorn main:app) against async serving (hypercorn asgi:app).
+
+    python benchmarks/bench_async_serving.py --concurrency 50,200 --requests 400 --latency 0.3
+
+Both servers run the real /invoke verdict path (routing, case detail
+extraction, embedding, two vector searches, verdict) against a fake Azure
+OpenAI endpoint that answers every chat/embedding call after --latency
+seconds, so the numbers show how many slow upstream calls a worker can hold
+at once rather than model speed. The vector indexes are local (--docs
+random vectors each) and the LLM cache is off; every request has a unique
+query, so nothing is served from a cache.
+
+Each mode gets one worker: gunicorn with --threads threads, hypercorn with
+one event loop.
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DIMENSION = 1536
+CASE_DETAILS = json.dumps({
+    "case_description": "Advance paid for a flat that was never delivered",
+    "involved_parties": "Buyer v Builder",
+    "jurisdiction": "India",
+    "alleged_violations": "Cheating",
+})
+
+
+def run_upstream(port, latency):
+    """Fake Azure OpenAI: chat completions and embeddings, each after `latency` seconds."""
+    from aiohttp import web
+
+    async def chat(request):
+        body = await request.json()
+        prompt = json.dumps(body["messages"])
+        await asyncio.sleep(latency)
+        if "Extract key details" in prompt:
+            content = CASE_DETAILS
+        elif "Classify" in prompt:
+            content = "verdict_prediction"
+        else:
+            content = "The accused is likely to be held liable for cheating."
+        if body.get("stream"):
+            return await stream(request, content)
+        return web.json_response({
+            "id": "bench", "object": "chat.completion", "created": int(time.time()), "model": "gpt-4o-mini",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+        })
+
+    async def stream(request, content):
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in content.split(" "):
+            chunk = {"id": "bench", "object": "chat.completion.chunk", "created": int(time.time()), "model": "gpt-4o-mini",
+                     "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def embeddings(request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(latency)
+        data = [{"object": "embedding", "index": i, "embedding": np.random.rand(DIMENSION).round(5).tolist()}
+                for i in range(len(inputs))]
+        return web.json_response({"object": "list", "data": data, "model": "text-embedding-ada-002",
+                                  "usage": {"prompt_tokens": 10, "total_tokens": 10}})
+
+    app = web.Application()
+    app.router.add_post("/openai/deployments/{deployment}/chat/completions", chat)
+    app.router.add_post("/openai/deployments/{deployment}/embeddings", embeddings)
+    web.run_app(app, host="127.0.0.1", port=port, print=None, backlog=4096)
+
+
+def seed_indexes(directory, docs):
+    from vectorstore import LocalIndex
+
+    rng = np.random.default_rng(0)
+    for name, field in (("law-kb", "summary_chunk"), ("past-cases", "summary_chunk")):
+        index = LocalIndex(os.path.join(directory, name))
+        vectors = rng.random((docs, DIMENSION), dtype=np.float32)
+        index.upsert([
+            {"id": f"{name}-{i}", "values": vectors[i].tolist(), "metadata": {"title": f"{name} {i}", field: "..."}}
+            for i in range(docs)
+        ])
+
+
+def server_env(workdir, upstream_port):
+    upstream = f"http://127.0.0.1:{upstream_port}"
+    return {
+        **os.environ,
+        "PYTHONPATH": BACKEND_DIR,
+        "OPENAI_GPT_ENDPOINT": upstream, "OPENAI_GPT_API_KEY": "bench",
+        "EMBEDDING_API_ENDPOINT": upstream, "EMBEDDING_API_KEY": "bench", "EMBEDDING_API_VERSION": "2024-10-21",
+        "VECTOR_STORE_BACKEND": "local", "VECTOR_STORE_DIR": os.path.join(workdir, "vector_store"),
+        "CACHE_DIR": os.path.join(workdir, "cache"),
+        "LLM_CACHE_ENABLED": "false", "ROUTER_AUDIT_RATE": "0",
+        "STARTUP_PRELOAD": "all",
+    }
+
+
+def start_server(mode, port, threads, workdir, env):
+    if mode == "sync":
+        command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"),
+                   "--bind", f"127.0.0.1:{port}", "--workers", "1", "--threads", str(threads),
+                   "--backlog", "4096", "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "hypercorn", "asgi:app", "--bind", f"127.0.0.1:{port}",
+                   "--workers", "1", "--backlog", "4096", "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            start_new_session=True)
+
+
+async def wait_until_up(port, timeout=60):
+    import aiohttp
+
+    deadline = time.time() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.time() < deadline:
+            try:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+async def load(port, concurrency, total):
+    import aiohttp
+
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+    tag = random.randrange(1 << 30)
+
+    async def client(session):
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            payload = {"user_input": f"Predict the verdict for case {tag}-{i}: the builder took an advance "
+                                     f"for a flat and never delivered it."}
+            started = time.perf_counter()
+            try:
+                async with session.post(f"http://127.0.0.1:{port}/invoke", json=payload) as response:
+                    body = await response.json()
+                    if response.status != 200 or "error" in body:
+                        errors += 1
+            except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError):
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "throughput": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "errors": errors,
+    }
+
+
+def stop(process):
+    os.killpg(process.pid, signal.SIGTERM)
+    try:
+        process.wait(timeout=20)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", default="50,200")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per upstream call")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads in sync mode")
+    parser.add_argument("--docs", type=int, default=5000, help="vectors per local index")
+    parser.add_argument("--modes", default="sync,async")
+    args = parser.parse_args()
+
+    if os.getenv("BENCH_UPSTREAM_PORT"):
+        run_upstream(int(os.environ["BENCH_UPSTREAM_PORT"]), args.latency)
+        return
+
+    upstream_port, server_port = 18081, 18080
+    upstream = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--latency", str(args.latency)],
+                                env={**os.environ, "BENCH_UPSTREAM_PORT": str(upstream_port)}, start_new_session=True)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            seed_indexes(os.path.join(workdir, "vector_store"), args.docs)
+            env = server_env(workdir, upstream_port)
+            print(f"upstream latency {args.latency * 1000:.0f} ms per call, {args.requests} requests per run")
+            for mode in args.modes.split(","):
+                server = start_server(mode, server_port, args.threads, workdir, env)
+                try:
+                    asyncio.run(wait_until_up(server_port))
+                    asyncio.run(load(server_port, 4, 8))  # warm-up: clients, indexes, langgraph
+                    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+                        result = asyncio.run(load(server_port, concurrency, args.requests))
+                        print(f"{mode:5s}  concurrency {concurrency:4d}:  {result['throughput']:7.1f} req/s"
+                              f"   p50 {result['p50'] * 1000:7.0f} ms   p95 {result['p95'] * 1000:7.0f} ms"
+                              f"   errors {result['errors']}")
+                finally:
+                    stop(server)
+    finally:
+        os.killpg(upstream.pid, signal.SIGTERM)
+        upstream.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Throughput/memory/quality benchmark for the ingestion chunker.
+
+    python benchmarks/bench_chunker.py --pages 1000,5000
+
+Feeds a synthetic judgment (headings, numbered paragraphs, citations and
+abbreviations such as "s. 420" and "v.", ~450 words a page) to
+
+- fixed:       the previous ingest.chunk_text: the pages joined into one
+               string and cut into blind 500-word windows
+- structured:  chunking.chunk_pages over a page generator (INGEST_CHUNK_TOKENS,
+               INGEST_CHUNK_OVERLAP_TOKENS)
+
+and reports pages/s, peak Python memory (tracemalloc, measured in a second
+pass), chunk count and size in embedding tokens, the share of chunks that end
+mid-sentence, and the share of fragments (chunks under a quarter of the
+largest one). Tokens are counted with tiktoken when its encoding can be
+loaded, otherwise with the estimate in tokens.py.
+"""
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chunking import chunk_pages, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS  # noqa: E402
+from tokens import estimate_tokens, EMBEDDING_TOKEN_ENCODING  # noqa: E402
+
+HEADINGS = ["FACTS", "ISSUES", "SUBMISSIONS OF THE APPELLANT", "SUBMISSIONS OF THE RESPONDENT", "ANALYSIS", "CONCLUSION"]
+SENTENCES = [
+    "The appellant was convicted under s. 420 of the IPC by the learned trial court.",
+    "Reliance was placed on Sharma v. State of Punjab, (2004) 3 SCC 112, where the court considered a similar question.",
+    "M/s. Gupta Traders Pvt. Ltd. had issued the cheque No. 40512 dated 12.03.2015 towards the outstanding dues.",
+    "The High Court, per A. K. Sikri J., held that mens rea at the inception of the transaction was not established.",
+    "It is trite law that the prosecution must prove the ingredients of the offence beyond reasonable doubt.",
+    "Learned counsel for the respondent submitted that the findings of fact do not call for interference.",
+    "We have carefully perused the material on record, including the deposition of PW-3 and the documents exhibited.",
+    "In view of the above, the question whether Sec. 138 of the Negotiable Instruments Act is attracted must be answered.",
+]
+
+
+def judgment_pages(count, seed=0):
+    """Yields page texts one at a time, as document_pages does for a Document Intelligence result."""
+    rng = np.random.default_rng(seed)
+    paragraph_number = 1
+    for page in range(count):
+        paragraphs = []
+        if page % 7 == 0:
+            paragraphs.append(HEADINGS[(page // 7) % len(HEADINGS)])
+        words = 0
+        while words < 450:
+            sentences = [SENTENCES[i] for i in rng.integers(len(SENTENCES), size=int(rng.integers(2, 9)))]
+            paragraph = f"{paragraph_number}. " + " ".join(sentences)
+            paragraph_number += 1
+            paragraphs.append(paragraph)
+            words += len(paragraph.split())
+        yield "\n\n".join(paragraphs)
+
+
+def fixed_chunks(pages, chunk_size=500):
+    words = " ".join(pages).split()
+    for i in range(0, len(words), chunk_size):
+        yield " ".join(words[i:i + chunk_size])
+
+
+def structured_chunks(pages):
+    for chunk in chunk_pages(pages, "bench.pdf"):
+        yield chunk["text"]
+
+
+def run(chunker, pages, count_tokens):
+    chunks, tokens, cut = 0, [], 0
+    for text in chunker(judgment_pages(pages)):
+        chunks += 1
+        if count_tokens:
+            tokens.append(estimate_tokens(text, EMBEDDING_TOKEN_ENCODING))
+        cut += not text.rstrip().endswith((".", "!", "?")) and text not in HEADINGS
+    return chunks, tokens, cut
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default="1000,5000")
+    args = parser.parse_args()
+
+    print(f"structured: {CHUNK_TOKENS} tokens, {CHUNK_OVERLAP_TOKENS} overlap")
+    print(f"{'pages':>6} {'chunker':>10} {'pages/s':>8} {'peak MB':>8} {'chunks':>7} {'mean tok':>8} {'max tok':>8}"
+          f" {'mid-sentence':>12} {'fragments':>9}")
+    for pages in [int(p) for p in args.pages.split(",")]:
+        for name, chunker in (("fixed", fixed_chunks), ("structured", structured_chunks)):
+            start = time.perf_counter()
+            run(chunker, pages, count_tokens=False)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            run(chunker, pages, count_tokens=False)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            chunks, tokens, cut = run(chunker, pages, count_tokens=True)
+            tokens = np.array(tokens)
+            fragments = np.mean(tokens < tokens.max() / 4)
+            print(f"{pages:>6} {name:>10} {pages / elapsed:>8.0f} {peak / 2**20:>8.1f} {chunks:>7} {tokens.mean():>8.0f}"
+                  f" {tokens.max():>8} {cut / chunks:>12.1%} {fragments:>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark of the compiled .docx renderer against the previous paragraph-by-placeholder fill.
+
+    python benchmarks/bench_docx_template.py --pages 100
+
+Builds a synthetic template (about 30 paragraphs per page, a placeholder in every
+fifth paragraph, some split across runs, a table and a multi-paragraph loop per
+page) and times: the old fill, compiling once, and cloning + rendering.
+"""
+import os
+import io
+import sys
+import time
+import argparse
+from docx import Document
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from docx_template import compile_template, render, clone_document  # noqa: E402
+
+FIELDS = ["AGREEMENT_DATE", "COMMENCEMENT_DATE", "TERM_YEARS", "GOVERNING_LAW", "COMPANY_NAME"]
+DATA = {
+    "AGREEMENT_DATE": "2024-01-01", "COMMENCEMENT_DATE": "2024-02-01", "TERM_YEARS": "5",
+    "GOVERNING_LAW": "India", "COMPANY_NAME": "Acme Ltd",
+    "DISCLOSING_PARTIES": ["Acme Ltd", "Beta LLC"], "RECEIVING_PARTIES": ["Bob"],
+}
+
+
+def build_template(pages):
+    doc = Document()
+    for page in range(pages):
+        for i in range(30):
+            p = doc.add_paragraph(f"Clause {page}.{i}: the parties agree to the terms set out herein. ")
+            if i % 5 == 0:
+                field = FIELDS[(page + i) % len(FIELDS)]
+                if i % 10 == 0:
+                    p.add_run("{ " + field[:4])  # split across runs, as Word often saves it
+                    p.add_run(field[4:] + " }").bold = True
+                else:
+                    p.add_run("{ " + field + " }")
+        doc.add_paragraph("Typed or Printed Name: {% for party in DISCLOSING_PARTIES %} - { party.name }")
+        doc.add_paragraph("Date: { AGREEMENT_DATE }")
+        doc.add_paragraph("{% endfor %}")
+        table = doc.add_table(rows=1, cols=2)
+        table.cell(0, 0).text = "Governing law"
+        table.cell(0, 1).text = "{ GOVERNING_LAW }"
+        doc.add_page_break()
+    doc.sections[0].header.paragraphs[0].text = "{ COMPANY_NAME } - Confidential"
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
+
+
+def legacy_fill(doc, extracted_data):
+    """The fill_document_with_gpt loop this renderer replaced (body paragraphs only)."""
+    cleaned_data = {key: (str(value) if value is not None else "") for key, value in extracted_data.items()}
+    for key in ["DISCLOSING_PARTIES", "RECEIVING_PARTIES"]:
+        if key in extracted_data and isinstance(extracted_data[key], list):
+            cleaned_data[key] = ", ".join(map(str, extracted_data[key]))
+    for para in doc.paragraphs:
+        for placeholder, value in cleaned_data.items():
+            para.text = para.text.replace(f"{{ {placeholder} }}", value)
+    for para in doc.paragraphs:
+        if "{% for party in DISCLOSING_PARTIES %}" in para.text:
+            para.text = para.text.replace(
+                "{% for party in DISCLOSING_PARTIES %} - { party.name }",
+                f"Party Disclosing Information: {cleaned_data.get('DISCLOSING_PARTIES', 'N/A')}"
+            )
+    return doc
+
+
+def best_of(runs, func):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times), result
+
+
+def leftover_tags(doc):
+    """Counts unrendered tags in the document as saved to .docx."""
+    buffer = io.BytesIO()
+    doc.save(buffer)
+    doc = Document(buffer)
+    texts = [p.text for p in doc.paragraphs]
+    texts += [cell.text for table in doc.tables for row in table.rows for cell in row.cells]
+    texts += [p.text for p in doc.sections[0].header.paragraphs]
+    return sum(text.count("{") for text in texts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    data = build_template(args.pages)
+    parse_ms, parsed = best_of(args.runs, lambda: Document(io.BytesIO(data)))
+    print(f"template: {args.pages} pages, {len(parsed.paragraphs)} body paragraphs, {len(data) // 1024} KB")
+    print(f"parse .docx:                {parse_ms:9.1f} ms")
+
+    legacy_ms, legacy_doc = best_of(args.runs, lambda: legacy_fill(Document(io.BytesIO(data)), DATA))
+    print(f"legacy fill (parse + fill): {legacy_ms:9.1f} ms   tags left: {leftover_tags(legacy_doc)}")
+
+    compile_ms, compiled = best_of(args.runs, lambda: compile_template(parsed))
+    print(f"compile (once per template):{compile_ms:9.1f} ms")
+
+    render_ms, rendered = best_of(args.runs, lambda: render(compiled, clone_document(parsed), DATA))
+    print(f"clone + render:             {render_ms:9.1f} ms   tags left: {leftover_tags(rendered)}")
+
+
+if __name__ == "__main__":
+    main()
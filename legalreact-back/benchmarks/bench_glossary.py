@@ -0,0 +1,86 @@
+"""
+Benchmark of the compiled glossary against the previous str.replace loop.
+
+    python benchmarks/bench_glossary.py --terms 50000 --pages 200
+
+Builds a synthetic glossary of multi-word legal-looking terms and a translated
+document of about 3,000 characters per page in which some of the terms appear,
+then times compiling the glossary and applying it, next to one str.replace per
+term (the old apply_glossary_replacements).
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from glossary import Glossary  # noqa: E402
+
+WORDS = ["court", "order", "bail", "bond", "appeal", "decree", "notice", "party", "claim", "trust",
+         "estate", "lease", "deed", "charge", "suit", "writ", "review", "summons", "tenant", "surety"]
+DEVANAGARI = "अधिनियमन्यायालयजमानतसाक्ष्यपीठडिक्रीहर्जाना"
+
+
+def build_glossary(count, rng):
+    terms = {}
+    while len(terms) < count:
+        words = rng.sample(WORDS, rng.randint(1, 3))
+        term = " ".join(words).title() + (str(rng.randint(0, 999)) if rng.random() < 0.9 else "")
+        terms[term] = "".join(rng.sample(DEVANAGARI, 6))
+    return terms
+
+
+def build_text(pages, terms, rng):
+    term_list = list(terms)
+    parts = []
+    for _ in range(pages):
+        page = []
+        while sum(len(part) for part in page) < 3000:
+            page.append("".join(rng.sample(DEVANAGARI, 8)))
+            if rng.random() < 0.1:
+                page.append(rng.choice(term_list))
+        parts.append(" ".join(page))
+    return "\n\n".join(parts)
+
+
+def legacy_apply(text, terms):
+    for term, replacement in terms.items():
+        text = text.replace(term, replacement)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=50000)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--legacy-terms", type=int, default=5000,
+                        help="terms used for the str.replace baseline, which is scaled up to --terms")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    terms = build_glossary(args.terms, rng)
+    text = build_text(args.pages, terms, rng)
+    print(f"glossary: {len(terms)} terms, text: {args.pages} pages, {len(text)} characters")
+
+    start = time.perf_counter()
+    glossary = Glossary(terms, "bench")
+    print(f"compile:                  {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        glossary.apply(text)
+        times.append((time.perf_counter() - start) * 1000)
+    print(f"apply (compiled):         {min(times):9.1f} ms")
+
+    subset = dict(list(terms.items())[:args.legacy_terms])
+    start = time.perf_counter()
+    legacy_apply(text, subset)
+    legacy_ms = (time.perf_counter() - start) * 1000
+    print(f"apply (str.replace loop): {legacy_ms * len(terms) / len(subset):9.1f} ms"
+          f"   (measured {legacy_ms:.1f} ms for {len(subset)} terms)")
+
+
+if __name__ == "__main__":
+    main()
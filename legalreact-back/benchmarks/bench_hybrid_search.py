@@ -0,0 +1,172 @@
+"""
+Relevance/latency benchmark for case search: lexical (BM25) vs vector vs hybrid.
+
+    python benchmarks/bench_hybrid_search.py --chunks 20000 --embed-latency 150
+
+Runs casesearch.retrieve_matches in each mode over a synthetic corpus of
+case chunks. Each chunk belongs to a topic (its vocabulary and embedding
+cluster), cites one section of that topic's statute and names its parties.
+Three query sets:
+
+- statute:  "Section 420"                relevant = chunks citing that section
+- party:    "Mehta v. Kapoor"            relevant = chunks naming both parties
+- topical:  a paraphrase of a topic      relevant = chunks of that topic
+            (shares only part of the topic's vocabulary)
+
+Embeddings are simulated the way ada-002 behaves on these queries: chunk
+and topical-query vectors sit near their topic centroid, a section number
+moves a vector only slightly and names barely at all. The numbers are
+therefore only as good as that model; the lexical side (SQLite FTS5) and the
+vector side (LocalIndex, exact search) are the real code. The embeddings
+round trip, which lexical-only answers skip, is a sleep of --embed-latency ms.
+
+recall@k is the share of the top k that is relevant, out of min(k, #relevant).
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import casesearch  # noqa: E402
+import lexical  # noqa: E402
+from vectorstore import LocalIndex  # noqa: E402
+from lexical import LexicalIndex  # noqa: E402
+
+TOPICS = {
+    "cheating": "cheating deception dishonest inducement delivery property fraudulent misrepresentation",
+    "cheque": "cheque dishonour insufficient funds drawer payee notice bank instrument",
+    "dowry": "dowry harassment cruelty husband relatives marriage demand matrimonial",
+    "tenancy": "tenant landlord eviction rent arrears lease premises possession",
+    "motor": "accident vehicle compensation negligence driver insurer claimant tribunal",
+    "arbitration": "arbitration award arbitrator tribunal seat clause challenge enforcement",
+    "bail": "bail custody accused anticipatory surety remand liberty",
+    "property": "partition ancestral coparcener inheritance succession share title",
+    "labour": "workman retrenchment termination industrial dispute wages employer",
+    "consumer": "consumer deficiency service complaint refund commission defective goods",
+}
+PARAPHRASES = {
+    "cheating": "someone tricked me into handing over money by lying",
+    "cheque": "my cheque bounced because the account had no money",
+    "dowry": "in-laws demanded money after the wedding and abused the wife",
+    "tenancy": "owner wants to throw out the occupant who stopped paying rent",
+    "motor": "a car hit a pedestrian and the family wants damages",
+    "arbitration": "setting aside an award passed by the arbitrator",
+    "bail": "release of the accused from jail pending trial",
+    "property": "dividing family land among brothers after the father died",
+    "labour": "factory fired workers without notice or pay",
+    "consumer": "the company sold a faulty phone and refused to return the money",
+}
+NAMES = ("Mehta Kapoor Sharma Iyer Reddy Singh Das Nair Gupta Khan Bose Rao Joshi Pillai Verma Sinha Chopra Menon "
+         "Patel Banerjee Shah Mishra Bhat Kulkarni").split()
+FILLER = "the court held that in view of the facts and evidence on record the petition is allowed dismissed".split()
+SECTIONS_PER_TOPIC = 8
+
+
+def make_corpus(n, dim, rng):
+    topics = list(TOPICS)
+    centroids = rng.normal(size=(len(topics), dim)).astype(np.float32)
+    sections = {t: [100 + 37 * i + j for j in range(SECTIONS_PER_TOPIC)] for i, t in enumerate(topics)}
+    section_vectors = {s: rng.normal(size=dim).astype(np.float32) for t in topics for s in sections[t]}
+    chunks = []
+    for i in range(n):
+        t = int(rng.integers(len(topics)))
+        topic = topics[t]
+        section = int(rng.choice(sections[topic]))
+        first, second = rng.choice(NAMES, size=2, replace=False)
+        words = list(rng.choice(TOPICS[topic].split(), size=12)) + list(rng.choice(FILLER, size=30))
+        rng.shuffle(words)
+        text = f"{first} v. {second}. Under Section {section}, " + " ".join(words)
+        vector = centroids[t] + 0.8 * rng.normal(size=dim) + 0.1 * section_vectors[section]
+        chunks.append({"id": f"case{i}.pdf_chunk_0", "text": text, "topic": topic, "section": section,
+                       "parties": (first, second), "vector": vector / np.linalg.norm(vector)})
+    return topics, centroids, sections, section_vectors, chunks
+
+
+def make_queries(count, dim, rng, topics, centroids, sections, section_vectors, chunks):
+    by_section, by_parties, by_topic = {}, {}, {}
+    for chunk in chunks:
+        by_section.setdefault(chunk["section"], set()).add(chunk["id"])
+        by_parties.setdefault(chunk["parties"], set()).add(chunk["id"])
+        by_topic.setdefault(chunk["topic"], set()).add(chunk["id"])
+
+    def unit(vector):
+        return vector / np.linalg.norm(vector)
+
+    queries = {"statute": [], "party": [], "topical": []}
+    for _ in range(count):
+        t = int(rng.integers(len(topics)))
+        section = int(rng.choice(sections[topics[t]]))
+        vector = 0.6 * centroids[t] + 0.15 * section_vectors[section] + 1.0 * rng.normal(size=dim)
+        queries["statute"].append((f"Section {section}", unit(vector), by_section[section]))
+
+        chunk = chunks[int(rng.integers(len(chunks)))]
+        first, second = chunk["parties"]
+        vector = 0.3 * centroids[topics.index(chunk["topic"])] + 1.0 * rng.normal(size=dim)
+        queries["party"].append((f"{first} v. {second}", unit(vector), by_parties[chunk["parties"]]))
+
+        vector = centroids[t] + 0.8 * rng.normal(size=dim)
+        queries["topical"].append((PARAPHRASES[topics[t]], unit(vector), by_topic[topics[t]]))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50, help="queries per set")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embed-latency", type=float, default=150, help="simulated embeddings round trip, ms")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    topics, centroids, sections, section_vectors, chunks = make_corpus(args.chunks, args.dim, rng)
+    queries = make_queries(args.queries, args.dim, rng, topics, centroids, sections, section_vectors, chunks)
+
+    workdir = tempfile.mkdtemp(prefix="bench_hybrid_")
+    try:
+        index = LocalIndex(os.path.join(workdir, "vectors"), dimension=args.dim)
+        lexical_index = LexicalIndex(os.path.join(workdir, "lexical.db"))
+        start = time.perf_counter()
+        for offset in range(0, len(chunks), 5000):
+            batch = [{"id": c["id"], "values": c["vector"], "metadata": {"summary_chunk": c["text"]}}
+                     for c in chunks[offset:offset + 5000]]
+            index.upsert(batch)
+            lexical_index.upsert(batch)
+        print(f"{len(chunks)} chunks indexed in {time.perf_counter() - start:.1f}s")
+
+        vectors = {}
+        casesearch.get_index = lambda name: index
+        lexical.get_lexical_index = casesearch.get_lexical_index = lambda name: lexical_index
+
+        def get_embedding(text):
+            time.sleep(args.embed_latency / 1000)
+            return vectors[text]
+
+        casesearch.get_embedding = get_embedding
+
+        print(f"{'queries':>8} {'mode':>8} {'recall@' + str(args.top_k):>9} {'p50 ms':>8} {'p95 ms':>8} {'embed calls':>12}")
+        for name, query_set in queries.items():
+            for mode in ("lexical", "vector", "hybrid"):
+                latencies, recalls = [], []
+                before = casesearch.search_stats()["lexical_only"]
+                for text, vector, relevant in query_set:
+                    vectors[text] = vector.tolist()
+                    start = time.perf_counter()
+                    matches = casesearch.retrieve_matches(text, mode=mode, top_k=args.top_k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found = sum(1 for m in matches if m["id"] in relevant)
+                    recalls.append(found / min(args.top_k, len(relevant)))
+                skipped = casesearch.search_stats()["lexical_only"] - before
+                embed_calls = 0 if mode == "lexical" else len(query_set) - skipped
+                print(f"{name:>8} {mode:>8} {np.mean(recalls):>9.3f} {np.median(latencies):>8.1f}"
+                      f" {np.percentile(latencies, 95):>8.1f} {embed_calls:>12}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
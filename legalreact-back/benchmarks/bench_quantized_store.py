@@ -0,0 +1,119 @@
+"""
+Footprint/latency/recall benchmark for the quantized local vector index.
+
+    python benchmarks/bench_quantized_store.py --size 200000 --rerank 10,50,200
+
+Builds one LocalIndex of synthetic vectors (the clustered Gaussian corpus of
+bench_vectorstore.py), then for each format (float32, int8, pq) builds the
+quantizer and measures, in a fresh process that opens the index and queries
+it:
+
+- disk:      bytes of the files the format keeps (codes plus vectors.f32,
+             which the re-rank reads)
+- resident:  RssFile after the queries, i.e. the pages of the memory-mapped
+             files the queries actually touched
+- p50/p95 query latency and recall@k against exact float32 search, for each
+  --rerank factor (candidates re-ranked = factor x top_k)
+
+Recall on this corpus is a pessimistic bound: its neighbours are separated by
+noise, unlike real chunk embeddings.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import vectorstore  # noqa: E402
+from vectorstore import LocalIndex  # noqa: E402
+from bench_vectorstore import make_corpus  # noqa: E402
+
+
+def rss_file_kb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssFile:"):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(workdir, rerank, top_k):
+    """Runs in a fresh process: opens the index and queries it with each rerank factor."""
+    queries = np.load(os.path.join(workdir, "queries.npy"))
+    truth = [set(row) for row in np.load(os.path.join(workdir, "truth.npy"))]
+    before = rss_file_kb()
+    index = LocalIndex(os.path.join(workdir, "index"))
+    results = []
+    for factor in rerank:
+        vectorstore.RERANK_CANDIDATES = factor
+        latencies, recalls = [], []
+        for query, relevant in zip(queries, truth):
+            start = time.perf_counter()
+            matches = index.query(query, top_k=top_k).matches
+            latencies.append((time.perf_counter() - start) * 1000)
+            recalls.append(len({int(m["id"]) for m in matches} & relevant) / top_k)
+        results.append({"rerank": factor, "p50": float(np.median(latencies)),
+                        "p95": float(np.percentile(latencies, 95)), "recall": float(np.mean(recalls))})
+    return {"resident_mb": (rss_file_kb() - before) / 1024, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--rerank", default="10,50,200")
+    parser.add_argument("--subvectors", type=int, default=96, help="PQ bytes per vector")
+    parser.add_argument("--measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    rerank = [int(r) for r in args.rerank.split(",")]
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, rerank, args.top_k)))
+        return
+
+    rng = np.random.default_rng(42)
+    workdir = tempfile.mkdtemp(prefix="bench_quantized_")
+    try:
+        index = LocalIndex(os.path.join(workdir, "index"), dimension=args.dim)
+        for offset in range(0, args.size, 10000):
+            block = make_corpus(min(10000, args.size - offset), args.dim, np.random.default_rng(offset))
+            index.upsert([(str(offset + i), v) for i, v in enumerate(block)])
+        queries = make_corpus(args.queries, args.dim, rng)
+        truth = [[int(m["id"]) for m in index.query(q, top_k=args.top_k, exact=True).matches] for q in queries]
+        np.save(os.path.join(workdir, "queries.npy"), queries)
+        np.save(os.path.join(workdir, "truth.npy"), np.array(truth))
+        vectors_mb = os.path.getsize(os.path.join(workdir, "index", "vectors.f32")) / 2**20
+
+        print(f"{args.size} x {args.dim} vectors, float32 file {vectors_mb:.0f} MB")
+        print(f"{'format':>8} {'bytes/vec':>9} {'build s':>8} {'codes MB':>9} {'resident MB':>11}"
+              f" {'rerank':>6} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.top_k):>9}")
+        for kind in (None, "int8", "pq"):
+            start = time.perf_counter()
+            code_size = index.build_quantizer(kind, **({"subvectors": args.subvectors} if kind == "pq" else {}))
+            build_s = time.perf_counter() - start
+            codes_path = os.path.join(workdir, "index", "codes.u8")
+            codes_mb = os.path.getsize(codes_path) / 2**20 if os.path.exists(codes_path) else 0.0
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--measure", workdir, "--top-k", str(args.top_k),
+                 "--rerank", args.rerank if kind else "1"],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            measured = json.loads(output.strip().splitlines()[-1])
+            for result in measured["results"]:
+                print(f"{kind or 'float32':>8} {code_size:>9} {build_s:>8.1f} {codes_mb:>9.0f} {measured['resident_mb']:>11.0f}"
+                      f" {result['rerank'] if kind else '-':>6} {result['p50']:>8.2f} {result['p95']:>8.2f} {result['recall']:>9.3f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
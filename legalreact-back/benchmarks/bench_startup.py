@@ -0,0 +1,123 @@
+"""
+Cold-start benchmark: import time and resident memory per worker.
+
+    python benchmarks/bench_startup.py --workers 4
+
+Every measurement runs in a fresh interpreter. Service credentials only need
+to be set (nothing is contacted), so dummy values work:
+
+- lazy:      import main with no subsystems loaded (what each worker pays
+             without --preload)
+- eager:     import main with STARTUP_PRELOAD=all
+- first use: the one-off import cost of each subsystem on its first request
+- preload:   imports everything once, forks --workers children the way gunicorn
+             --preload does, and reports each child's RSS, PSS (RSS with shared
+             pages divided among the processes using them) and private memory
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_MAIN = """
+import os, sys, json, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+from subsystems import startup_stats, subsystem, SUBSYSTEMS
+result = {"import_seconds": elapsed, "rss_bytes": startup_stats()["rss_bytes"], "first_use": {}}
+if os.getenv("BENCH_FIRST_USE"):
+    for name in SUBSYSTEMS:
+        started = time.perf_counter()
+        try:
+            subsystem(name)
+            result["first_use"][name] = time.perf_counter() - started
+        except Exception as e:
+            result["first_use"][name] = str(e)
+print(json.dumps(result))
+"""
+
+FORK_WORKERS = """
+import os, sys, json, time
+import main
+
+
+def memory():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:", "Private_Clean:", "Private_Dirty:"):
+                fields[parts[0][:-1]] = int(parts[1]) * 1024
+    return fields
+
+
+workers = int(sys.argv[1])
+pipes = []
+for _ in range(workers):
+    read_fd, write_fd = os.pipe()
+    if os.fork() == 0:
+        os.close(read_fd)
+        time.sleep(0.5)  # let every child exist so PSS splits the shared pages between all of them
+        os.write(write_fd, json.dumps(memory()).encode())
+        os._exit(0)
+    os.close(write_fd)
+    pipes.append(read_fd)
+master = memory()
+children = [json.loads(os.read(fd, 4096)) for fd in pipes]
+for _ in range(workers):
+    os.wait()
+print(json.dumps({"master": master, "children": children}))
+"""
+
+
+def run(code, *args, **env):
+    result = subprocess.run(
+        [sys.executable, "-c", code, *args],
+        cwd=BACKEND_DIR, env={**os.environ, **env}, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def mb(value):
+    return value / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rss = {}
+    for label, env in (("lazy", {"STARTUP_PRELOAD": "none"}), ("eager", {"STARTUP_PRELOAD": "all"})):
+        runs = [run(IMPORT_MAIN, **env) for _ in range(args.repeat)]
+        rss[label] = median([r["rss_bytes"] for r in runs])
+        print(f"import main ({label}):  {median([r['import_seconds'] for r in runs]) * 1000:8.0f} ms"
+              f"   RSS {median([r['rss_bytes'] for r in runs]) / 1024 / 1024:6.1f} MB")
+
+    first_use = run(IMPORT_MAIN, STARTUP_PRELOAD="none", BENCH_FIRST_USE="1")["first_use"]
+    for name, value in first_use.items():
+        cost = f"{value * 1000:8.0f} ms" if isinstance(value, float) else f"unavailable ({value})"
+        print(f"  first use of {name + ':':15s} {cost}")
+
+    forked = run(FORK_WORKERS, str(args.workers), STARTUP_PRELOAD="all")
+    master, children = forked["master"], forked["children"]
+    print(f"preload master:         RSS {mb(master['Rss']):6.1f} MB   PSS {mb(master['Pss']):6.1f} MB")
+    print(f"per forked worker:      RSS {mb(median([c['Rss'] for c in children])):6.1f} MB"
+          f"   PSS {mb(median([c['Pss'] for c in children])):6.1f} MB"
+          f"   private {mb(median([c['Private_Clean'] + c['Private_Dirty'] for c in children])):6.1f} MB")
+    print(f"total for {args.workers} workers:    {mb(master['Pss'] + sum(c['Pss'] for c in children)):8.1f} MB with --preload"
+          f"   vs {mb(args.workers * rss['eager']):.1f} MB importing per worker")
+
+
+if __name__ == "__main__":
+    main()
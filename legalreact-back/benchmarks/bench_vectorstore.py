@@ -0,0 +1,94 @@
+"""
+Recall/latency benchmark for the local vector index against brute-force search.
+
+    python benchmarks/bench_vectorstore.py --sizes 10000,100000,1000000 --dim 1536
+
+Vectors are synthetic (clustered Gaussian), which is closer to real chunk
+embeddings than uniform noise. Recall is recall@k against exact brute force.
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import vectorstore  # noqa: E402
+from vectorstore import LocalIndex, _normalize  # noqa: E402
+
+
+def make_corpus(n, dim, rng, clusters=256):
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    data = np.empty((n, dim), dtype=np.float32)
+    for start in range(0, n, 65536):
+        stop = min(start + 65536, n)
+        data[start:stop] = centers[labels[start:stop]] + 0.6 * rng.normal(size=(stop - start, dim))
+    return _normalize(data).astype(np.float32)
+
+
+def timed_queries(search, queries):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(search(q))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies), results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--nprobe", default="4,16,64")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    print(f"{'n':>9} {'mode':>14} {'p50 ms':>9} {'p95 ms':>9} {'recall@' + str(args.top_k):>9}")
+    for n in [int(s) for s in args.sizes.split(",")]:
+        workdir = tempfile.mkdtemp(prefix="bench_vs_")
+        try:
+            data = make_corpus(n, args.dim, rng)
+            queries = make_corpus(args.queries, args.dim, rng)
+
+            index = LocalIndex(os.path.join(workdir, "bench"), dimension=args.dim)
+            start = time.perf_counter()
+            for offset in range(0, n, 10000):
+                block = data[offset:offset + 10000]
+                index.upsert([(f"chunk_{offset + i}", v) for i, v in enumerate(block)])
+            load_s = time.perf_counter() - start
+
+            def brute(q):
+                return set(np.argsort(-(data @ q))[:args.top_k])
+
+            lat, truth = timed_queries(brute, queries)
+            print(f"{n:>9} {'brute-force':>14} {np.median(lat):>9.2f} {np.percentile(lat, 95):>9.2f} {1.0:>9.3f}")
+
+            def local(q, **kwargs):
+                matches = index.query(q, top_k=args.top_k, **kwargs).matches
+                return {int(m["id"].rsplit("_", 1)[1]) for m in matches}
+
+            lat, found = timed_queries(lambda q: local(q, exact=True), queries)
+            recall = np.mean([len(a & b) / args.top_k for a, b in zip(truth, found)])
+            print(f"{n:>9} {'local-exact':>14} {np.median(lat):>9.2f} {np.percentile(lat, 95):>9.2f} {recall:>9.3f}")
+
+            start = time.perf_counter()
+            nlist = index.build_ivf()
+            build_s = time.perf_counter() - start
+            vectorstore.IVF_MIN_VECTORS = 0
+            for nprobe in [int(p) for p in args.nprobe.split(",")]:
+                lat, found = timed_queries(lambda q: local(q, nprobe=nprobe), queries)
+                recall = np.mean([len(a & b) / args.top_k for a, b in zip(truth, found)])
+                mode = f"ivf{nlist}/p{nprobe}"
+                print(f"{n:>9} {mode:>14} {np.median(lat):>9.2f} {np.percentile(lat, 95):>9.2f} {recall:>9.3f}")
+            print(f"{n:>9} load {load_s:.1f}s, IVF build {build_s:.1f}s")
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+
+_inherited = []
+
+
+class SQLiteConnection:
+    """
+    A sqlite3 connection that is opened per process.
+
+    A connection must not be used on both sides of a fork, so when gunicorn forks
+    workers from a --preload master each worker opens its own on first use. The
+    parent's handle is kept referenced (never closed) in the child.
+    """
+
+    def __init__(self, path, timeout=30):
+        self.path = path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._connection = None
+
+    def _get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    if self._connection is not None:
+                        _inherited.append(self._connection)
+                    self._connection = sqlite3.connect(self.path, check_same_thread=False, timeout=self.timeout)
+                    self._connection.execute("PRAGMA journal_mode=WAL")
+                    self._pid = os.getpid()
+        return self._connection
+
+    def execute(self, *args):
+        return self._get().execute(*args)
+
+    def executemany(self, *args):
+        return self._get().executemany(*args)
+
+    def commit(self):
+        self._get().commit()
+
+
+class TieredCache:
+    """
+    Two-tier key/value cache: an in-memory LRU in front of a SQLite table.
+
+    Values are bytes. The memory tier is bounded by entry count, the disk tier
+    by total value bytes (least recently used rows are evicted first). Entries
+    set with a ttl expire after that many seconds.
+    Safe to share between threads; separate processes share the disk tier.
+    """
+
+    def __init__(self, name, path=None, max_memory_items=10000, max_disk_bytes=512 * 1024 * 1024):
+        self.name = name
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+        path = path or os.path.join(CACHE_DIR, f"{name}.db")
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = SQLiteConnection(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_used REAL)"
+        )
+        if "expires_at" not in [column[1] for column in self._db.execute("PRAGMA table_info(entries)")]:
+            self._db.execute("ALTER TABLE entries ADD COLUMN expires_at REAL")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        self._db.commit()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _remember(self, key, value, expires_at=None):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Returns the cached bytes for key, or None."""
+        with self._lock:
+            now = time.time()
+            if key in self._memory:
+                value, expires_at = self._memory[key]
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            row = self._db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                self._disk_bytes -= len(row[0])
+                self.stats["expired"] += 1
+                row = None
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self.stats["disk_hits"] += 1
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            now = time.time()
+            expires_at = now + ttl if ttl else None
+            self._remember(key, value, expires_at)
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, last_used, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, expires_at),
+            )
+            self._disk_bytes += len(value) - (old[0] if old else 0)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+            self._db.commit()
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _evict(self):
+        """Drops least recently used rows until the disk tier is back under 90% of its budget."""
+        target = self.max_disk_bytes * 0.9
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._disk_bytes <= target:
+                break
+            doomed.append((key,))
+            self._disk_bytes -= size
+            self._memory.pop(key, None)
+        self._db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+        self.stats["evictions"] += len(doomed)
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+            hits = lookups - self.stats["misses"]
+            return {
+                **self.stats,
+                "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
@@ -1,53 +1,104 @@
 import os
-import openai
-import pinecone
+import asyncio
+from embeddings import get_embedding, aget_embedding
+from vectorstore import get_index, aquery
+from lexical import get_lexical_index, chunk_text_of, is_lexical_query, reciprocal_rank_fusion
+from clients import get_embedding_client
 
-# Azure OpenAI API Credentials
-AZURE_OPENAI_ENDPOINT = os.getenv("EMBEDDING_API_ENDPOINT")
-AZURE_OPENAI_KEY = os.getenv("EMBEDDING_API_KEY")
-AZURE_OPENAI_MODEL = "text-embedding-ada-002"
-AZURE_OPENAI_VERSION = os.getenv("EMBEDDING_API_VERSION")
-
-# Pinecone API Credentials
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
+# Vector index (Pinecone or local, see VECTOR_STORE_BACKEND)
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME")
 
-# Initialize OpenAI
-openai_client = openai.AzureOpenAI(
-    api_key=AZURE_OPENAI_KEY,
-    api_version=AZURE_OPENAI_VERSION,
-    azure_endpoint=AZURE_OPENAI_ENDPOINT
-)
+# "hybrid" (BM25 + vectors, fused), "vector" or "lexical"
+CASE_SEARCH_MODE = os.getenv("CASE_SEARCH_MODE", "hybrid")
+CASE_SEARCH_TOP_K = 5
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # matches taken from each ranking before fusion
+
+_stats = {"searches": 0, "lexical_only": 0, "hybrid": 0, "vector_only": 0}
+
+
+def _fuse(lexical_matches, vector_results, top_k):
+    """Fuses the keyword matches with the vector results (None when the embedding failed)."""
+    if vector_results is None:
+        return lexical_matches[:top_k]
+    vector_matches = vector_results.get("matches", []) if vector_results else []
+    if not lexical_matches:
+        _stats["vector_only"] += 1
+        return vector_matches[:top_k]
+    _stats["hybrid"] += 1
+    return reciprocal_rank_fusion([vector_matches, lexical_matches])[:top_k]
 
-# Initialize Pinecone
-if not PINECONE_API_KEY:
-    raise ValueError("PINECONE_API_KEY is not set.")
 
-pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
-index2 = pc.Index(PINECONE_INDEX_NAME)
+def _lexical_answer(query, mode, lexical_matches):
+    """True when the keyword matches alone answer the query, so the embedding call can be skipped."""
+    if mode == "lexical" or (lexical_matches and is_lexical_query(query)):
+        _stats["lexical_only"] += 1
+        return True
+    return False
+
+
+def retrieve_matches(query, mode=CASE_SEARCH_MODE, top_k=CASE_SEARCH_TOP_K):
+    """
+    Returns the best chunk matches for query, best first. Hybrid mode ranks by
+    BM25 and by embedding similarity and fuses the two rankings; queries that
+    are just a statute reference, citation or party name are answered from
+    BM25 alone, without an embeddings call.
+    """
+    _stats["searches"] += 1
+    lexical_matches = []
+    if mode != "vector":
+        lexical_matches = get_lexical_index(PINECONE_INDEX_NAME).search(query, top_k=HYBRID_CANDIDATES)
+        if _lexical_answer(query, mode, lexical_matches):
+            return lexical_matches[:top_k]
+
+    # Generate embedding from OpenAI (served from the embedding cache when seen before)
+    query_embedding = get_embedding(query)
+    if not query_embedding:
+        print("❌ No embeddings found in OpenAI response!")
+        return _fuse(lexical_matches, None, top_k)
+
+    candidates = HYBRID_CANDIDATES if lexical_matches else top_k
+    search_results = get_index(PINECONE_INDEX_NAME).query(vector=query_embedding, top_k=candidates, include_metadata=True)
+    return _fuse(lexical_matches, search_results, top_k)
+
+
+async def aretrieve_matches(query, mode=CASE_SEARCH_MODE, top_k=CASE_SEARCH_TOP_K):
+    """retrieve_matches for the async serving mode."""
+    _stats["searches"] += 1
+    lexical_matches = []
+    if mode != "vector":
+        lexical_matches = await asyncio.to_thread(get_lexical_index(PINECONE_INDEX_NAME).search, query, HYBRID_CANDIDATES)
+        if _lexical_answer(query, mode, lexical_matches):
+            return lexical_matches[:top_k]
+
+    query_embedding = await aget_embedding(query)
+    if not query_embedding:
+        print("❌ No embeddings found in OpenAI response!")
+        return _fuse(lexical_matches, None, top_k)
+
+    candidates = HYBRID_CANDIDATES if lexical_matches else top_k
+    search_results = await aquery(get_index(PINECONE_INDEX_NAME), vector=query_embedding, top_k=candidates, include_metadata=True)
+    return _fuse(lexical_matches, search_results, top_k)
+
 
 def search_cases(query):
     """
-    Searches Pinecone for similar case documents based on a query.
+    Searches the case index (keywords and vectors, see retrieve_matches) for similar case documents.
     Groups chunks together under their original document name.
     """
-    # Generate embedding from OpenAI
-    response = openai_client.embeddings.create(
-        model=AZURE_OPENAI_MODEL,
-        input=query
-    )
-
-    print("Embedding Response:", response)  # 🔍 Debugging
-
-    # Extract the embedding
-    if hasattr(response, "data") and len(response.data) > 0:
-        query_embedding = response.data[0].embedding
-    else:
-        print("❌ No embeddings found in OpenAI response!")
-        return []
-    
-    search_results = index2.query(vector=query_embedding, top_k=5, include_metadata=True)
+    return group_matches({"matches": retrieve_matches(query)})
+
 
+async def asearch_cases(query):
+    """search_cases for the async serving mode."""
+    return group_matches({"matches": await aretrieve_matches(query)})
+
+
+def search_stats():
+    return dict(_stats)
+
+
+def group_matches(search_results):
+    """Groups the matched chunks under their original document name."""
     if not search_results or "matches" not in search_results:
         print("⚠️ No search results returned from Pinecone!")
         return []
@@ -69,7 +120,7 @@ def search_cases(query):
 
         # Extract document name by removing "_chunk_X" suffix
         doc_name = doc_chunk_name.rsplit("_chunk_", 1)[0]
-        chunk_summary = metadata.get("chunk", "No summary available")
+        chunk_summary = chunk_text_of(metadata) or "No summary available"
 
         if doc_name not in grouped_results:
             grouped_results[doc_name] = []  # Initialize list for storing chunks
@@ -84,3 +135,10 @@ def search_cases(query):
 
     print("Final Grouped Search Results:", final_results)  # 🔍 Debugging
     return final_results
+
+
+def warm_up():
+    """Opens the index and the embedding client before the first search."""
+    get_embedding_client()
+    get_index(PINECONE_INDEX_NAME)
+    get_lexical_index(PINECONE_INDEX_NAME)
@@ -0,0 +1,208 @@
+"""
+Structure-aware chunking for ingestion.
+
+chunk_pages consumes pages one at a time (any iterable of page texts, e.g.
+document_pages over a Document Intelligence result), so a 1,000-page record
+is never joined into one string: only the current page and the chunk being
+built are held. Chunks are packed from whole paragraphs; a paragraph is split
+into sentences, and a sentence into words, only when it does not fit. A
+section heading always starts a new chunk. Sizes are counted with the
+embedding model's tokenizer (tokens.py).
+
+Consecutive chunks of a section share up to overlap_tokens of whole
+sentences. Chunk ids are derived from the chunk text
+({document}_chunk_{hash}), so they are the same on every run and an edit
+only changes the ids of the chunks it touches.
+"""
+import os
+import re
+import hashlib
+from tokens import estimate_tokens, EMBEDDING_TOKEN_ENCODING
+
+CHUNK_TOKENS = int(os.getenv("INGEST_CHUNK_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("INGEST_CHUNK_OVERLAP_TOKENS", "64"))
+# A chunk is closed at a paragraph boundary, rather than topped up with part of the next paragraph, once it is this full
+MIN_FILL = float(os.getenv("INGEST_CHUNK_MIN_FILL", "0.5"))
+
+# Running headers, footers and page numbers repeat on every page and carry no content
+SKIPPED_ROLES = frozenset(("pageHeader", "pageFooter", "pageNumber"))
+
+HEADING = re.compile(
+    r"^(?:(?:PART|CHAPTER|SECTION|ARTICLE|SCHEDULE|ORDER|JUDGMENT|JUDGEMENT|HEADNOTE|FACTS|ISSUES?|ANALYSIS|CONCLUSION)\b"
+    r"|(?:Part|Chapter|Section|Article|Schedule)\s+[0-9IVXLC]+\b"
+    r"|[IVXLC]+\.\s)"
+)
+
+# Words whose trailing period does not end a sentence: "s. 420", "No. 5", "M/s. Gupta", "Ltd. v. State"
+ABBREVIATIONS = frozenset("""
+a.k.a anr art arts cl cls co corp cr crl dr e.g etc hon'ble i.e inc jj ltd m/s mr mrs ms no nos ors para paras pp
+rs sec secs sh shri smt sr st supp u/s v viz vol vs w.e.f
+""".split())
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+(?=[\"'(\[]?[A-Z0-9])")
+ENUMERATOR = re.compile(r"\(?(?:\d{1,3}|[ivxlc]{1,5}|[a-z])\)?")
+
+
+def document_pages(result):
+    """
+    Yields the text of each page of a Document Intelligence result, paragraphs
+    separated by blank lines, without running headers, footers and page numbers.
+    Results without paragraphs yield each page's lines.
+    """
+    paragraphs = getattr(result, "paragraphs", None)
+    if not paragraphs:
+        for page in result.pages:
+            yield "\n".join(line.content for line in page.lines or [])
+        return
+
+    page_number, texts = 1, []
+    for paragraph in paragraphs:
+        if paragraph.role in SKIPPED_ROLES:
+            continue
+        number = paragraph.bounding_regions[0].page_number if paragraph.bounding_regions else page_number
+        while number > page_number:
+            yield "\n\n".join(texts)
+            page_number, texts = page_number + 1, []
+        texts.append(paragraph.content)
+    yield "\n\n".join(texts)
+
+
+def is_heading(paragraph):
+    """Short lines such as "JUDGMENT", "PART II", "Section 3", "IV. ANALYSIS" or any short all-caps line."""
+    words = paragraph.split()
+    if not words or len(words) > 12 or paragraph.rstrip().endswith((",", ";", ":")):
+        return False
+    letters = [c for c in paragraph if c.isalpha()]
+    return bool(HEADING.match(paragraph)) or (len(letters) >= 3 and sum(c.isupper() for c in letters) >= 0.8 * len(letters))
+
+
+def split_sentences(text):
+    """Splits at ., ! or ? followed by a capital or digit, except after abbreviations and initials."""
+    sentences, start = [], 0
+    for match in SENTENCE_END.finditer(text):
+        if text[match.start()] == ".":
+            words = text[start:match.start()].split()
+            word = words[-1].lstrip("(\"'[").lower() if words else ""
+            if word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()):
+                continue
+            if len(words) == 1 and ENUMERATOR.fullmatch(word):  # "2. The appellant ..." starts a numbered paragraph
+                continue
+        sentences.append(text[start:match.end()].strip())
+        start = match.end()
+    if text[start:].strip():
+        sentences.append(text[start:].strip())
+    return sentences
+
+
+def _count(text):
+    return estimate_tokens(text, EMBEDDING_TOKEN_ENCODING)
+
+
+def _split_words(sentence, max_tokens):
+    """Cuts a sentence longer than max_tokens into runs of whole words."""
+    piece, size = [], 0
+    for word in sentence.split():
+        tokens = _count(word)
+        if piece and size + tokens > max_tokens:
+            yield " ".join(piece), size
+            piece, size = [], 0
+        piece.append(word)
+        size += tokens
+    if piece:
+        yield " ".join(piece), size
+
+
+def chunk_id(document, text, seen):
+    """{document}_chunk_{hash of text}; a repeat of the same text within the document gets a -n suffix."""
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+    seen[digest] = seen.get(digest, 0) + 1
+    return f"{document}_chunk_{digest}" + (f"-{seen[digest] - 1}" if seen[digest] > 1 else "")
+
+
+def chunk_pages(pages, document, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Yields chunk dicts {"id", "text", "index", "tokens", "pages": [first, last], "section"}
+    from an iterable of page texts (blank lines separate paragraphs).
+    """
+    overlap_tokens = min(overlap_tokens, max_tokens // 2)
+    units = []      # (text, tokens, page, starts_paragraph) of the chunk being built
+    carried = 0     # leading units repeated from the previous chunk
+    section = ""
+    body = False    # whether the chunk has any text besides headings
+    seen = {}
+    index = 0
+
+    def size():
+        return sum(unit[1] for unit in units)
+
+    def emit(carry):
+        nonlocal units, carried, index
+        if len(units) <= carried:
+            return None
+        text = "".join(("\n\n" if starts and i else " " if i else "") + unit for i, (unit, _, _, starts) in enumerate(units))
+        chunk = {
+            "id": chunk_id(document, text, seen),
+            "text": text,
+            "index": index,
+            "tokens": size(),
+            "pages": [units[0][2], units[-1][2]],
+            "section": section,
+        }
+        index += 1
+        kept, total = [], 0
+        for unit in reversed(units if carry else []):
+            if total + unit[1] > overlap_tokens:
+                break
+            kept.insert(0, unit)
+            total += unit[1]
+        units, carried = kept, len(kept)
+        return chunk
+
+    def add(unit):
+        """Appends a unit, first closing the chunk if it would overflow; returns the closed chunk, if any."""
+        nonlocal carried
+        chunk = None
+        if units and size() + unit[1] > max_tokens:
+            chunk = emit(carry=True)
+            while units and size() + unit[1] > max_tokens:
+                units.pop(0)
+                carried -= 1
+        units.append(unit)
+        return chunk
+
+    for page_number, page in enumerate(pages, start=1):
+        for paragraph in re.split(r"\n\s*\n", page):
+            paragraph = " ".join(paragraph.split())
+            if not paragraph:
+                continue
+            if is_heading(paragraph):
+                # Consecutive headings ("PART II", "CHAPTER 3") stay together at the top of one chunk
+                if body:
+                    chunk = emit(carry=False)
+                    if chunk:
+                        yield chunk
+                    units, carried, body = [], 0, False
+                section = paragraph
+                chunk = add((paragraph, _count(paragraph), page_number, True))
+                if chunk:
+                    yield chunk
+                continue
+
+            pieces = []
+            for sentence in split_sentences(paragraph):
+                tokens = _count(sentence)
+                pieces.extend(_split_words(sentence, max_tokens) if tokens > max_tokens else [(sentence, tokens)])
+            total = sum(tokens for _, tokens in pieces)
+            if units and size() + total > max_tokens and size() - sum(u[1] for u in units[:carried]) >= MIN_FILL * max_tokens:
+                chunk = emit(carry=True)
+                if chunk:
+                    yield chunk
+            for i, (text, tokens) in enumerate(pieces):
+                chunk = add((text, tokens, page_number, i == 0))
+                if chunk:
+                    yield chunk
+            body = True
+
+    chunk = emit(carry=False)
+    if chunk:
+        yield chunk
+
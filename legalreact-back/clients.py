@@ -0,0 +1,408 @@
+"""
+Shared service clients.
+
+Every module gets its Azure OpenAI, Blob Storage, Document Intelligence,
+Translator and Pinecone clients from here instead of building its own. Each
+service has one keep-alive HTTP connection pool, sized by
+CLIENT_POOL_<SERVICE> (openai, blob, docintel, translator, pinecone), and
+clients are created on first use and then reused by every thread. A forked
+process (a gunicorn worker under --preload) starts with an empty registry, so
+sockets are never shared between workers.
+
+The get_async_* clients (httpx.AsyncClient, and aiohttp for the Azure SDKs)
+are for the async serving mode (asgi.py). They belong to the event loop that
+first asked for them, so the registry keeps one set per loop, keyed by the
+loop object itself. aclose_loop_clients() closes a loop's set (asgi.py calls
+it when serving stops); sets left by loops that closed without it are dropped
+on the next lookup. They count against the same per-service pools as the sync
+clients.
+
+pool_stats() reports per pool: size, requests sent, requests in flight, the
+peak, and how often a request found every pooled connection busy ("saturated";
+those requests open a connection that is not kept).
+"""
+import os
+import time
+import asyncio
+import inspect
+import logging
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+POOL_DEFAULTS = {"openai": 32, "blob": 16, "docintel": 8, "translator": 8, "pinecone": 16}
+KEEPALIVE_SECONDS = float(os.getenv("CLIENT_KEEPALIVE_SECONDS", "90"))
+
+_lock = threading.Lock()
+_clients = {}
+_loop_clients = {}  # event loop -> {key: client}
+_pools = {}
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+    _clients.clear()
+    _loop_clients.clear()
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def pool_size(service):
+    return int(os.getenv(f"CLIENT_POOL_{service.upper()}", str(POOL_DEFAULTS[service])))
+
+
+class PoolStats:
+    def __init__(self, service, size):
+        self.service = service
+        self.size = size
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.saturated = 0
+        self.busy_seconds = 0.0
+
+    def begin(self):
+        with self._lock:
+            self.requests += 1
+            if self.in_flight >= self.size:
+                self.saturated += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return time.perf_counter()
+
+    def end(self, started):
+        with self._lock:
+            self.in_flight -= 1
+            self.busy_seconds += time.perf_counter() - started
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "pool_size": self.size,
+                "requests": self.requests,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "saturated": self.saturated,
+                "busy_seconds": round(self.busy_seconds, 3),
+            }
+
+
+def _pool(service):
+    with _lock:
+        if service not in _pools:
+            _pools[service] = PoolStats(service, pool_size(service))
+        return _pools[service]
+
+
+class _CountingAdapter(HTTPAdapter):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(pool_connections=4, pool_maxsize=stats.size, **kwargs)
+
+    def send(self, request, **kwargs):
+        started = self.stats.begin()
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            self.stats.end(started)
+
+
+class _CountingTransport(httpx.HTTPTransport):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def handle_request(self, request):
+        started = self.stats.begin()
+        try:
+            return super().handle_request(request)
+        finally:
+            self.stats.end(started)
+
+
+class _CountingAsyncTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    async def handle_async_request(self, request):
+        started = self.stats.begin()
+        try:
+            return await super().handle_async_request(request)
+        finally:
+            self.stats.end(started)
+
+
+def _limits(service):
+    size = _pool(service).size
+    return httpx.Limits(max_connections=size, max_keepalive_connections=size, keepalive_expiry=KEEPALIVE_SECONDS)
+
+
+def http_session(service, retries=None):
+    """A requests.Session whose connection pool is the service's; `retries` goes to the adapter."""
+    session = requests.Session()
+    adapter = _CountingAdapter(_pool(service), max_retries=retries if retries is not None else 0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _get(key, factory):
+    with _lock:
+        client = _clients.get(key)
+    if client is not None:
+        return client
+    client = factory()
+    with _lock:
+        return _clients.setdefault(key, client)
+
+
+def _loop_registry():
+    """The clients of the running loop; drops those of loops closed without aclose_loop_clients()."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        for closed in [other for other in _loop_clients if other.is_closed()]:
+            del _loop_clients[closed]
+        return _loop_clients.setdefault(loop, {})
+
+
+def _get_async(key, factory):
+    """_get for clients bound to the running loop."""
+    clients = _loop_registry()
+    with _lock:
+        client = clients.get(key)
+    if client is not None:
+        return client
+    client = factory()
+    with _lock:
+        return clients.setdefault(key, client)
+
+
+async def aclose_loop_clients():
+    """Closes every client built for the running loop (and the aiohttp sessions behind them)."""
+    with _lock:
+        clients = _loop_clients.pop(asyncio.get_running_loop(), {})
+    for key, client in reversed(list(clients.items())):
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        if close is None:
+            continue
+        try:
+            result = close()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logging.warning(f"Closing {key[0]} client failed: {e}")
+
+
+def _azure_transport(service):
+    from azure.core.pipeline.transport import RequestsTransport
+    # The azure pipeline does its own retries, so the adapter must not
+    session = http_session(service, retries=Retry(total=False, redirect=False, raise_on_status=False))
+    return RequestsTransport(session=session, session_owner=False)
+
+
+def _azure_async_transport(service):
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+
+    stats = _pool(service)
+
+    class CountingAioHttpTransport(AioHttpTransport):
+        async def send(self, request, **kwargs):
+            started = stats.begin()
+            try:
+                return await super().send(request, **kwargs)
+            finally:
+                stats.end(started)
+
+    connector = aiohttp.TCPConnector(limit=stats.size, keepalive_timeout=KEEPALIVE_SECONDS)
+    session = aiohttp.ClientSession(connector=connector)
+    # The transport does not own the session, so aclose_loop_clients() closes it
+    clients = _loop_registry()
+    with _lock:
+        clients[("aiohttp-session", id(session))] = session
+    return CountingAioHttpTransport(session=session, session_owner=False)
+
+
+def openai_http_client():
+    """The httpx client behind every Azure OpenAI client (chat and embeddings)."""
+    def build():
+        return httpx.Client(transport=_CountingTransport(_pool("openai"), limits=_limits("openai")), timeout=httpx.Timeout(120.0, connect=10.0))
+    return _get(("openai-http",), build)
+
+
+def openai_async_http_client():
+    """The httpx.AsyncClient behind the async Azure OpenAI clients on the running loop."""
+    def build():
+        return httpx.AsyncClient(transport=_CountingAsyncTransport(_pool("openai"), limits=_limits("openai")), timeout=httpx.Timeout(120.0, connect=10.0))
+    return _get_async(("openai-async-http",), build)
+
+
+def get_chat_llm(deployment="gpt-4o-mini", temperature=0.2, api_version="2024-10-21"):
+    """The shared AzureChatOpenAI for a deployment/temperature."""
+    def build():
+        from langchain_openai import AzureChatOpenAI
+        return AzureChatOpenAI(
+            azure_deployment=deployment,
+            azure_endpoint=os.getenv("OPENAI_GPT_ENDPOINT"),
+            api_key=os.getenv("OPENAI_GPT_API_KEY"),
+            api_version=api_version,
+            temperature=temperature,
+            http_client=openai_http_client(),
+        )
+    return _get(("chat", deployment, temperature, api_version), build)
+
+
+def get_async_chat_llm(deployment="gpt-4o-mini", temperature=0.2, api_version="2024-10-21"):
+    """Same as get_chat_llm, for ainvoke/astream on the running loop."""
+    def build():
+        from langchain_openai import AzureChatOpenAI
+        return AzureChatOpenAI(
+            azure_deployment=deployment,
+            azure_endpoint=os.getenv("OPENAI_GPT_ENDPOINT"),
+            api_key=os.getenv("OPENAI_GPT_API_KEY"),
+            api_version=api_version,
+            temperature=temperature,
+            http_client=openai_http_client(),
+            http_async_client=openai_async_http_client(),
+        )
+    return _get_async(("async-chat", deployment, temperature, api_version), build)
+
+
+def get_embedding_client():
+    def build():
+        import openai
+        return openai.AzureOpenAI(
+            api_key=os.getenv("EMBEDDING_API_KEY"),
+            api_version=os.getenv("EMBEDDING_API_VERSION"),
+            azure_endpoint=os.getenv("EMBEDDING_API_ENDPOINT"),
+            http_client=openai_http_client(),
+        )
+    return _get(("embeddings",), build)
+
+
+def get_async_embedding_client():
+    def build():
+        import openai
+        return openai.AsyncAzureOpenAI(
+            api_key=os.getenv("EMBEDDING_API_KEY"),
+            api_version=os.getenv("EMBEDDING_API_VERSION"),
+            azure_endpoint=os.getenv("EMBEDDING_API_ENDPOINT"),
+            http_client=openai_async_http_client(),
+        )
+    return _get_async(("async-embeddings",), build)
+
+
+def get_blob_service_client(connection_string=None, account_name=None, account_key=None):
+    """The shared BlobServiceClient for a connection string, or for an account name and key."""
+    def build():
+        from azure.storage.blob import BlobServiceClient
+        transport = _azure_transport("blob")
+        if connection_string:
+            return BlobServiceClient.from_connection_string(connection_string, transport=transport)
+        return BlobServiceClient(
+            account_url=f"https://{account_name}.blob.core.windows.net", credential=account_key, transport=transport
+        )
+    return _get(("blob", connection_string, account_name, account_key), build)
+
+
+def get_async_blob_service_client(connection_string=None, account_name=None, account_key=None):
+    def build():
+        from azure.storage.blob.aio import BlobServiceClient
+        transport = _azure_async_transport("blob")
+        if connection_string:
+            return BlobServiceClient.from_connection_string(connection_string, transport=transport)
+        return BlobServiceClient(
+            account_url=f"https://{account_name}.blob.core.windows.net", credential=account_key, transport=transport
+        )
+    return _get_async(("async-blob", connection_string, account_name, account_key), build)
+
+
+def get_document_analysis_client():
+    def build():
+        from azure.ai.formrecognizer import DocumentAnalysisClient
+        from azure.core.credentials import AzureKeyCredential
+        return DocumentAnalysisClient(
+            endpoint=os.getenv("AZURE_DOC_INTELLIGENCE_ENDPOINT"),
+            credential=AzureKeyCredential(os.getenv("AZURE_DOC_INTELLIGENCE_KEY")),
+            transport=_azure_transport("docintel"),
+        )
+    return _get(("docintel",), build)
+
+
+def get_async_document_analysis_client():
+    def build():
+        from azure.ai.formrecognizer.aio import DocumentAnalysisClient
+        from azure.core.credentials import AzureKeyCredential
+        return DocumentAnalysisClient(
+            endpoint=os.getenv("AZURE_DOC_INTELLIGENCE_ENDPOINT"),
+            credential=AzureKeyCredential(os.getenv("AZURE_DOC_INTELLIGENCE_KEY")),
+            transport=_azure_async_transport("docintel"),
+        )
+    return _get_async(("async-docintel",), build)
+
+
+def get_document_intelligence_client():
+    """The azure-ai-documentintelligence client used by ingestion; counted under the docintel pool."""
+    def build():
+        from azure.ai.documentintelligence import DocumentIntelligenceClient
+        from azure.core.credentials import AzureKeyCredential
+        return DocumentIntelligenceClient(
+            os.getenv("AZURE_DOC_INTELLIGENCE_ENDPOINT"),
+            AzureKeyCredential(os.getenv("AZURE_DOC_INTELLIGENCE_KEY")),
+            transport=_azure_transport("docintel"),
+        )
+    return _get(("docintel-ingest",), build)
+
+
+def _translator_headers():
+    return {
+        "Ocp-Apim-Subscription-Key": os.getenv("AZURE_TRANSLATOR_KEY") or "",
+        "Ocp-Apim-Subscription-Region": os.getenv("AZURE_TRANSLATOR_REGION") or "",
+        "Content-Type": "application/json",
+    }
+
+
+def get_translator_session():
+    """Keep-alive session for the Translator REST API, with the subscription headers set."""
+    def build():
+        session = http_session("translator")
+        session.headers.update(_translator_headers())
+        return session
+    return _get(("translator",), build)
+
+
+def get_async_translator_client():
+    """httpx.AsyncClient for the Translator REST API on the running loop."""
+    def build():
+        transport = _CountingAsyncTransport(_pool("translator"), limits=_limits("translator"))
+        return httpx.AsyncClient(transport=transport, headers=_translator_headers(), timeout=60)
+    return _get_async(("async-translator",), build)
+
+
+def get_pinecone_client():
+    def build():
+        import pinecone
+        api_key = os.getenv("PINECONE_API_KEY")
+        if not api_key:
+            raise ValueError("PINECONE_API_KEY is not set.")
+        _pool("pinecone")
+        return pinecone.Pinecone(api_key=api_key, connection_pool_maxsize=pool_size("pinecone"))
+    return _get(("pinecone",), build)
+
+
+def pool_stats():
+    with _lock:
+        pools = dict(_pools)
+        created = sorted({key[0] for registry in [_clients, *_loop_clients.values()] for key in registry} - {"aiohttp-session"})
+    stats = {service: pool.snapshot() for service, pool in pools.items()}
+    # Pinecone manages its own urllib3 pool; only its size is known here
+    if "pinecone" in stats:
+        stats["pinecone"] = {"pool_size": stats["pinecone"]["pool_size"]}
+    return {"pools": stats, "clients": created}
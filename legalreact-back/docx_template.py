@@ -0,0 +1,316 @@
+"""
+Compiled .docx templates.
+
+A template is compiled once: every paragraph in the body, tables and
+headers/footers is scanned for tags, and the character span of each tag
+(which may cross runs) is recorded. Rendering a clone of the document then
+only visits those recorded paragraphs, edits run text in place (so run
+formatting survives) and expands loops.
+
+Supported tags:
+    { NAME }              value from the context; lists are joined with ", "
+    { item.field }        field of the current loop item (a plain string item
+                          stands in for its own .name)
+    {% for item in LIST %} ... {% endfor %}
+                          within one paragraph the body is repeated inline;
+                          across sibling paragraphs they are repeated per item.
+                          A for without an endfor in the same paragraph loops
+                          over the rest of the run holding the tag.
+"""
+import re
+import copy
+from docx.oxml.ns import qn
+from docx.text.run import Run
+
+TAG_PATTERN = re.compile(r"\{%\s*for\s+(\w+)\s+in\s+(\w+)\s*%\}|\{%\s*endfor\s*%\}|\{\s*([\w.]+)\s*\}")
+HEADER_FOOTER_ATTRS = ["header", "first_page_header", "even_page_header", "footer", "first_page_footer", "even_page_footer"]
+
+
+class CompiledTemplate:
+    """Tag locations for one document: stories[i] is the list of blocks of the i-th story."""
+
+    def __init__(self, stories):
+        self.stories = stories
+
+    @property
+    def placeholders(self):
+        names = set()
+        for blocks in self.stories:
+            for block in blocks:
+                if block["kind"] == "loop":
+                    names.add(block["list"])
+                for para in block["paragraphs"]:
+                    for token in para["tokens"]:
+                        if token["kind"] == "var" and "." not in token["name"]:
+                            names.add(token["name"])
+                        elif token["kind"] == "inline_loop":
+                            names.add(token["list"])
+        return names
+
+
+def _stories(document):
+    """Yields the body and every header/footer that has its own definition, in a stable order."""
+    yield document.element.body
+    for section in document.sections:
+        for attr in HEADER_FOOTER_ATTRS:
+            part = getattr(section, attr)
+            if not part.is_linked_to_previous:
+                yield part._element
+
+
+def _runs(paragraph_element):
+    return [Run(r, None) for r in paragraph_element.findall(qn("w:r"))]
+
+
+def _paragraph_text(paragraph_element):
+    return "".join(run.text for run in _runs(paragraph_element))
+
+
+def _scan(text):
+    tokens = []
+    for match in TAG_PATTERN.finditer(text):
+        loop_var, loop_list, name = match.groups()
+        span = {"start": match.start(), "end": match.end()}
+        if loop_var:
+            tokens.append({"kind": "for", "var": loop_var, "list": loop_list, **span})
+        elif name:
+            tokens.append({"kind": "var", "name": name, **span})
+        else:
+            tokens.append({"kind": "endfor", **span})
+    return tokens
+
+
+def _fold_inline_loops(para):
+    """Turns the for/endfor tags left in a paragraph into inline_loop tokens (stray endfors become plain tags)."""
+    tokens, text, folded, i = para["tokens"], para["text"], [], 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token["kind"] == "endfor":
+            folded.append({"kind": "tag", "start": token["start"], "end": token["end"]})
+            i += 1
+            continue
+        if token["kind"] != "for":
+            folded.append(token)
+            i += 1
+            continue
+
+        close = next((j for j in range(i + 1, len(tokens)) if tokens[j]["kind"] in ("for", "endfor")), None)
+        if close is not None and tokens[close]["kind"] == "endfor":
+            body_end, end, i = tokens[close]["start"], tokens[close]["end"], close + 1
+        else:
+            # No endfor here: loop over the rest of the run that holds the tag
+            body_end = end = next(run_end for run_end in para["run_ends"] if run_end >= token["end"])
+            i += 1
+            while i < len(tokens) and tokens[i]["start"] < end:
+                i += 1
+        folded.append({"kind": "inline_loop", "var": token["var"], "list": token["list"],
+                       "body": text[token["end"]:body_end], "start": token["start"], "end": end})
+    return dict(para, tokens=folded)
+
+
+def _finish(para):
+    """Final per-paragraph form: token spans, run boundaries and whether it only held block tags."""
+    para = _fold_inline_loops(para)
+    content, last = [], 0
+    for token in sorted(para["tokens"], key=lambda t: t["start"]):
+        content.append(para["text"][last:token["start"]])
+        last = token["end"]
+    content.append(para["text"][last:])
+    only_tags = (
+        bool(para["tokens"])
+        and all(token["kind"] == "tag" for token in para["tokens"])
+        and not "".join(content).strip()
+    )
+    return {"index": para["index"], "tokens": para["tokens"], "run_ends": para["run_ends"], "drop_if_blank": only_tags}
+
+
+def _scan_story(story):
+    paragraphs = list(story.iter(qn("w:p")))
+    position = {p: index for index, p in enumerate(paragraphs)}
+    scanned = {}
+    for index, p in enumerate(paragraphs):
+        texts = [run.text for run in _runs(p)]
+        text = "".join(texts)
+        if "{" not in text:
+            continue
+        tokens = _scan(text)
+        if tokens:
+            run_ends, offset = [], 0
+            for run_text in texts:
+                offset += len(run_text)
+                run_ends.append(offset)
+            scanned[index] = {"index": index, "element": p, "text": text, "tokens": tokens, "run_ends": run_ends}
+    return paragraphs, position, scanned
+
+
+def _block_loop_end(para, position, scanned):
+    """
+    If the paragraph ends with an open for whose endfor sits in a later sibling
+    paragraph, returns the list of sibling paragraph indexes the loop covers.
+    """
+    opens = [t for t in para["tokens"] if t["kind"] == "for"]
+    if not opens or any(t["kind"] == "endfor" and t["start"] > opens[-1]["start"] for t in para["tokens"]):
+        return None
+    covered = [para["index"]]
+    sibling = para["element"].getnext()
+    while sibling is not None and sibling.tag == qn("w:p"):
+        index = position[sibling]
+        covered.append(index)
+        kinds = [t["kind"] for t in scanned[index]["tokens"]] if index in scanned else []
+        if "for" in kinds:
+            return None
+        if "endfor" in kinds:
+            return covered
+        sibling = sibling.getnext()
+    return None
+
+
+def compile_template(document):
+    """Scans the document once and returns a CompiledTemplate."""
+    stories = []
+    for story in _stories(document):
+        paragraphs, position, scanned = _scan_story(story)
+        blocks, consumed = [], set()
+        for index in sorted(scanned):
+            if index in consumed:
+                continue
+            para = scanned[index]
+            covered = _block_loop_end(para, position, scanned)
+            if covered is None:
+                blocks.append({"kind": "paragraph", "paragraphs": [_finish(para)]})
+                continue
+
+            # The opening for and the first endfor become plain tags; the paragraphs are repeated per item
+            start_token = [t for t in para["tokens"] if t["kind"] == "for"][-1]
+            members = []
+            for member_index in covered:
+                member = scanned.get(member_index)
+                if member is None:
+                    members.append({"index": member_index, "tokens": [], "run_ends": [], "drop_if_blank": False})
+                    continue
+                tokens = list(member["tokens"])
+                if member_index == covered[0]:
+                    tokens = [dict(start_token, kind="tag") if t is start_token else t for t in tokens]
+                if member_index == covered[-1]:
+                    end_token = next(t for t in tokens if t["kind"] == "endfor")
+                    tokens = [dict(end_token, kind="tag") if t is end_token else t for t in tokens]
+                members.append(_finish(dict(member, tokens=tokens)))
+            consumed.update(covered)
+            blocks.append({"kind": "loop", "var": start_token["var"], "list": start_token["list"], "paragraphs": members})
+        stories.append(blocks)
+    return CompiledTemplate(stories)
+
+
+def _lookup(name, context):
+    """Resolves NAME or item.field; returns None for unknown names so the tag is left untouched."""
+    head, _, field = name.partition(".")
+    if head not in context:
+        return None
+    value = context[head]
+    if field:
+        if isinstance(value, dict):
+            value = value.get(field, "")
+        elif field != "name" or not isinstance(value, str):
+            value = getattr(value, field, "")
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(_format_item(item) for item in value)
+    return str(value)
+
+
+def _format_item(item):
+    if isinstance(item, dict):
+        return str(item.get("name", ", ".join(str(v) for v in item.values())))
+    return str(item)
+
+
+def _loop_items(value):
+    if value is None:
+        return []
+    return value if isinstance(value, (list, tuple)) else [value]
+
+
+def _render_text(text, context):
+    def replace(match):
+        if match.group(3) is None:
+            return ""  # stray loop tags inside an inline body
+        value = _lookup(match.group(3), context)
+        return match.group(0) if value is None else value
+    return TAG_PATTERN.sub(replace, text)
+
+
+def _token_value(token, context):
+    if token["kind"] == "var":
+        return _lookup(token["name"], context)
+    if token["kind"] == "tag":
+        return ""
+    items = _loop_items(context.get(token["list"]))
+    return "".join(_render_text(token["body"], {**context, token["var"]: item}) for item in items)
+
+
+def _render_paragraph(p, para, context):
+    """Applies every tag edit of one paragraph in a single pass; each value lands in the run where its tag starts."""
+    edits = []
+    for token in para["tokens"]:
+        value = _token_value(token, context)
+        if value is not None:
+            edits.append((token["start"], token["end"], value))
+    if not edits:
+        return
+
+    runs = _runs(p)
+    texts = [run.text for run in runs]
+    run_ends = para["run_ends"]
+    run_starts = [0] + run_ends[:-1]
+    new_texts = list(texts)
+    # Right to left, so offsets of earlier edits in the same run stay valid
+    for start, end, value in sorted(edits, reverse=True):
+        for r, (lo, hi) in enumerate(zip(run_starts, run_ends)):
+            if lo >= end or hi <= start:
+                continue
+            replacement = value if lo <= start < hi else ""
+            new_texts[r] = new_texts[r][:max(start, lo) - lo] + replacement + new_texts[r][min(end, hi) - lo:]
+    for run, old, new in zip(runs, texts, new_texts):
+        if new != old:
+            run.text = new
+
+
+def clone_document(document):
+    """
+    Deep-copies a parsed Document for rendering. python-docx caches the body proxy
+    on first access and lxml copies it as a separate tree, so the cache is dropped
+    to keep document.paragraphs pointing at the tree that is rendered and saved.
+    """
+    clone = copy.deepcopy(document)
+    clone.__dict__.pop("_body", None)
+    return clone
+
+
+def render(compiled, document, context):
+    """Renders a clone of the compiled document in place and returns it."""
+    for story, blocks in zip(_stories(document), compiled.stories):
+        paragraphs = list(story.iter(qn("w:p")))
+        doomed = []
+        for block in blocks:
+            if block["kind"] == "paragraph":
+                para = block["paragraphs"][0]
+                p = paragraphs[para["index"]]
+                _render_paragraph(p, para, context)
+                if para["drop_if_blank"] and not _paragraph_text(p).strip():
+                    doomed.append(p)
+                continue
+
+            originals = [paragraphs[para["index"]] for para in block["paragraphs"]]
+            for item in _loop_items(context.get(block["list"])):
+                item_context = {**context, block["var"]: item}
+                for original, para in zip(originals, block["paragraphs"]):
+                    clone = copy.deepcopy(original)
+                    _render_paragraph(clone, para, item_context)
+                    if not (para["drop_if_blank"] and not _paragraph_text(clone).strip()):
+                        originals[0].addprevious(clone)
+            doomed.extend(originals)
+
+        for p in doomed:
+            p.getparent().remove(p)
+    return document
@@ -0,0 +1,87 @@
+import os
+import re
+import asyncio
+import hashlib
+import numpy as np
+from cache import TieredCache
+from clients import get_embedding_client, get_async_embedding_client
+
+# Azure OpenAI embedding configuration (shared by search, verdict and ingestion)
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "20000"))
+EMBEDDING_CACHE_DISK_MB = int(os.getenv("EMBEDDING_CACHE_DISK_MB", "1024"))
+
+embedding_cache = TieredCache(
+    "embeddings",
+    max_memory_items=EMBEDDING_CACHE_MEMORY_ITEMS,
+    max_disk_bytes=EMBEDDING_CACHE_DISK_MB * 1024 * 1024,
+)
+
+
+def normalize_text(text):
+    """Collapses whitespace so reflowed copies of the same text share a cache entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text, model=EMBEDDING_MODEL):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model}:{digest}"
+
+
+def _lookup(texts, model):
+    """Returns (results, missing): cached embeddings by position, and key -> positions for the misses."""
+    results = [None] * len(texts)
+    missing = {}  # key -> positions, so duplicates in one batch are embedded once
+    for i, text in enumerate(texts):
+        key = cache_key(text, model)
+        cached = embedding_cache.get(key)
+        if cached is not None:
+            results[i] = np.frombuffer(cached, dtype=np.float32).tolist()
+        else:
+            missing.setdefault(key, []).append(i)
+    return results, missing
+
+
+def _missing_inputs(texts, missing):
+    return [normalize_text(texts[positions[0]]) for positions in missing.values()]
+
+
+def _fill(results, missing, response):
+    for (key, positions), item in zip(missing.items(), sorted(response.data, key=lambda d: d.index)):
+        embedding_cache.set(key, np.asarray(item.embedding, dtype=np.float32).tobytes())
+        for i in positions:
+            results[i] = item.embedding
+
+
+def get_embeddings(texts, model=EMBEDDING_MODEL):
+    """
+    Returns one embedding per input text, calling the API only for texts not in the cache.
+    All misses are sent in a single multi-input request.
+    """
+    results, missing = _lookup(texts, model)
+    if missing:
+        response = get_embedding_client().embeddings.create(model=model, input=_missing_inputs(texts, missing))
+        _fill(results, missing, response)
+    return results
+
+
+def get_embedding(text, model=EMBEDDING_MODEL):
+    """Returns the embedding for a single text (cached)."""
+    return get_embeddings([text], model)[0]
+
+
+async def aget_embeddings(texts, model=EMBEDDING_MODEL):
+    """get_embeddings on the async client; cache lookups and writes (SQLite on a miss in memory) run off the event loop."""
+    results, missing = await asyncio.to_thread(_lookup, texts, model)
+    if missing:
+        response = await get_async_embedding_client().embeddings.create(model=model, input=_missing_inputs(texts, missing))
+        await asyncio.to_thread(_fill, results, missing, response)
+    return results
+
+
+async def aget_embedding(text, model=EMBEDDING_MODEL):
+    return (await aget_embeddings([text], model))[0]
+
+
+def cache_stats():
+    return embedding_cache.get_stats()
@@ -1,102 +1,199 @@
 import os
+import io
 import json
 import re
-from azure.storage.blob import BlobServiceClient
-from langchain_openai import AzureChatOpenAI
+import time
+import logging
+import threading
 from docx import Document
+from llm_cache import cached_invoke, acached_invoke
+from clients import get_chat_llm, get_async_chat_llm, get_blob_service_client
+from docx_template import compile_template, render, clone_document
 from difflib import get_close_matches
 
 # 🔹 Azure Blob Storage Configuration
 AZURE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
 CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME_4")
+TEMPLATE_DIR = "templates"
+TEMPLATE_REFRESH_SECONDS = int(os.getenv("TEMPLATE_REFRESH_SECONDS", "300"))
+GENERATED_DOCUMENT_PATH = os.getenv("GENERATED_DOCUMENT_PATH", "/Users/aryan_zingade/Downloads/generated_document.docx")
+
+# 🔹 In-memory cache of parsed templates, revalidated against blob ETags in the background
+class TemplateCache:
+    """
+    Keeps every .docx template parsed in memory with its placeholder set.
+
+    load() fills the cache from blob storage (or the local templates/ folder when
+    storage isn't configured); a daemon thread then re-lists the container every
+    TEMPLATE_REFRESH_SECONDS and re-downloads only templates whose ETag changed.
+    Request paths never touch blob storage: they look templates up by name and
+    render on a deep copy of the cached Document using its compiled tag locations.
+    """
+
+    def __init__(self, refresh_seconds=TEMPLATE_REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._templates = {}  # name -> {"etag", "document", "compiled", "placeholders"}
+        self._lock = threading.Lock()
+        self._refresher = None
+        self.stats = {"loads": 0, "refreshes": 0, "refresh_errors": 0, "lookups": 0, "misses": 0}
+
+    def _container_client(self):
+        return get_blob_service_client(AZURE_CONNECTION_STRING).get_container_client(CONTAINER_NAME)
+
+    def _store(self, name, etag, data):
+        document = Document(io.BytesIO(data))
+        compiled = compile_template(document)
+        entry = {"etag": etag, "document": document, "compiled": compiled, "placeholders": sorted(compiled.placeholders)}
+        with self._lock:
+            self._templates[name] = entry
+        self.stats["loads"] += 1
+
+    def load(self):
+        """Synchronizes the cache with the template source; only changed templates are downloaded."""
+        if not AZURE_CONNECTION_STRING or not CONTAINER_NAME:
+            for file_name in os.listdir(TEMPLATE_DIR):
+                if file_name.endswith(".docx") and not file_name.startswith("~$"):
+                    path = os.path.join(TEMPLATE_DIR, file_name)
+                    etag = str(os.path.getmtime(path))
+                    name = os.path.splitext(file_name)[0]
+                    if self._templates.get(name, {}).get("etag") != etag:
+                        with open(path, "rb") as f:
+                            self._store(name, etag, f.read())
+            return self.names()
+
+        container_client = self._container_client()
+        seen = set()
+        for blob in container_client.list_blobs():
+            if not blob.name.endswith(".docx"):
+                continue
+            name = os.path.splitext(os.path.basename(blob.name))[0]
+            seen.add(name)
+            if self._templates.get(name, {}).get("etag") != blob.etag:
+                data = container_client.get_blob_client(blob.name).download_blob().readall()
+                self._store(name, blob.etag, data)
+        with self._lock:
+            for name in set(self._templates) - seen:
+                del self._templates[name]
+        return self.names()
+
+    def _refresh_forever(self):
+        while True:
+            time.sleep(self.refresh_seconds)
+            try:
+                self.load()
+                self.stats["refreshes"] += 1
+            except Exception as e:
+                self.stats["refresh_errors"] += 1
+                logging.error(f"Template refresh failed: {e}")
+
+    def start(self):
+        """Preloads all templates and starts background revalidation (idempotent)."""
+        try:
+            self.load()
+        except Exception as e:
+            logging.error(f"Template preload failed: {e}")
+        if self._refresher is None and self.refresh_seconds > 0:
+            self._refresher = threading.Thread(target=self._refresh_forever, name="template-refresh", daemon=True)
+            self._refresher.start()
+
+    def names(self):
+        with self._lock:
+            return list(self._templates)
+
+    def get(self, name):
+        with self._lock:
+            return self._templates.get(name)
+
+    def resolve(self, document_type):
+        """Returns the cached template name closest to document_type, or None."""
+        self.stats["lookups"] += 1
+        if not self._templates:
+            self.start()  # first request in a worker that was not warmed up
+        best_match = get_close_matches(document_type, self.names(), n=1, cutoff=0.5)
+        if not best_match:
+            self.stats["misses"] += 1
+            return None
+        return best_match[0]
+
+    def clone(self, name):
+        """Returns a private copy of the parsed template for rendering."""
+        entry = self.get(name)
+        return clone_document(entry["document"]) if entry else None
+
+    def get_stats(self):
+        return {**self.stats, "templates": self.names()}
 
-# 🔹 OpenAI Configuration
-OPENAI_API_KEY = os.getenv("OPENAI_GPT_API_KEY")
-OPENAI_API_ENDPOINT = os.getenv("OPENAI_GPT_ENDPOINT")
 
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o-mini",
-    azure_endpoint=OPENAI_API_ENDPOINT,
-    api_key=OPENAI_API_KEY,
-    api_version="2024-10-21",
-    temperature=0.2
-)
+template_cache = TemplateCache()
 
-# 🔹 Function to list available templates from Azure Blob Storage
+
+# 🔹 Function to list available templates (served from the template cache)
 def list_templates_from_blob():
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-        container_client = blob_service_client.get_container_client(CONTAINER_NAME)
-        template_files = [blob.name for blob in container_client.list_blobs() if blob.name.endswith(".docx")]
-        template_names = [os.path.splitext(os.path.basename(file))[0] for file in template_files]
-        return template_names
+        return template_cache.names() or template_cache.load()
     except Exception as e:
         print(f"Error listing templates: {e}")
         return []
 
 
 # 🔹 Function to classify document type using GPT
+def document_type_messages(user_query):
+    return [
+        {"role": "system", "content": "Identify the most appropriate document type that is being asked for in the user query. Only return the document type name with no extra text. If it is a non disclosure agreement then return NDA. Valid template names should have NDA or Business Partnership in them."},
+        {"role": "user", "content": user_query}
+    ]
+
+
+def parse_document_type(response):
+    print(f"Raw LLM Response: {response.content.strip()}")  # Debugging
+
+    if response and hasattr(response, 'content'):
+        document_type = response.content.strip().upper().replace(" ", "_")
+        print(f"Classified Document Type: {document_type}")  # Debugging
+        return document_type
+    print("Error: Classification failed.")
+    return None
+
+
 def classify_document_type(user_query):
     try:
-        response = llm.invoke([
-            {"role": "system", "content": "Identify the most appropriate document type that is being asked for in the user query. Only return the document type name with no extra text. If it is a non disclosure agreement then return NDA. Valid template names should have NDA or Business Partnership in them."},
-            {"role": "user", "content": user_query}
-        ])
-
-        print(f"Raw LLM Response: {response.content.strip()}")  # Debugging
-
-        if response and hasattr(response, 'content'):
-            document_type = response.content.strip().upper().replace(" ", "_")
-            print(f"Classified Document Type: {document_type}")  # Debugging
-            return document_type
-        print("Error: Classification failed.")
-        return None
+        response = cached_invoke(get_chat_llm(), document_type_messages(user_query), "classify_document_type")
+        return parse_document_type(response)
     except Exception as e:
         print(f"Error in document classification: {e}")
         return None
 
 
-# 🔹 Function to fetch template from Azure Blob Storage
-def fetch_template_from_blob(document_type):
+async def aclassify_document_type(user_query):
     try:
-        blob_service_client = BlobServiceClient.from_connection_string(AZURE_CONNECTION_STRING)
-        container_client = blob_service_client.get_container_client(CONTAINER_NAME)
-
-        # Extract available template names
-        available_templates = [blob.name.replace(".docx", "") for blob in container_client.list_blobs()]
-        print(f"Available templates in container: {available_templates}")  # Debugging
+        response = await acached_invoke(get_async_chat_llm(), document_type_messages(user_query), "classify_document_type")
+        return parse_document_type(response)
+    except Exception as e:
+        print(f"Error in document classification: {e}")
+        return None
 
-        # Find the closest match
-        best_match = get_close_matches(document_type, available_templates, n=1, cutoff=0.5)  # Adjust cutoff if needed
 
-        if not best_match:
+# 🔹 Function to resolve a template by document type (cache lookup, no blob access)
+def fetch_template_from_blob(document_type):
+    """Returns the name of the cached template that best matches document_type, or None."""
+    try:
+        selected_template = template_cache.resolve(document_type)
+        if not selected_template:
             print(f"Error: No matching template found for {document_type}")
             return None
-
-        selected_template = best_match[0]  # Get the best match
-
-        # Download the matched template
-        blob_client = blob_service_client.get_blob_client(container=CONTAINER_NAME, blob=f"{selected_template}.docx")
-        template_path = f"templates/{selected_template}.docx"
-        os.makedirs("templates", exist_ok=True)  # Ensure directory exists
-
-        with open(template_path, "wb") as template_file:
-            template_file.write(blob_client.download_blob().readall())
-
-        print(f"Template {selected_template}.docx downloaded successfully.")  # Debugging
-        return template_path
+        return selected_template
     except Exception as e:
         print(f"Error fetching template: {e}")
         return None
 
 
 # 🔹 Function to extract placeholders from the document template
-def extract_placeholders(template_path):
+def extract_placeholders(template):
     try:
-        doc = Document(template_path)
-        text = "\n".join([para.text for para in doc.paragraphs])
-        placeholders = list(set(re.findall(r"\{(.*?)\}", text)))  # Extract placeholders
-        return placeholders
+        entry = template_cache.get(template)
+        if entry:
+            return list(entry["placeholders"])
+        return sorted(compile_template(Document(template)).placeholders)
     except Exception as e:
         print(f"Error extracting placeholders: {e}")
         return []
@@ -154,12 +251,18 @@ def extract_entities_from_gpt(user_query, document_type, placeholders):
     extraction_prompt = generate_extraction_prompt(user_query, document_type, placeholders)
     
     # Call the LLM with the enhanced prompt
-    response = llm.invoke([{"role": "user", "content": extraction_prompt}])
+    response = cached_invoke(get_chat_llm(), [{"role": "user", "content": extraction_prompt}], "document_generation")
     extracted_data = extract_json_from_response(response.content.strip())
     
     return extracted_data
 
 
+async def aextract_entities_from_gpt(user_query, document_type, placeholders):
+    extraction_prompt = generate_extraction_prompt(user_query, document_type, placeholders)
+    response = await acached_invoke(get_async_chat_llm(), [{"role": "user", "content": extraction_prompt}], "document_generation")
+    return extract_json_from_response(response.content.strip())
+
+
 def extract_json_from_response(response_text):
     try:
         # Remove markdown formatting if present (e.g., ```json ... ```)
@@ -174,41 +277,23 @@ def extract_json_from_response(response_text):
         return None  # Return None if parsing fails
 
 
-def fill_document_with_gpt(template_path, extracted_data):
+def fill_document_with_gpt(template, extracted_data):
+    """
+    Renders the template with the extracted values in a single pass over its
+    compiled tag locations (body, tables, headers and footers), keeping run formatting.
+    """
     try:
-        doc = Document(template_path)
-
-        # Ensure placeholders are properly formatted
-        cleaned_data = {
-            key: (str(value) if value is not None else "") for key, value in extracted_data.items()
-        }
-
-        # Convert list elements into properly formatted strings
-        for key in ["DISCLOSING_PARTIES", "RECEIVING_PARTIES"]:
-            if key in extracted_data and isinstance(extracted_data[key], list):
-                cleaned_data[key] = ", ".join(map(str, extracted_data[key]))  # Join correctly
-
-        # Replace placeholders with extracted values
-        for para in doc.paragraphs:
-            for placeholder, value in cleaned_data.items():
-                para.text = para.text.replace(f"{{ {placeholder} }}", value)
-
-        # Replace custom Jinja-style placeholders
-        for para in doc.paragraphs:
-            if "{% for party in DISCLOSING_PARTIES %}" in para.text:
-                para.text = para.text.replace(
-                    "{% for party in DISCLOSING_PARTIES %} - { party.name }", 
-                    f"Party Disclosing Information: {cleaned_data.get('DISCLOSING_PARTIES', 'N/A')}"
-                )
-
-            if "{% for party in RECEIVING_PARTIES %}" in para.text:
-                para.text = para.text.replace(
-                    "{% for party in RECEIVING_PARTIES %} - { party.name }", 
-                    f"Party Receiving Information: {cleaned_data.get('RECEIVING_PARTIES', 'N/A')}"
-                )
+        entry = template_cache.get(template)
+        if entry:
+            doc, compiled = clone_document(entry["document"]), entry["compiled"]
+        else:
+            doc = Document(template)
+            compiled = compile_template(doc)
+
+        render(compiled, doc, extracted_data)
 
         # Save the final document
-        output_path = "/Users/aryan_zingade/Downloads/generated_document.docx"
+        output_path = GENERATED_DOCUMENT_PATH
         doc.save(output_path)
         return output_path
 
@@ -217,4 +302,7 @@ def fill_document_with_gpt(template_path, extracted_data):
         return None
 
 
-
+def warm_up():
+    """Builds the model client, preloads the templates and starts their background revalidation."""
+    get_chat_llm()
+    template_cache.start()
@@ -0,0 +1,131 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# glossary.json is either {"term": "replacement", ...} for GLOSSARY_DEFAULT_LANGUAGE
+# or {"hi": {"term": "replacement", ...}, "mr": {...}} keyed by target language
+GLOSSARY_PATH = os.getenv("GLOSSARY_PATH", "glossary.json")
+GLOSSARY_DEFAULT_LANGUAGE = os.getenv("GLOSSARY_DEFAULT_LANGUAGE", "hi")
+GLOSSARY_CHECK_SECONDS = float(os.getenv("GLOSSARY_CHECK_SECONDS", "5"))
+
+# A term only matches between non-word characters. Indic vowel signs are not \w in
+# Python's re, so the Indic blocks count as word characters too.
+WORD_CHARS = r"\w\u0900-\u0DFF"
+
+
+def _trie_pattern(terms):
+    """
+    Builds one regex alternation from the terms, factored as a trie so matching is
+    linear in the text rather than in the number of terms. At every node the
+    longer continuations come before the end of a term, so the longest term wins.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        ends = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not ends:
+            return branches[0]
+        body = "(?:" + "|".join(branches) + ")"
+        return body + "?" if ends else body
+
+    return build(trie)
+
+
+class Glossary:
+    """The compiled glossary of one target language."""
+
+    def __init__(self, terms, version):
+        self.terms = terms
+        self.version = version
+        self.pattern = None
+        if terms:
+            self.pattern = re.compile(f"(?<![{WORD_CHARS}])(?:{_trie_pattern(terms)})(?![{WORD_CHARS}])")
+
+    def apply(self, text):
+        if not self.pattern or not text:
+            return text
+        return self.pattern.sub(lambda match: self.terms[match.group(0)], text)
+
+
+class GlossaryStore:
+    """
+    Glossaries keyed by target language, loaded from GLOSSARY_PATH.
+
+    Each language is compiled on first use. The file's mtime is checked at most
+    every GLOSSARY_CHECK_SECONDS and a changed file is reloaded without a restart.
+    """
+
+    def __init__(self, path=GLOSSARY_PATH, check_seconds=GLOSSARY_CHECK_SECONDS):
+        self.path = path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked = 0.0
+        self._raw = {}
+        self._compiled = {}
+        self._maybe_reload(force=True)
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        if data and all(isinstance(value, dict) for value in data.values()):
+            return data
+        return {GLOSSARY_DEFAULT_LANGUAGE: data}
+
+    def _maybe_reload(self, force=False):
+        now = time.time()
+        if not force and now - self._checked < self.check_seconds:
+            return
+        self._checked = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if mtime == self._mtime and not force:
+            return
+        try:
+            raw = self._load() if mtime is not None else {}
+        except Exception as e:
+            logging.error(f"Failed to load glossary: {str(e)}")
+            return
+        with self._lock:
+            self._raw, self._compiled, self._mtime = raw, {}, mtime
+        if not force:
+            logging.info(f"Reloaded glossary {self.path} ({', '.join(sorted(raw)) or 'empty'})")
+
+    def get(self, language):
+        """Returns the compiled Glossary for the language (an empty one if there is none)."""
+        self._maybe_reload()
+        with self._lock:
+            glossary = self._compiled.get(language)
+            if glossary is None:
+                terms = {term: value for term, value in self._raw.get(language, {}).items() if term}
+                digest = hashlib.sha256(json.dumps(terms, sort_keys=True, ensure_ascii=False).encode("utf-8"))
+                glossary = self._compiled[language] = Glossary(terms, digest.hexdigest()[:16])
+        return glossary
+
+    def apply(self, text, language):
+        return self.get(language).apply(text)
+
+    def version(self, language):
+        """A short hash of the language's terms; changes whenever its entries change."""
+        return self.get(language).version
+
+    def languages(self):
+        self._maybe_reload()
+        return sorted(self._raw)
+
+
+glossaries = GlossaryStore()
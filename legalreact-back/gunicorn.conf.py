@@ -0,0 +1,30 @@
+"""
+gunicorn settings; gunicorn reads this file from the working directory.
+
+With preload_app the master imports main.py, and the agent modules listed in
+STARTUP_PRELOAD (all of them by default here), once before forking. Workers
+then share that memory copy-on-write instead of each importing the SDKs.
+Importing builds no service clients and starts no threads, but main.py does
+open SQLite in the master: the job queue creates its table and reconciles at
+import, and the cache modules open their databases. Those connections are
+cache.SQLiteConnection, which reopens per pid, so each worker gets its own on
+first use and never touches the master's. Clients are built per worker after
+the fork, in post_worker_init (STARTUP_WARMUP) or on first use.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+wsgi_app = "main:app"
+
+if preload_app:
+    os.environ.setdefault("STARTUP_PRELOAD", "all")
+
+
+def post_worker_init(worker):
+    from subsystems import warm_up
+
+    warm_up()
@@ -0,0 +1,416 @@
+"""
+Past-cases ingestion: blob -> OCR -> chunk -> embed -> upsert.
+
+    python ingest.py --workers 8 --embed-batch 16 --upsert-batch 100
+
+OCR runs on a bounded thread pool. Each result is chunked page by page
+(chunking.py) and its chunks are streamed into the batches one embedding
+batch at a time, so a 1,000-page judgment is never held as a list of chunks:
+besides the OCR result, a document only keeps its chunk placements. Embeddings
+are requested in multi-input batches and vectors are upserted in batches,
+together with the chunk texts into the BM25 keyword index (lexical.py).
+
+Runs are incremental. A manifest (manifest.py) records each indexed blob's
+ETag, content hash and chunk ids. Blobs with an unchanged ETag or Content-MD5
+are skipped without OCR. Of a changed blob, only chunks with new text are
+embedded; chunks that only moved get their metadata refreshed from the stored
+vector; chunks the new version no longer has, and all chunks of deleted
+blobs or of blobs that now extract to no text, are removed from both indexes. A blob's entry is written once all its
+chunks are stored, so a crashed run picks up where it stopped.
+"""
+import os
+import time
+import hashlib
+import argparse
+from itertools import islice
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from azure.storage.blob import generate_blob_sas, BlobSasPermissions
+from azure.ai.documentintelligence.models import AnalyzeDocumentRequest
+from embeddings import get_embeddings, cache_stats
+from clients import get_blob_service_client, get_document_intelligence_client
+from vectorstore import get_index
+from lexical import get_lexical_index
+from chunking import chunk_pages, document_pages
+from manifest import IngestManifest, INGEST_MANIFEST_PATH
+
+# Azure Storage Credentials
+AZURE_STORAGE_ACCOUNT_NAME = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
+AZURE_STORAGE_ACCOUNT_KEY = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
+AZURE_CONTAINER_NAME = os.getenv("AZURE_CONTAINER_NAME_3")
+AZURE_STORAGE_CONNECTION_STRING = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+
+CASES_INDEX_NAME = "past-cases"
+DELETE_BATCH_SIZE = 1000  # Pinecone deletes at most 1000 ids per call
+
+blob_service_client = get_blob_service_client(AZURE_STORAGE_CONNECTION_STRING)
+doc_int_client = get_document_intelligence_client()
+
+
+def generate_sas_token(blob_name, container_name=AZURE_CONTAINER_NAME, expiration_minutes=60):
+    """Generates a SAS token for secure access to a blob."""
+    return generate_blob_sas(
+        account_name=AZURE_STORAGE_ACCOUNT_NAME,
+        container_name=container_name,
+        blob_name=blob_name,
+        account_key=AZURE_STORAGE_ACCOUNT_KEY,
+        permission=BlobSasPermissions(read=True),
+        expiry=datetime.utcnow() + timedelta(minutes=expiration_minutes)
+    )
+
+
+def analyze_pdf(blob_name, container_name=AZURE_CONTAINER_NAME):
+    """Runs Document Intelligence prebuilt-read on a blob and returns the result (pages, paragraphs)."""
+    sas_token = generate_sas_token(blob_name, container_name)
+    blob_url = f"https://{AZURE_STORAGE_ACCOUNT_NAME}.blob.core.windows.net/{container_name}/{blob_name}?{sas_token}"
+    poller = doc_int_client.begin_analyze_document("prebuilt-read", AnalyzeDocumentRequest(url_source=blob_url))
+    return poller.result()
+
+
+def blob_content_hash(blob):
+    """"md5:<hex>" from the blob listing's Content-MD5, or None when the upload did not set one."""
+    md5 = blob.content_settings.content_md5 if blob.content_settings else None
+    return f"md5:{bytes(md5).hex()}" if md5 else None
+
+
+def indexed_chunk_ids(index, blob_name):
+    """
+    Ids stored under the blob's chunk prefix, including ones the manifest does not
+    know (e.g. positional ids from before it existed). [] for indexes without list().
+    """
+    try:
+        return [vector_id for ids in index.list(prefix=f"{blob_name}_chunk_") for vector_id in ids]
+    except Exception as e:
+        print(f"⚠️ Could not list chunks of {blob_name}: {e}")
+        return []
+
+
+class ChunkingError(Exception):
+    """Chunking a document's OCR result failed; the document was dropped from the run."""
+
+
+def _placement(chunk):
+    return [chunk["index"], chunk["pages"][0], chunk["pages"][1], chunk["section"]]
+
+
+def _chunk_vector(blob_name, chunk, values):
+    return {
+        "id": chunk["id"],
+        "values": values,
+        "metadata": {
+            "title": blob_name,
+            "summary_chunk": chunk["text"],
+            "chunk_index": chunk["index"],
+            "page_start": chunk["pages"][0],
+            "page_end": chunk["pages"][1],
+            "section": chunk["section"],
+        }
+    }
+
+
+class IngestionRun:
+    """Holds the batching buffers, manifest and counters for one ingestion run."""
+
+    def __init__(self, index_name, index, lexical_index, manifest, embed_batch_size, upsert_batch_size):
+        self.index_name = index_name
+        self.index = index
+        self.lexical_index = lexical_index
+        self.manifest = manifest
+        self.embed_batch_size = embed_batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self.to_embed = []   # (blob_name, chunk)
+        self.to_upsert = []  # (blob_name, vector dict)
+        self.pending = {}    # blob_name -> {"etag", "content_hash", "placements", "orphans", "remaining"}
+        self.started = time.perf_counter()
+        self.docs_done = 0
+        self.chunks_done = 0
+        self.changes = {
+            "new": 0, "changed": 0, "unchanged": 0, "removed": 0,
+            "chunks_embedded": 0, "chunks_refreshed": 0, "chunks_kept": 0, "chunks_deleted": 0,
+        }
+
+    def add_document(self, blob_name, etag, chunks, previous):
+        """
+        Streams a new or changed document's chunks (chunk dicts from
+        chunking.chunk_pages) into the batches, embed_batch_size at a time.
+        previous maps the chunk ids already stored for it to their placement (None
+        if unknown): new ids are embedded, ids whose placement changed are re-upserted
+        with their stored values, and ids no longer produced are deleted once the
+        rest of the document is stored. Returns the number of chunks; the document
+        stays open until finish_document. Raises ChunkingError if chunks raises.
+        """
+        entry = self.pending[blob_name] = {
+            "etag": etag, "content_hash": None, "placements": {}, "orphans": [], "remaining": 0,
+            "open": True, "new": bool(not previous), "added": 0, "moved": 0,
+        }
+        chunks = iter(chunks)
+        while True:
+            try:
+                batch = list(islice(chunks, self.embed_batch_size))
+            except Exception as e:
+                self.abandon(blob_name)
+                raise ChunkingError(e) from e
+            if not batch:
+                break
+            self._queue_chunks(blob_name, batch, previous)
+        entry["orphans"] = [chunk_id for chunk_id in previous if chunk_id not in entry["placements"]]
+        return len(entry["placements"])
+
+    def _queue_chunks(self, blob_name, chunks, previous):
+        entry = self.pending[blob_name]
+        placements = {chunk["id"]: _placement(chunk) for chunk in chunks}
+        entry["placements"].update(placements)
+        added = [chunk for chunk in chunks if chunk["id"] not in previous]
+        moved = [chunk for chunk in chunks if chunk["id"] in previous and previous[chunk["id"]] != placements[chunk["id"]]]
+        entry["added"] += len(added)
+        entry["moved"] += len(moved)
+        # A moved chunk the index no longer has (manual delete, another backend) is embedded again
+        stored = self.stored_values([chunk["id"] for chunk in moved])
+        refreshed = [chunk for chunk in moved if chunk["id"] in stored]
+        added += [chunk for chunk in moved if chunk["id"] not in stored]
+        entry["remaining"] += len(refreshed) + len(added)
+        for chunk in refreshed:
+            self.to_upsert.append((blob_name, _chunk_vector(blob_name, chunk, stored[chunk["id"]])))
+        self.changes["chunks_refreshed"] += len(refreshed)
+        for chunk in added:
+            self.to_embed.append((blob_name, chunk))
+        while len(self.to_embed) >= self.embed_batch_size:
+            self.embed_batch()
+        while len(self.to_upsert) >= self.upsert_batch_size:
+            self.upsert_batch()
+
+    def finish_document(self, blob_name, content_hash):
+        """Every chunk of the document has been queued: record it now if nothing changed, else once its chunks are stored."""
+        entry = self.pending[blob_name]
+        entry["open"] = False
+        entry["content_hash"] = content_hash
+        chunk_count = len(entry["placements"])
+        if not entry["added"] and not entry["moved"] and not entry["orphans"]:
+            self.pending.pop(blob_name)
+            self.manifest.record(self.index_name, blob_name, entry["etag"], content_hash, entry["placements"])
+            self.changes["unchanged"] += 1
+            return
+
+        self.changes["new" if entry["new"] else "changed"] += 1
+        self.changes["chunks_kept"] += chunk_count - entry["added"] - entry["moved"]
+        print(f"🔄 {blob_name}: {entry['added']} new, {entry['moved']} moved, {len(entry['orphans'])} removed chunks")
+        if entry["remaining"] == 0:
+            self.complete(blob_name)
+
+    def abandon(self, blob_name):
+        """Drops a document from the run, with its chunks not yet embedded or upserted."""
+        self.pending.pop(blob_name, None)
+        self.to_embed = [item for item in self.to_embed if item[0] != blob_name]
+        self.to_upsert = [item for item in self.to_upsert if item[0] != blob_name]
+
+    def stored_values(self, ids):
+        """{id: values} of the ids that are in the vector index."""
+        values = {}
+        for start in range(0, len(ids), 100):
+            vectors = self.index.fetch(ids=ids[start:start + 100])["vectors"]
+            values.update({vector_id: list(vector["values"]) for vector_id, vector in vectors.items()})
+        return values
+
+    def embed_batch(self):
+        batch, self.to_embed = self.to_embed[:self.embed_batch_size], self.to_embed[self.embed_batch_size:]
+        if not batch:
+            return
+        embeddings = get_embeddings([chunk["text"] for _, chunk in batch])
+        for (blob_name, chunk), embedding in zip(batch, embeddings):
+            self.to_upsert.append((blob_name, _chunk_vector(blob_name, chunk, embedding)))
+        self.changes["chunks_embedded"] += len(batch)
+        while len(self.to_upsert) >= self.upsert_batch_size:
+            self.upsert_batch()
+
+    def upsert_batch(self):
+        batch, self.to_upsert = self.to_upsert[:self.upsert_batch_size], self.to_upsert[self.upsert_batch_size:]
+        if not batch:
+            return
+        self.index.upsert([vector for _, vector in batch])
+        self.lexical_index.upsert([vector for _, vector in batch])
+        self.chunks_done += len(batch)
+
+        for blob_name, _ in batch:
+            entry = self.pending[blob_name]
+            entry["remaining"] -= 1
+            if entry["remaining"] == 0 and not entry["open"]:
+                self.complete(blob_name)
+
+    def complete(self, blob_name):
+        """All chunks of the document are stored: drop its orphaned chunks and record it in the manifest."""
+        entry = self.pending.pop(blob_name)
+        self.delete_chunks(entry["orphans"])
+        self.manifest.record(self.index_name, blob_name, entry["etag"], entry["content_hash"], entry["placements"])
+        self.docs_done += 1
+
+    def remove_document(self, blob_name, chunk_ids=()):
+        """
+        The blob is gone from the container, or has no content left: delete its
+        chunks (the manifest's, plus chunk_ids found in the index) and its manifest entry.
+        """
+        ids = dict.fromkeys(self.manifest.chunks(self.index_name, blob_name))
+        ids.update(dict.fromkeys(chunk_ids))
+        self.delete_chunks(list(ids))
+        self.manifest.remove(self.index_name, blob_name)
+        self.changes["removed"] += 1
+        print(f"🗑️ {blob_name}: removed from the index")
+
+    def delete_chunks(self, ids):
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            self.index.delete(ids=batch)
+            self.lexical_index.delete(batch)
+        self.changes["chunks_deleted"] += len(ids)
+
+    def mark_failed(self, blob_name, etag, error):
+        self.manifest.record_failure(self.index_name, blob_name, etag, error)
+
+    def flush(self):
+        while self.to_embed:
+            self.embed_batch()
+        while self.to_upsert:
+            self.upsert_batch()
+        # Every queued chunk is stored now; a document still pending was miscounted, finish it anyway
+        for blob_name in list(self.pending):
+            print(f"⚠️ {blob_name}: {self.pending[blob_name]['remaining']} chunks unaccounted for, completing it")
+            self.complete(blob_name)
+
+    def throughput(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "docs": self.docs_done,
+            "chunks": self.chunks_done,
+            "elapsed_s": round(elapsed, 1),
+            "docs_per_sec": round(self.docs_done / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_sec": round(self.chunks_done / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+def _hashed_pages(result, digest):
+    """Yields the result's page texts, feeding each to digest."""
+    for page in document_pages(result):
+        digest.update(page.encode("utf-8"))
+        yield page
+
+
+def run_ingestion(container_name=AZURE_CONTAINER_NAME, index_name=CASES_INDEX_NAME, ocr_workers=4,
+                  embed_batch_size=16, upsert_batch_size=100, manifest_path=INGEST_MANIFEST_PATH,
+                  full=False, limit=None):
+    """
+    Brings the vector index up to date with the container and returns throughput and change stats.
+    Blobs whose ETag or Content-MD5 matches the manifest are skipped unless full is True.
+    """
+    manifest = IngestManifest(manifest_path)
+    documents = manifest.documents(index_name)
+    index = get_index(index_name)
+    run = IngestionRun(index_name, index, get_lexical_index(index_name), manifest, embed_batch_size, upsert_batch_size)
+    container_client = blob_service_client.get_container_client(container_name)
+    listed = set()
+    listing_complete = False
+
+    def pending_blobs():
+        nonlocal listing_complete
+        queued = 0
+        for blob in container_client.list_blobs():
+            listed.add(blob.name)
+            known = documents.get(blob.name)
+            if known and not full:
+                if known["etag"] == blob.etag:
+                    run.changes["unchanged"] += 1
+                    continue
+                if known["content_hash"] and known["content_hash"] == blob_content_hash(blob):
+                    manifest.record_etag(index_name, blob.name, blob.etag)
+                    run.changes["unchanged"] += 1
+                    continue
+            if limit is not None and queued >= limit:
+                return
+            queued += 1
+            yield blob
+        listing_complete = True
+
+    print(f"Starting ingestion into {index_name} ({len(documents)} blobs in the manifest)")
+
+    with ThreadPoolExecutor(max_workers=ocr_workers) as pool:
+        in_flight = {}
+        blobs = pending_blobs()
+        exhausted = False
+        while in_flight or not exhausted:
+            # Keep at most 2x workers OCR jobs queued so memory stays bounded
+            while not exhausted and len(in_flight) < ocr_workers * 2:
+                blob = next(blobs, None)
+                if blob is None:
+                    exhausted = True
+                    break
+                in_flight[pool.submit(analyze_pdf, blob.name, container_name)] = blob
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                blob = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"⚠️ Skipping {blob.name} due to extraction failure: {e}")
+                    run.mark_failed(blob.name, blob.etag, e)
+                    continue
+                stored_ids = indexed_chunk_ids(index, blob.name)
+                previous = {chunk_id: None for chunk_id in stored_ids}
+                previous.update(manifest.chunks(index_name, blob.name))
+                digest = hashlib.sha256()
+                try:
+                    chunk_count = run.add_document(blob.name, blob.etag, chunk_pages(_hashed_pages(result, digest), blob.name), previous)
+                except ChunkingError as e:
+                    print(f"⚠️ Skipping {blob.name} due to extraction failure: {e}")
+                    run.mark_failed(blob.name, blob.etag, e)
+                    continue
+                if not chunk_count:
+                    print(f"⚠️ Skipping {blob.name} due to empty content after chunking")
+                    run.abandon(blob.name)
+                    # Chunks of an earlier version must not stay searchable
+                    if stored_ids or blob.name in documents:
+                        run.remove_document(blob.name, stored_ids)
+                    run.mark_failed(blob.name, blob.etag, "empty content")
+                    continue
+                run.finish_document(blob.name, blob_content_hash(blob) or f"sha256:{digest.hexdigest()}")
+
+            stats = run.throughput()
+            print(f"Progress: {stats['docs']} docs, {stats['chunks']} chunks, "
+                  f"{stats['docs_per_sec']} docs/s, {stats['chunks_per_sec']} chunks/s")
+
+    run.flush()
+    # Only a full listing shows which blobs were deleted
+    if listing_complete:
+        for blob_name in set(documents) - listed:
+            run.remove_document(blob_name)
+
+    stats = run.throughput()
+    stats.update(run.changes)
+    stats["failed"] = manifest.failure_count(index_name)
+    stats["embedding_cache"] = cache_stats()
+    print(f"✅ Ingestion finished: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest past-case PDFs into the vector index.")
+    parser.add_argument("--container", default=AZURE_CONTAINER_NAME)
+    parser.add_argument("--index", default=CASES_INDEX_NAME)
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent Document Intelligence requests")
+    parser.add_argument("--embed-batch", type=int, default=16, help="Chunks per embeddings request")
+    parser.add_argument("--upsert-batch", type=int, default=100, help="Vectors per upsert")
+    parser.add_argument("--manifest", default=INGEST_MANIFEST_PATH)
+    parser.add_argument("--full", action="store_true", help="Re-read every blob, even if its ETag is unchanged")
+    parser.add_argument("--limit", type=int, default=None, help="Process at most this many blobs")
+    args = parser.parse_args()
+
+    run_ingestion(
+        container_name=args.container,
+        index_name=args.index,
+        ocr_workers=args.workers,
+        embed_batch_size=args.embed_batch,
+        upsert_batch_size=args.upsert_batch,
+        manifest_path=args.manifest,
+        full=args.full,
+        limit=args.limit,
+    )
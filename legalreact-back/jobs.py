@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cache import SQLiteConnection
+
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_MAX_QUEUE_DEPTH = int(os.getenv("JOB_MAX_QUEUE_DEPTH", "100"))
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(24 * 3600)))
+# How long /jobs/<id>/events follows a job before telling the client to poll its status instead
+JOB_EVENTS_TIMEOUT_SECONDS = int(os.getenv("JOB_EVENTS_TIMEOUT_SECONDS", os.getenv("GUNICORN_TIMEOUT", "600")))
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _process_start(pid):
+    """The process's start time in clock ticks since boot (Linux), to tell a reused PID apart; None if unknown."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return int(f.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _process_alive(pid, started):
+    """Whether the process that owned a job still runs: the PID exists and, where known, started at the same time."""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # exists, owned by another user
+        pass
+    current = _process_start(pid)
+    return started is None or current is None or current == started
+
+
+class JobQueue:
+    """
+    Background job runner for slow document pipelines.
+
+    Jobs run on a bounded thread pool in the process that accepted them. Their
+    state lives in SQLite, so any gunicorn worker can answer status requests.
+    A job is a callable returning an iterator of (event, data) tuples (the same
+    shape the streaming endpoints use): every event except "token" is recorded as
+    progress, and the last "result" or "error" event becomes the job's outcome.
+
+    Each job records the PID (and start time) of the worker running it. Jobs
+    left queued or running by a worker that has died are marked failed when a
+    queue is created and whenever reconcile() is called; a live worker's jobs
+    are never expired, however long they wait or run.
+    """
+
+    def __init__(self, db_path=JOB_DB_PATH, workers=JOB_WORKERS, max_queue_depth=JOB_MAX_QUEUE_DEPTH):
+        self.workers = workers
+        self.max_queue_depth = max_queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._busy_seconds = 0.0
+        self._started = time.time()
+
+        self._db = SQLiteConnection(db_path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY, kind TEXT, status TEXT, progress TEXT, result TEXT,
+                created_at REAL, started_at REAL, finished_at REAL, owner_pid INTEGER, owner_started INTEGER
+            )
+        """)
+        columns = [column[1] for column in self._db.execute("PRAGMA table_info(jobs)")]
+        for column in ("owner_pid", "owner_started"):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} INTEGER")
+        self._db.commit()
+        self.reconcile()
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            columns = ", ".join(f"{name} = ?" for name in fields)
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", [*fields.values(), job_id])
+            self._db.commit()
+
+    def submit(self, kind, job, *args, cleanup=None):
+        """Queues job(*args) and returns its id; raises QueueFullError when the queue is at capacity."""
+        with self._lock:
+            if self._queued >= self.max_queue_depth:
+                raise QueueFullError(f"Job queue is full ({self._queued} queued).")
+            self._queued += 1
+            job_id = uuid.uuid4().hex
+            self._db.execute(
+                "INSERT INTO jobs (id, kind, status, progress, created_at, owner_pid, owner_started) "
+                "VALUES (?, ?, 'queued', '[]', ?, ?, ?)",
+                (job_id, kind, time.time(), os.getpid(), _process_start(os.getpid())),
+            )
+            self._db.commit()
+        self._executor.submit(self._run, job_id, job, args, cleanup)
+        return job_id
+
+    def _run(self, job_id, job, args, cleanup):
+        started = time.time()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        self._update(job_id, status="running", started_at=started)
+
+        progress, status, outcome = [], "failed", {"error": "Job produced no result."}
+        try:
+            for event, data in job(*args):
+                if event == "token":
+                    continue
+                if event in ("result", "error"):
+                    status = "succeeded" if event == "result" and "error" not in data else "failed"
+                    outcome = data
+                else:
+                    progress.append({"event": event, "data": data, "at": round(time.time() - started, 3)})
+                    self._update(job_id, progress=json.dumps(progress, ensure_ascii=False))
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed")
+            status, outcome = "failed", {"error": str(e)}
+        finally:
+            if cleanup:
+                cleanup()
+            finished = time.time()
+            self._update(job_id, status=status, result=json.dumps(outcome, ensure_ascii=False), finished_at=finished)
+            with self._lock:
+                self._running -= 1
+                self._busy_seconds += finished - started
+
+    def reconcile(self, job_id=None):
+        """Marks queued/running jobs (all, or just job_id) whose worker process is gone as failed; returns how many."""
+        query = "SELECT id, owner_pid, owner_started FROM jobs WHERE status IN ('queued', 'running')"
+        with self._lock:
+            rows = self._db.execute(query + (" AND id = ?" if job_id else ""), (job_id,) if job_id else ()).fetchall()
+        lost = [row[0] for row in rows if not _process_alive(row[1], row[2])]
+        for lost_id in lost:
+            self._update(lost_id, status="failed", finished_at=time.time(),
+                         result=json.dumps({"error": "Job was interrupted before it finished (its worker stopped)."}))
+        return len(lost)
+
+    def get(self, job_id):
+        """Returns the job as a dict, or None if it does not exist."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, kind, status, progress, result, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "job_id": row[0],
+            "kind": row[1],
+            "status": row[2],
+            "progress": json.loads(row[3] or "[]"),
+            "result": json.loads(row[4]) if row[4] else None,
+        }
+        if row[7]:
+            job["latency_s"] = round(row[7] - row[5], 3)
+        return job
+
+    def purge(self, max_age=JOB_RETENTION_SECONDS):
+        self.reconcile()
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (time.time() - max_age,))
+            self._db.commit()
+
+    def get_stats(self, window=200):
+        """Queue depth, worker utilization and latency over the last `window` finished jobs."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT finished_at - created_at, finished_at - started_at, status FROM jobs "
+                "WHERE finished_at IS NOT NULL ORDER BY finished_at DESC LIMIT ?",
+                (window,),
+            ).fetchall()
+            uptime = time.time() - self._started
+            stats = {
+                "queued": self._queued,
+                "running": self._running,
+                "workers": self.workers,
+                "max_queue_depth": self.max_queue_depth,
+                "worker_utilization": round(self._busy_seconds / (uptime * self.workers), 4) if uptime else 0.0,
+            }
+        latencies = sorted(row[0] for row in rows)
+        if latencies:
+            stats["latency_s"] = {
+                "p50": round(latencies[len(latencies) // 2], 3),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3),
+                "mean_run": round(sum(row[1] for row in rows) / len(rows), 3),
+            }
+            stats["recent_failures"] = sum(1 for row in rows if row[2] == "failed")
+        return stats
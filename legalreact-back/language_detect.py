@@ -0,0 +1,233 @@
+"""
+Local language detection.
+
+Detects the language of a document from a bounded sample of its text, so
+/translatedoc does not ship the whole document to the Translator /detect
+endpoint first. Two stages:
+
+1. Script: characters of the sample are counted per Unicode script. Scripts
+   used by a single language we translate (Bengali, Tamil, Hangul, ...)
+   decide the language outright.
+2. Character n-grams: for shared scripts (Latin, Devanagari, Arabic,
+   Cyrillic) the sample's 1-3 grams are scored against per-language
+   log-probability profiles from language_profiles.json.
+
+The profiles are derived from the Wikipedia n-gram profiles shipped with the
+langdetect package (Apache-2.0) and can be rebuilt with:
+
+    python language_detect.py build-profiles <langdetect>/profiles
+
+Accuracy on a labeled set (optionally next to the Translator API):
+
+    python language_detect.py evaluate benchmarks/language_testset.jsonl [--remote]
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import unicodedata
+from functools import lru_cache
+from collections import Counter
+
+LANGUAGE_PROFILES_PATH = os.getenv(
+    "LANGUAGE_PROFILES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "language_profiles.json")
+)
+LANGUAGE_SAMPLE_CHARS = int(os.getenv("LANGUAGE_SAMPLE_CHARS", "600"))
+# Below this confidence translate.detect_language asks the Translator API instead
+LANGUAGE_MIN_CONFIDENCE = float(os.getenv("LANGUAGE_MIN_CONFIDENCE", "0.9"))
+
+# Output codes follow the Translator API so results compare with /detect and target languages
+SCRIPT_LANGUAGES = {
+    "BENGALI": "bn", "GURMUKHI": "pa", "GUJARATI": "gu", "ORIYA": "or", "TAMIL": "ta",
+    "TELUGU": "te", "KANNADA": "kn", "MALAYALAM": "ml", "HANGUL": "ko", "HIRAGANA": "ja",
+    "KATAKANA": "ja", "CJK": "zh-Hans", "THAI": "th", "GREEK": "el", "HEBREW": "he",
+}
+PROFILE_LANGUAGES = {
+    "LATIN": ["en", "fr", "de", "es", "pt", "it", "nl"],
+    "DEVANAGARI": ["hi", "mr", "ne"],
+    "ARABIC": ["ar", "ur", "fa"],
+    "CYRILLIC": ["ru", "uk", "bg"],
+}
+PROFILE_SIZE = {1: 60, 2: 300, 3: 600}
+
+
+@lru_cache(maxsize=4096)
+def _script(char):
+    try:
+        name = unicodedata.name(char)
+    except ValueError:
+        return None
+    first = name.split(" ")[0]
+    if first == "CJK":
+        return "CJK"
+    return first if first in SCRIPT_LANGUAGES or first in PROFILE_LANGUAGES else None
+
+
+@lru_cache(maxsize=4096)
+def _is_letter(char):
+    return unicodedata.category(char)[0] in "LM"
+
+
+def normalize(text):
+    """Lowercases and keeps letters and combining marks; everything else becomes a single space."""
+    chars = [char if _is_letter(char) else " " for char in text.lower()]
+    return " ".join("".join(chars).split())
+
+
+def sample_text(text, size=LANGUAGE_SAMPLE_CHARS):
+    """Up to `size` characters taken from the start, middle and end of the text."""
+    if len(text) <= size:
+        return text
+    third = size // 3
+    middle = len(text) // 2
+    return " ".join([text[:third], text[middle - third // 2:middle + third // 2], text[-third:]])
+
+
+def ngrams(text):
+    padded = f" {text} "
+    for n in (1, 2, 3):
+        for i in range(len(padded) - n + 1):
+            gram = padded[i:i + n]
+            if gram != " " * n and (n == 1 or gram.strip()):
+                yield gram
+
+
+class LanguageDetector:
+    def __init__(self, profiles_path=LANGUAGE_PROFILES_PATH):
+        with open(profiles_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.profiles = data["profiles"]
+        self.floor = data["floor"]
+
+    def detect(self, text):
+        """Returns (language, confidence) for the text's sample; language is None if nothing was recognized."""
+        sample = normalize(sample_text(text))
+        scripts = Counter(script for script in map(_script, sample) if script)
+        if not scripts:
+            return None, 0.0
+
+        script, count = scripts.most_common(1)[0]
+        share = count / sum(scripts.values())
+        if script in ("HIRAGANA", "KATAKANA") or (script == "CJK" and (scripts["HIRAGANA"] or scripts["KATAKANA"])):
+            return "ja", share
+        if script in SCRIPT_LANGUAGES:
+            return SCRIPT_LANGUAGES[script], share
+
+        candidates = [language for language in PROFILE_LANGUAGES[script] if language in self.profiles]
+        if len(candidates) == 1:
+            return candidates[0], share
+        grams = Counter(ngrams(sample))
+        total = sum(grams.values())
+        if not total:
+            return None, 0.0
+        scores = {
+            language: sum(count * self.profiles[language].get(gram, self.floor) for gram, count in grams.items()) / total
+            for language in candidates
+        }
+        return self._decide(scores, total, share)
+
+    @staticmethod
+    def _decide(scores, total, share):
+        """
+        Softmax over the per-n-gram log-likelihoods, scaled as if the sample had
+        at most 60 independent n-grams so long samples do not look certain by
+        size alone. The script share discounts mixed-script samples.
+        """
+        weight = min(total, 60)
+        best = max(scores.values())
+        exp = {language: math.exp((score - best) * weight) for language, score in scores.items()}
+        language = max(exp, key=exp.get)
+        return language, round(share * exp[language] / sum(exp.values()), 4)
+
+
+def build_profiles(source_dir, output_path=LANGUAGE_PROFILES_PATH):
+    """Keeps the most frequent n-grams of each langdetect profile as log-probabilities."""
+    wanted = {language for languages in PROFILE_LANGUAGES.values() for language in languages}
+    profiles = {}
+    for language in sorted(wanted):
+        with open(os.path.join(source_dir, language), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        counts = Counter()
+        for gram, count in data["freq"].items():
+            if gram.strip():
+                counts[gram.lower()] += count
+        profile = {}
+        for n, size in PROFILE_SIZE.items():
+            grams = [(count, gram) for gram, count in counts.items() if len(gram) == n]
+            total = data["n_words"][n - 1]
+            for count, gram in sorted(grams, reverse=True)[:size]:
+                profile[gram] = round(math.log(count / total), 3)
+        profiles[language] = profile
+    floor = round(min(min(profile.values()) for profile in profiles.values()) - 2.0, 3)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"source": "langdetect 1.0.9 profiles (Apache-2.0)", "floor": floor, "profiles": profiles},
+                  f, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return {language: len(profile) for language, profile in profiles.items()}
+
+
+def evaluate(testset_path, detector, remote=None, min_confidence=0.0):
+    """Accuracy of the local detector (and optionally a remote detect function) on a JSONL set of {"text", "language"}."""
+    with open(testset_path, "r", encoding="utf-8") as f:
+        examples = [json.loads(line) for line in f if line.strip()]
+
+    local_correct = remote_correct = agree = low_confidence = 0
+    elapsed, mistakes = 0.0, []
+    for example in examples:
+        start = time.perf_counter()
+        language, confidence = detector.detect(example["text"])
+        elapsed += time.perf_counter() - start
+        local_correct += language == example["language"]
+        low_confidence += confidence < min_confidence
+        if language != example["language"]:
+            mistakes.append({"expected": example["language"], "detected": language, "confidence": confidence,
+                             "text": example["text"][:60]})
+        if remote:
+            remote_language = remote(example["text"])
+            remote_correct += remote_language == example["language"]
+            agree += remote_language == language
+
+    report = {
+        "examples": len(examples),
+        "local_accuracy": round(local_correct / len(examples), 4),
+        "local_mean_us": round(elapsed / len(examples) * 1e6, 1),
+        "below_min_confidence": low_confidence,
+        "mistakes": mistakes,
+    }
+    if remote:
+        report["remote_accuracy"] = round(remote_correct / len(examples), 4)
+        report["agreement"] = round(agree / len(examples), 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local language detector.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build-profiles", help="rebuild language_profiles.json from langdetect's profiles directory")
+    build.add_argument("source_dir")
+    check = sub.add_parser("evaluate", help='accuracy on a JSONL file of {"text", "language"}')
+    check.add_argument("testset")
+    check.add_argument("--remote", action="store_true", help="also query the Translator /detect API")
+    detect = sub.add_parser("detect")
+    detect.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "build-profiles":
+        print(json.dumps(build_profiles(args.source_dir)))
+        return
+
+    detector = LanguageDetector()
+    if args.command == "detect":
+        print(detector.detect(args.text))
+        return
+
+    remote = None
+    if args.remote:
+        from translate import detect_language_remote
+        remote = detect_language_remote
+    print(json.dumps(evaluate(args.testset, detector, remote, LANGUAGE_MIN_CONFIDENCE), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+"""
+BM25 keyword index over the chunk texts of a vector index.
+
+Embeddings rank exact statutory references ("Section 420", "Section 2(28)")
+and party names poorly; a keyword index ranks them well and needs no
+embeddings call. Each vector index has a SQLite FTS5 table next to it, holding
+the same chunk ids, texts and metadata. ingest.py fills it alongside the
+vectors; for an index ingested before that, rebuild it from the vector store:
+
+    python lexical.py --index past-cases
+
+casesearch.py fuses the keyword and vector rankings with reciprocal_rank_fusion.
+"""
+import os
+import re
+import json
+import argparse
+import threading
+from cache import SQLiteConnection
+
+LEXICAL_INDEX_DIR = os.getenv("LEXICAL_INDEX_DIR", "lexical_index")
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Queries with at most this many words besides statute references, citations and quoted phrases are answered by BM25 alone
+LEXICAL_ONLY_MAX_TERMS = int(os.getenv("LEXICAL_ONLY_MAX_TERMS", "2"))
+
+STOPWORDS = frozenset("""
+a an and are as at be by case cases find for from in is it of on or show similar the to under was were what which with
+""".split())
+
+# Words that only mean something inside a reference; alone they match nearly every chunk
+STATUTE_WORDS = frozenset("section sec s article art v vs".split())
+
+# "Section 420", "Sec. 2(28)", "s. 138", "Article 21", "Order 7 Rule 11"
+STATUTE_REFERENCE = re.compile(
+    r"\b(?:section|sec\.?|s\.|article|art\.?|rule|order|clause)\s*\d+[a-z]?(?:\s*\(\s*\w+\s*\))*", re.IGNORECASE
+)
+# "Sharma v. State of Punjab", "Sharma vs State"
+PARTY_NAMES = re.compile(r"\b\w+\s+vs?\.?\s+\w+", re.IGNORECASE)
+QUOTED = re.compile(r'"([^"]+)"')
+WORD = re.compile(r"\w+")
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def chunk_text_of(metadata):
+    """The chunk text stored in a vector's metadata (ingest.py writes summary_chunk, older data chunk)."""
+    return metadata.get("summary_chunk") or metadata.get("chunk") or ""
+
+
+def terms(text):
+    return [word for word in WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _phrase(text):
+    words = WORD.findall(text.lower())
+    return '"' + " ".join(words) + '"' if words else None
+
+
+def build_match_query(query):
+    """
+    FTS5 MATCH expression: any of the query terms, plus each statute reference,
+    party name pair and quoted phrase as an exact phrase, so "Section 2(28)"
+    outranks a chunk that merely mentions a section and the number 28.
+    """
+    parts = [f'"{term}"' for term in dict.fromkeys(terms(query)) if term not in STATUTE_WORDS]
+    for phrase in STATUTE_REFERENCE.findall(query) + PARTY_NAMES.findall(query) + QUOTED.findall(query):
+        phrase = _phrase(phrase)
+        if phrase and phrase not in parts:
+            parts.append(phrase)
+    return " OR ".join(parts)
+
+
+def is_lexical_query(query):
+    """True for queries that are essentially a statute reference, a citation, a party name or a quoted phrase."""
+    remainder = query
+    found = False
+    for pattern in (STATUTE_REFERENCE, PARTY_NAMES, QUOTED):
+        remainder, count = pattern.subn(" ", remainder)
+        found = found or count > 0
+    return found and len(terms(remainder)) <= LEXICAL_ONLY_MAX_TERMS
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """
+    Fuses ranked match lists (best first) into one: each match scores the sum of
+    1 / (k + rank) over the lists it appears in. Returns Pinecone-shaped dicts.
+    """
+    fused = {}
+    for matches in rankings:
+        for rank, match in enumerate(matches, start=1):
+            entry = fused.setdefault(match.get("id"), {"id": match.get("id"), "score": 0.0, "metadata": match.get("metadata") or {}})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+
+
+class LexicalIndex:
+    """
+    BM25 over chunk texts, stored in SQLite FTS5 (an external-content table kept
+    in sync with the chunks table by triggers). upsert/delete take the same
+    input as the vector index, so both can be written together. The connection
+    is shared by ingestion and request threads, so each statement and its
+    commit run under one lock: a commit must not carry another thread's
+    half-written batch, and a search must not read it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = SQLiteConnection(path)
+        self._lock = threading.Lock()
+        self._db.execute("CREATE TABLE IF NOT EXISTS chunks (row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT, metadata TEXT)")
+        self._db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                text, content='chunks', content_rowid='row', tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        self._db.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts (rowid, text) VALUES (new.row, new.text);
+            END
+        """)
+        self._db.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.row, old.text);
+            END
+        """)
+        self._db.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_update AFTER UPDATE ON chunks BEGIN
+                INSERT INTO chunks_fts (chunks_fts, rowid, text) VALUES ('delete', old.row, old.text);
+                INSERT INTO chunks_fts (rowid, text) VALUES (new.row, new.text);
+            END
+        """)
+        self._db.commit()
+
+    def upsert(self, vectors):
+        """Indexes the chunk text of each {"id", "metadata"} vector dict (values are ignored)."""
+        rows = [
+            (str(vector["id"]), chunk_text_of(vector.get("metadata") or {}), json.dumps(vector.get("metadata") or {}))
+            for vector in vectors
+        ]
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO chunks (id, text, metadata) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET text = excluded.text, metadata = excluded.metadata",
+                rows,
+            )
+            self._db.commit()
+        return {"upserted_count": len(rows)}
+
+    def delete(self, ids):
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE id = ?", [(str(vector_id),) for vector_id in ids])
+            self._db.commit()
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def search(self, query, top_k=10):
+        """Returns the top_k chunks by BM25 as Pinecone-shaped matches ({"id", "score", "metadata"}), best first."""
+        match_query = build_match_query(query)
+        if not match_query:
+            return []
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT c.id, c.metadata, f.score FROM ("
+                "  SELECT rowid, bm25(chunks_fts) AS score FROM chunks_fts WHERE chunks_fts MATCH ? ORDER BY score LIMIT ?"
+                ") f JOIN chunks c ON c.row = f.rowid ORDER BY f.score",
+                (match_query, top_k),
+            ).fetchall()
+        # FTS5's bm25() is negated so that lower sorts first
+        return [{"id": vector_id, "score": -score, "metadata": json.loads(metadata)} for vector_id, metadata, score in rows]
+
+
+def get_lexical_index(name):
+    """Returns the keyword index that mirrors the vector index called `name`."""
+    with _indexes_lock:
+        if name not in _indexes:
+            _indexes[name] = LexicalIndex(os.path.join(LEXICAL_INDEX_DIR, f"{name}.db"))
+        return _indexes[name]
+
+
+def rebuild_from_vector_index(name, page_size=100):
+    """Copies every chunk of the vector index `name` into its keyword index; returns the number indexed."""
+    from vectorstore import get_index
+
+    index, lexical = get_index(name), get_lexical_index(name)
+    indexed = 0
+    for ids in index.list(limit=page_size):
+        vectors = index.fetch(ids=list(ids))["vectors"]
+        lexical.upsert([{"id": vector_id, "metadata": vector.get("metadata") or {}} for vector_id, vector in vectors.items()])
+        indexed += len(vectors)
+        print(f"Indexed {indexed} chunks of {name}")
+    return indexed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild the BM25 keyword index of a vector index.")
+    parser.add_argument("--index", required=True)
+    args = parser.parse_args()
+    print(f"✅ {rebuild_from_vector_index(args.index)} chunks indexed")
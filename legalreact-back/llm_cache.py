@@ -0,0 +1,281 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from langchain_core.messages import AIMessage, AIMessageChunk
+from cache import TieredCache
+
+# Completions shared by every call site, keyed by (deployment, temperature, normalized messages)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "5000"))
+LLM_CACHE_DISK_MB = int(os.getenv("LLM_CACHE_DISK_MB", "512"))
+# Seconds a coalesced caller waits for the in-flight request before calling the model itself
+LLM_CACHE_WAIT_SECONDS = float(os.getenv("LLM_CACHE_WAIT_SECONDS", "120"))
+
+# Seconds a completion stays valid per call site; LLM_CACHE_TTL_<SITE> overrides, 0 disables caching for the site
+DAY = 24 * 3600
+DEFAULT_TTLS = {
+    "classify_query": 30 * DAY,
+    "classify_document_type": 30 * DAY,
+    "document_generation": 7 * DAY,
+    "extract_case_details": 7 * DAY,
+    "get_verdict": 1 * DAY,
+    "extract_summary": 30 * DAY,
+    "summarize_chunk": 30 * DAY,
+}
+DEFAULT_TTL = int(os.getenv("LLM_CACHE_DEFAULT_TTL", str(DAY)))
+
+llm_response_cache = TieredCache(
+    "llm",
+    max_memory_items=LLM_CACHE_MEMORY_ITEMS,
+    max_disk_bytes=LLM_CACHE_DISK_MB * 1024 * 1024,
+)
+
+_lock = threading.Lock()
+_in_flight = {}
+_site_stats = {}
+_upstream_tasks = set()  # strong references, so a running upstream call is not garbage-collected
+
+
+def site_ttl(call_site):
+    return int(os.getenv(f"LLM_CACHE_TTL_{call_site.upper()}", DEFAULT_TTLS.get(call_site, DEFAULT_TTL)))
+
+
+def _normalize_messages(messages):
+    """Turns a prompt string, role/content dicts or langchain messages into [[role, content], ...]."""
+    if isinstance(messages, str):
+        messages = [{"role": "user", "content": messages}]
+    normalized = []
+    for message in messages:
+        if isinstance(message, dict):
+            role, content = message.get("role", "user"), message.get("content", "")
+        else:
+            role, content = message.type, message.content
+        role = {"human": "user", "ai": "assistant"}.get(role, role)
+        normalized.append([role, re.sub(r"\s+", " ", str(content)).strip()])
+    return normalized
+
+
+def cache_key(llm, messages):
+    deployment = getattr(llm, "deployment_name", None) or getattr(llm, "model_name", None)
+    payload = json.dumps([deployment, getattr(llm, "temperature", None), _normalize_messages(messages)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _stats(call_site):
+    return _site_stats.setdefault(call_site, {"hits": 0, "misses": 0, "coalesced": 0, "errors": 0, "store_errors": 0, "upstream_seconds": 0.0})
+
+
+def _cached(key, call_site):
+    value = llm_response_cache.get(key)
+    if value is None:
+        return None
+    with _lock:
+        _stats(call_site)["hits"] += 1
+    return AIMessage(content=json.loads(value)["content"], response_metadata={"cached": True})
+
+
+def _store(key, call_site, content, ttl):
+    """Caches a completion, best-effort: a failed write (locked or full disk) must not fail a paid-for completion."""
+    try:
+        llm_response_cache.set(key, json.dumps({"content": content}, ensure_ascii=False).encode("utf-8"), ttl=ttl)
+    except Exception as e:
+        print(f"⚠️ LLM cache store failed for {call_site}: {e}")
+        with _lock:
+            _stats(call_site)["store_errors"] += 1
+
+
+def _join(key, call_site):
+    """Returns (future, owner): owner is True for the first caller of key, which must resolve the future."""
+    with _lock:
+        stats = _stats(call_site)
+        leader = _in_flight.get(key)
+        if leader is None:
+            leader = _in_flight[key] = Future()
+            stats["misses"] += 1
+            return leader, True
+        stats["coalesced"] += 1
+        return leader, False
+
+
+def _failed(call_site, leader, error):
+    with _lock:
+        _stats(call_site)["errors"] += 1
+    leader.set_exception(error)
+
+
+def _done(key, call_site, started):
+    with _lock:
+        _stats(call_site)["upstream_seconds"] += time.perf_counter() - started
+        _in_flight.pop(key, None)
+
+
+def cached_invoke(llm, messages, call_site):
+    """
+    llm.invoke(messages) through the shared response cache. Concurrent identical
+    requests wait for the first one instead of each calling the model. Cache hits
+    are AIMessages with response_metadata["cached"] set and no usage metadata.
+    """
+    ttl = site_ttl(call_site)
+    if not LLM_CACHE_ENABLED or ttl <= 0:
+        return llm.invoke(messages)
+
+    key = cache_key(llm, messages)
+    cached = _cached(key, call_site)
+    if cached is not None:
+        return cached
+
+    leader, owner = _join(key, call_site)
+    if not owner:
+        try:
+            return leader.result(timeout=LLM_CACHE_WAIT_SECONDS)
+        except FutureTimeoutError:
+            return llm.invoke(messages)
+
+    started = time.perf_counter()
+    try:
+        try:
+            response = llm.invoke(messages)
+        except Exception as e:
+            _failed(call_site, leader, e)
+            raise
+        leader.set_result(response)
+        _store(key, call_site, response.content, ttl)
+        return response
+    finally:
+        _done(key, call_site, started)
+
+
+async def _aresolve(llm, messages, key, call_site, ttl, leader):
+    """Makes the upstream call for a coalesced key and resolves leader with its outcome."""
+    started = time.perf_counter()
+    try:
+        try:
+            response = await llm.ainvoke(messages)
+        except BaseException as e:  # includes cancellation at loop shutdown, so waiters are never left hanging
+            _failed(call_site, leader, e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        leader.set_result(response)
+        await asyncio.to_thread(_store, key, call_site, response.content, ttl)
+    finally:
+        _done(key, call_site, started)
+
+
+async def acached_invoke(llm, messages, call_site):
+    """
+    cached_invoke for llm.ainvoke. Shares the cache and the in-flight requests
+    with sync callers, so a sync and an async request for the same prompt also
+    make a single model call. The cache lookup runs in a thread, since a miss
+    in memory reads SQLite. The upstream call runs in its own task, so a
+    cancelled caller (say, a client that disconnected) does not abort it for
+    the others waiting on the same prompt.
+    """
+    ttl = site_ttl(call_site)
+    if not LLM_CACHE_ENABLED or ttl <= 0:
+        return await llm.ainvoke(messages)
+
+    key = cache_key(llm, messages)
+    cached = await asyncio.to_thread(_cached, key, call_site)
+    if cached is not None:
+        return cached
+
+    leader, owner = _join(key, call_site)
+    if owner:
+        task = asyncio.get_running_loop().create_task(_aresolve(llm, messages, key, call_site, ttl, leader))
+        _upstream_tasks.add(task)
+        task.add_done_callback(_upstream_tasks.discard)
+    # shield: cancelling this caller must not cancel the shared future
+    waiting = asyncio.shield(asyncio.wrap_future(leader))
+    if owner:
+        return await waiting
+    try:
+        return await asyncio.wait_for(waiting, LLM_CACHE_WAIT_SECONDS)
+    except asyncio.TimeoutError:
+        return await llm.ainvoke(messages)
+
+
+def cached_stream(llm, messages, call_site):
+    """
+    llm.stream(messages) through the same cache as cached_invoke: a hit is yielded
+    as one chunk, a miss is streamed from the model and stored once complete.
+    Streams are not coalesced.
+    """
+    ttl = site_ttl(call_site)
+    if not LLM_CACHE_ENABLED or ttl <= 0:
+        yield from llm.stream(messages)
+        return
+
+    key = cache_key(llm, messages)
+    cached = _cached(key, call_site)
+    if cached is not None:
+        yield AIMessageChunk(content=cached.content, response_metadata={"cached": True})
+        return
+
+    with _lock:
+        stats = _stats(call_site)
+        stats["misses"] += 1
+    started, parts = time.perf_counter(), []
+    try:
+        for chunk in llm.stream(messages):
+            parts.append(chunk.content or "")
+            yield chunk
+        _store(key, call_site, "".join(parts), ttl)
+    except Exception:
+        with _lock:
+            stats["errors"] += 1
+        raise
+    finally:
+        with _lock:
+            stats["upstream_seconds"] += time.perf_counter() - started
+
+
+async def acached_stream(llm, messages, call_site):
+    """cached_stream for llm.astream; the cache lookup and store run off the event loop."""
+    ttl = site_ttl(call_site)
+    if not LLM_CACHE_ENABLED or ttl <= 0:
+        async for chunk in llm.astream(messages):
+            yield chunk
+        return
+
+    key = cache_key(llm, messages)
+    cached = await asyncio.to_thread(_cached, key, call_site)
+    if cached is not None:
+        yield AIMessageChunk(content=cached.content, response_metadata={"cached": True})
+        return
+
+    with _lock:
+        stats = _stats(call_site)
+        stats["misses"] += 1
+    started, parts = time.perf_counter(), []
+    try:
+        async for chunk in llm.astream(messages):
+            parts.append(chunk.content or "")
+            yield chunk
+        await asyncio.to_thread(_store, key, call_site, "".join(parts), ttl)
+    except Exception:
+        with _lock:
+            stats["errors"] += 1
+        raise
+    finally:
+        with _lock:
+            stats["upstream_seconds"] += time.perf_counter() - started
+
+
+def llm_cache_stats():
+    with _lock:
+        sites = {}
+        for call_site, stats in _site_stats.items():
+            lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+            sites[call_site] = {
+                **stats,
+                "upstream_seconds": round(stats["upstream_seconds"], 3),
+                "hit_ratio": round((stats["hits"] + stats["coalesced"]) / lookups, 4) if lookups else 0.0,
+                "ttl_seconds": site_ttl(call_site),
+            }
+    return {"enabled": LLM_CACHE_ENABLED, "sites": sites, "cache": llm_response_cache.get_stats()}
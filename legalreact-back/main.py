@@ -1,34 +1,30 @@
 import os
-from flask import Flask, request, jsonify, render_template
-from langgraph.graph import Graph
-from langchain_openai import AzureChatOpenAI
-from casesearch import search_cases 
-from verdict import process_case
-from formatter import classify_document_type, fetch_template_from_blob, extract_placeholders, extract_json_from_response, fill_document_with_gpt, generate_extraction_prompt
-from summarisation import extract_summary  # Import summarization logic
-from translate import upload_pdf_to_blob, process_uploaded_document  # Import translation functions
+import json
+import time
+import uuid
+import threading
+from flask import Flask, request, jsonify, render_template, Response, stream_with_context
+from uploads import list_recent_uploads
+from ocr_cache import ocr_cache_stats
+from translation_memory import memory_stats as translation_memory_stats
+from embeddings import cache_stats as embedding_cache_stats
+from router import route_query, router_stats
+from jobs import JobQueue, QueueFullError, JOB_EVENTS_TIMEOUT_SECONDS
+from llm_cache import cached_invoke, llm_cache_stats
+from clients import get_chat_llm, pool_stats
+from vectorstore import filter_stats as vector_filter_stats
+from subsystems import subsystem, loaded, preload, warm_up, startup_stats, SubsystemUnavailable
 from flask_cors import CORS 
 
-OPENAI_API_KEY = os.getenv("OPENAI_GPT_API_KEY")
-AZURE_ENDPOINT = os.getenv("OPENAI_GPT_ENDPOINT")
-
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o-mini",
-    azure_endpoint=AZURE_ENDPOINT,
-    api_key=OPENAI_API_KEY,
-    api_version="2024-10-21",
-    temperature=0.2
-)
-
 app = Flask(__name__)
 CORS(app)
 
-def classify_query(data):
-    user_input = data.get("user_input", "").strip() if isinstance(data, dict) else str(data).strip()
+job_queue = JobQueue()
 
-    if not user_input:
-        return "unknown", data  # Ensure it always returns a tuple (classification, data)
+# Agent modules are imported on first use; STARTUP_PRELOAD imports them now (see subsystems.py)
+preload()
 
+def llm_classify_query(user_input):
     prompt = f"""
     Classify the following user query:
     - "case_search" if searching for similar legal cases.
@@ -39,25 +35,44 @@ def classify_query(data):
     Output (case_search or verdict_prediction or document_generation):
     """
 
-    response = llm.invoke(prompt)
+    response = cached_invoke(get_chat_llm(), prompt, "classify_query")
     classification = response.content.strip().lower()
 
-    return (classification if classification in ["case_search", "verdict_prediction", "document_generation"] else "unknown", data)
+    return classification if classification in ["case_search", "verdict_prediction", "document_generation"] else "unknown"
+
+
+def classify_query(data):
+    user_input = data.get("user_input", "").strip() if isinstance(data, dict) else str(data).strip()
+
+    if not user_input:
+        return "unknown", data  # Ensure it always returns a tuple (classification, data)
+
+    # Local rules/centroids first; the LLM is only asked when the router is not confident
+    classification = route_query(user_input, llm_classify_query)
+
+    return (classification, data)
 
 
 def case_search_agent(data):
+    if isinstance(data, tuple):  # the graph passes the classifier's (classification, data)
+        _, data = data
     query = data.get("user_input", "") if isinstance(data, dict) else str(data)
     if not query:
         return {"error": "No query provided."}
-    result = search_cases(query)
+    try:
+        result = subsystem("case_search").search_cases(query)
+    except ValueError as e:  # vector store not configured
+        return {"error": str(e)}
     return {"result": result}
 
 
 def verdict_agent(data):
+    if isinstance(data, tuple):  # the graph passes the classifier's (classification, data)
+        _, data = data
     case_input = data.get("user_input", "") if isinstance(data, dict) else str(data)
     if not case_input:
         return {"error": "No case input provided."}
-    return process_case(case_input)
+    return subsystem("verdict").process_case(case_input)
 
 
 def document_generation(inputs):
@@ -73,27 +88,28 @@ def document_generation(inputs):
     if not user_query:
         return {"error": "User input is missing or empty."}
 
-    document_type = classify_document_type(user_query)
+    formatter = subsystem("documents")
+    document_type = formatter.classify_document_type(user_query)
     if not document_type:
         return {"error": "Could not determine document type."}
 
-    template_path = fetch_template_from_blob(document_type)
-    if not template_path:
+    template = formatter.fetch_template_from_blob(document_type)
+    if not template:
         print("Error: Template fetching failed, stopping execution.")
         return  # Stop execution if template fetching fails
 
-    placeholders = extract_placeholders(template_path)
+    placeholders = formatter.extract_placeholders(template)
     if not placeholders:
         return {"error": "No placeholders found in the template."}
 
-    extraction_prompt = generate_extraction_prompt(user_query, document_type, placeholders)
-    response = llm.invoke([{ "role": "user", "content": extraction_prompt }])
-    extracted_data = extract_json_from_response(response.content.strip())
+    extraction_prompt = formatter.generate_extraction_prompt(user_query, document_type, placeholders)
+    response = cached_invoke(get_chat_llm(), [{ "role": "user", "content": extraction_prompt }], "document_generation")
+    extracted_data = formatter.extract_json_from_response(response.content.strip())
 
     if not extracted_data:
         return {"error": "GPT response format is incorrect."}
 
-    final_doc_path = fill_document_with_gpt(template_path, extracted_data)
+    final_doc_path = formatter.fill_document_with_gpt(template, extracted_data)
     if not final_doc_path:
         return {"error": "Failed to generate document."}
 
@@ -101,14 +117,9 @@ def document_generation(inputs):
 
 
 def summarization_agent():
-    result = extract_summary()
+    result = subsystem("summarisation").extract_summary()
     return result
 
-workflow = Graph()
-workflow.add_node("classifier", classify_query)
-workflow.add_node("case_search_agent", case_search_agent)
-workflow.add_node("verdict_agent", verdict_agent)
-workflow.add_node("document_generation", document_generation)
 
 def route_decision(inputs):
     classification, data = inputs  # Extract classification and data
@@ -126,12 +137,103 @@ def route_decision(inputs):
     else:
         return None
 
-workflow.add_conditional_edges("classifier", route_decision)
-workflow.set_finish_point("case_search_agent")
-workflow.set_finish_point("verdict_agent")
-workflow.set_finish_point("document_generation")
-workflow.set_entry_point("classifier")
-app_workflow = workflow.compile()
+def build_workflow(classifier=classify_query, case_search=case_search_agent, verdict=verdict_agent, documents=document_generation):
+    """Compiles the agent graph; asgi.py passes the async agents to get a graph for ainvoke."""
+    from langgraph.graph import Graph
+
+    workflow = Graph()
+    workflow.add_node("classifier", classifier)
+    workflow.add_node("case_search_agent", case_search)
+    workflow.add_node("verdict_agent", verdict)
+    workflow.add_node("document_generation", documents)
+    workflow.add_conditional_edges("classifier", route_decision)
+    workflow.set_finish_point("case_search_agent")
+    workflow.set_finish_point("verdict_agent")
+    workflow.set_finish_point("document_generation")
+    workflow.set_entry_point("classifier")
+    return workflow.compile()
+
+
+_workflow = None
+_workflow_lock = threading.Lock()
+
+
+def get_workflow():
+    """The compiled graph, built on the first non-streaming /invoke (langgraph is slow to import)."""
+    global _workflow
+    with _workflow_lock:
+        if _workflow is None:
+            _workflow = build_workflow()
+        return _workflow
+
+def requested_stream_format():
+    """
+    Returns "sse" or "ndjson" when the client asked for a streamed response
+    (via ?stream=sse|ndjson or the Accept header), otherwise None.
+    """
+    return parse_stream_format(request.args.get("stream") or request.form.get("stream"), request.headers.get("Accept", ""))
+
+
+def parse_stream_format(requested, accept):
+    requested = (requested or "").lower()
+    if requested in ("sse", "ndjson"):
+        return requested
+    if "text/event-stream" in accept:
+        return "sse"
+    if "application/x-ndjson" in accept:
+        return "ndjson"
+    return None
+
+
+def stream_events(events, stream_format):
+    """Wraps an iterator of (event, data) tuples in an SSE or NDJSON streaming response."""
+    def generate():
+        for event, data in events:
+            yield encode_event(event, data, stream_format)
+
+    return Response(stream_with_context(generate()), mimetype=stream_mimetype(stream_format), headers=STREAM_HEADERS)
+
+
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def stream_mimetype(stream_format):
+    return "text/event-stream" if stream_format == "sse" else "application/x-ndjson"
+
+
+def encode_event(event, data, stream_format):
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
+
+
+def invoke_events(data):
+    """Classifies the query, then streams verdict stages/tokens; other agents emit a single result."""
+    try:
+        classification, data = classify_query(data)
+        data["classification"] = classification
+        yield "classified", {"classification": classification}
+
+        if classification == "verdict_prediction":
+            yield from subsystem("verdict").process_case_stream(data["user_input"])
+        elif classification == "case_search":
+            yield "result", case_search_agent(data)
+        elif classification == "document_generation":
+            yield "result", document_generation((classification, data))
+        else:
+            yield "error", {"error": "Could not classify the query."}
+    except SubsystemUnavailable as e:
+        yield "error", {"error": str(e)}
+    except Exception as e:
+        # The response has already started, so a failure has to be reported in the stream
+        print(f"❌ /invoke stream failed: {e}")
+        yield "error", {"error": str(e)}
+
+
+@app.errorhandler(SubsystemUnavailable)
+def subsystem_unavailable(e):
+    return jsonify({"error": str(e)}), 503
+
 
 @app.route("/", methods=["GET"])
 def home():
@@ -143,7 +245,11 @@ def invoke_workflow():
     if not data or "user_input" not in data:
         return jsonify({"error": "user_input is required"}), 400
 
-    result = app_workflow.invoke(data)
+    stream_format = requested_stream_format()
+    if stream_format:
+        return stream_events(invoke_events(data), stream_format)
+
+    result = get_workflow().invoke(data)
     return jsonify(result)
 
 @app.route('/summarize', methods=['POST'])
@@ -152,10 +258,17 @@ def summarize():
     if not file:
         return jsonify({"error": "No file provided"}), 400
 
-    file_path = f"/tmp/{file.filename}"
-    file.save(file_path)
+    summarisation = subsystem("summarisation")
+    file_path, cleanup = save_upload(file)
+
+    stream_format = requested_stream_format()
+    if stream_format:
+        return stream_events(cleaned_up(summarisation.extract_summary_stream(file_path, file.filename), cleanup), stream_format)
 
-    result = extract_summary(file_path, file.filename)  # Call your function
+    try:
+        result = summarisation.extract_summary(file_path, file.filename)  # Call your function
+    finally:
+        cleanup()
     return jsonify(result)
 
 @app.route('/translatedoc', methods=['POST'])
@@ -165,13 +278,139 @@ def translate_document():
     if not file or not target_language:
         return jsonify({"error": "File and target language are required."}), 400
 
-    file_path = f"/tmp/{file.filename}"
-    file.save(file_path)
-    uploaded_filename = upload_pdf_to_blob(file_path, file.filename)
-    os.remove(file_path)
+    translate = subsystem("translation")
+    file_path, cleanup = save_upload(file)
+    try:
+        document = translate.upload_pdf_to_blob(file_path, file.filename)
+    finally:
+        cleanup()
 
-    result = process_uploaded_document(target_language)
+    result = translate.process_uploaded_document(target_language, document)
     return jsonify(result)
 
+def translation_events(file_path, file_name, target_language):
+    translate = subsystem("translation")
+    document = translate.upload_pdf_to_blob(file_path, file_name)
+    yield "uploaded", {"file_name": file_name, "blob_name": document["blob_name"]}
+    result = translate.process_uploaded_document(target_language, document)
+    yield ("error" if "error" in result else "result"), result
+
+
+def save_upload(file):
+    """Saves an upload under a unique temp path so concurrent requests and jobs never share a file."""
+    file_path = f"/tmp/{uuid.uuid4().hex}_{os.path.basename(file.filename)}"
+    file.save(file_path)
+    return file_path, lambda: os.path.exists(file_path) and os.remove(file_path)
+
+
+def cleaned_up(events, cleanup):
+    """Yields the events, then runs cleanup once the stream ends or the client disconnects."""
+    try:
+        yield from events
+    finally:
+        cleanup()
+
+
+def job_accepted(job_id):
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}), 202
+
+
+@app.route("/jobs/summarize", methods=["POST"])
+def submit_summarize_job():
+    file = request.files.get("file")
+    if not file:
+        return jsonify({"error": "No file provided"}), 400
+
+    extract_summary_stream = subsystem("summarisation").extract_summary_stream
+    file_path, cleanup = save_upload(file)
+    try:
+        job_id = job_queue.submit("summarize", extract_summary_stream, file_path, file.filename, cleanup=cleanup)
+    except QueueFullError as e:
+        cleanup()
+        return jsonify({"error": str(e)}), 503
+    job_queue.purge()
+    return job_accepted(job_id)
+
+
+@app.route("/jobs/translatedoc", methods=["POST"])
+def submit_translate_job():
+    file = request.files.get("file")
+    target_language = request.form.get("target_language")
+    if not file or not target_language:
+        return jsonify({"error": "File and target language are required."}), 400
+
+    subsystem("translation")
+    file_path, cleanup = save_upload(file)
+    try:
+        job_id = job_queue.submit("translatedoc", translation_events, file_path, file.filename, target_language, cleanup=cleanup)
+    except QueueFullError as e:
+        cleanup()
+        return jsonify({"error": str(e)}), 503
+    job_queue.purge()
+    return job_accepted(job_id)
+
+
+@app.route("/documents/recent", methods=["GET"])
+def recent_documents():
+    container = os.getenv("AZURE_CONTAINER_NAME")
+    # A non-numeric limit falls back to the default; SQLite reads a negative LIMIT as "no limit"
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+    return jsonify({"documents": list_recent_uploads(container, limit)})
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    job_queue.reconcile(job_id)
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def stream_job(job_id):
+    if not job_queue.get(job_id):
+        return jsonify({"error": "Job not found"}), 404
+
+    def events():
+        sent = 0
+        deadline = time.monotonic() + JOB_EVENTS_TIMEOUT_SECONDS
+        while True:
+            job_queue.reconcile(job_id)
+            job = job_queue.get(job_id)
+            for item in job["progress"][sent:]:
+                yield item["event"], item["data"]
+            sent = len(job["progress"])
+            if job["status"] in ("succeeded", "failed"):
+                yield ("result" if job["status"] == "succeeded" else "error"), job["result"]
+                return
+            if time.monotonic() > deadline:
+                # The job keeps running; only this stream stops holding a server thread
+                yield "pending", {"status": job["status"], "status_url": f"/jobs/{job_id}"}
+                return
+            time.sleep(0.5)
+
+    return stream_events(events(), requested_stream_format() or "sse")
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({
+        "embedding_cache": embedding_cache_stats(),
+        "router": router_stats(),
+        "case_search": subsystem("case_search").search_stats() if loaded("case_search") else None,
+        "law_search": subsystem("verdict").law_search_stats() if loaded("verdict") else None,
+        "vector_filters": vector_filter_stats(),
+        "jobs": job_queue.get_stats(),
+        "ocr_cache": ocr_cache_stats(),
+        "templates": subsystem("documents").template_cache.get_stats() if loaded("documents") else None,
+        "translation_memory": translation_memory_stats(),
+        "language_detection": subsystem("translation").language_detection_stats() if loaded("translation") else None,
+        "llm_cache": llm_cache_stats(),
+        "clients": pool_stats(),
+        "startup": startup_stats(),
+    })
+
 if __name__ == "__main__":
+    warm_up()
     app.run(debug=True)
@@ -0,0 +1,98 @@
+"""
+Ingestion manifest: what each indexed blob looked like when it was indexed.
+
+For every (index, blob) it records the blob's ETag, a content hash and the
+ids of the chunks stored for it (chunk ids are content hashes, see
+chunking.chunk_id), together with each chunk's placement in the document
+(index, pages, section). ingest.py compares a blob against its entry to
+skip unchanged blobs, embed only new chunks and delete the chunks a new
+version no longer has.
+"""
+import os
+import json
+import time
+import threading
+from cache import SQLiteConnection
+
+INGEST_MANIFEST_PATH = os.getenv("INGEST_MANIFEST_PATH", "ingest_manifest.db")
+
+
+class IngestManifest:
+    def __init__(self, path=INGEST_MANIFEST_PATH):
+        self._lock = threading.Lock()
+        self._db = SQLiteConnection(path)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                index_name TEXT, blob TEXT, etag TEXT, content_hash TEXT, chunk_count INTEGER, indexed_at REAL,
+                PRIMARY KEY (index_name, blob)
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                index_name TEXT, chunk_id TEXT, blob TEXT, placement TEXT, PRIMARY KEY (index_name, chunk_id)
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS chunks_blob ON chunks (index_name, blob)")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS failures (
+                index_name TEXT, blob TEXT, etag TEXT, error TEXT, failed_at REAL, PRIMARY KEY (index_name, blob)
+            )
+        """)
+        self._db.commit()
+
+    def documents(self, index_name):
+        """{blob: {"etag", "content_hash"}} for every blob indexed into index_name."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT blob, etag, content_hash FROM documents WHERE index_name = ?", (index_name,)
+            ).fetchall()
+        return {blob: {"etag": etag, "content_hash": content_hash} for blob, etag, content_hash in rows}
+
+    def chunks(self, index_name, blob):
+        """{chunk_id: placement} of the chunks stored for blob."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT chunk_id, placement FROM chunks WHERE index_name = ? AND blob = ?", (index_name, blob)
+            ).fetchall()
+        return {chunk_id: json.loads(placement) for chunk_id, placement in rows}
+
+    def record(self, index_name, blob, etag, content_hash, placements):
+        """Replaces the entry of blob with its new ETag, content hash and {chunk_id: placement}."""
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE index_name = ? AND blob = ?", (index_name, blob))
+            self._db.executemany(
+                "INSERT OR REPLACE INTO chunks (index_name, chunk_id, blob, placement) VALUES (?, ?, ?, ?)",
+                [(index_name, chunk_id, blob, json.dumps(placement)) for chunk_id, placement in placements.items()],
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (index_name, blob, etag, content_hash, chunk_count, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (index_name, blob, etag, content_hash, len(placements), time.time()),
+            )
+            self._db.execute("DELETE FROM failures WHERE index_name = ? AND blob = ?", (index_name, blob))
+            self._db.commit()
+
+    def record_etag(self, index_name, blob, etag):
+        """A new ETag for content that has not changed (e.g. the same file uploaded again)."""
+        with self._lock:
+            self._db.execute("UPDATE documents SET etag = ? WHERE index_name = ? AND blob = ?", (etag, index_name, blob))
+            self._db.commit()
+
+    def record_failure(self, index_name, blob, etag, error):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO failures (index_name, blob, etag, error, failed_at) VALUES (?, ?, ?, ?, ?)",
+                (index_name, blob, etag, str(error), time.time()),
+            )
+            self._db.commit()
+
+    def remove(self, index_name, blob):
+        with self._lock:
+            self._db.execute("DELETE FROM chunks WHERE index_name = ? AND blob = ?", (index_name, blob))
+            self._db.execute("DELETE FROM documents WHERE index_name = ? AND blob = ?", (index_name, blob))
+            self._db.execute("DELETE FROM failures WHERE index_name = ? AND blob = ?", (index_name, blob))
+            self._db.commit()
+
+    def failure_count(self, index_name):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM failures WHERE index_name = ?", (index_name,)).fetchone()[0]
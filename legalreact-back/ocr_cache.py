@@ -0,0 +1,87 @@
+import os
+import json
+import asyncio
+import threading
+from cache import TieredCache
+
+# Document Intelligence results keyed by (sha256 of the PDF bytes, analysis model)
+OCR_CACHE_MEMORY_ITEMS = int(os.getenv("OCR_CACHE_MEMORY_ITEMS", "64"))
+OCR_CACHE_DISK_MB = int(os.getenv("OCR_CACHE_DISK_MB", "2048"))
+
+ocr_cache = TieredCache(
+    "ocr",
+    max_memory_items=OCR_CACHE_MEMORY_ITEMS,
+    max_disk_bytes=OCR_CACHE_DISK_MB * 1024 * 1024,
+)
+
+_stats_lock = threading.Lock()
+_bytes_saved = 0
+_uncacheable = 0
+
+
+def pages_from_result(result):
+    """Keeps only what the pipelines use from an AnalyzeResult: the text lines of each page."""
+    return [[line.content for line in page.lines] for page in result.pages]
+
+
+def analyze_cached(content_hash, model, analyze, document_size=None):
+    """
+    Returns the document's pages as lists of line strings.
+
+    On a cache hit Document Intelligence is skipped entirely; otherwise analyze()
+    (which must return an AnalyzeResult) is called and its pages are stored.
+    Documents without a content hash are analyzed without caching.
+    """
+    if not content_hash:
+        _count_uncacheable()
+        return pages_from_result(analyze())
+
+    key = f"{model}:{content_hash}"
+    cached = _lookup(key, document_size)
+    if cached is not None:
+        return cached
+    return _store(key, analyze())
+
+
+async def aanalyze_cached(content_hash, model, analyze, document_size=None):
+    """analyze_cached for async callers: analyze is a coroutine function and cache I/O runs off the event loop."""
+    if not content_hash:
+        _count_uncacheable()
+        return pages_from_result(await analyze())
+
+    key = f"{model}:{content_hash}"
+    cached = await asyncio.to_thread(_lookup, key, document_size)
+    if cached is not None:
+        return cached
+    result = await analyze()
+    return await asyncio.to_thread(_store, key, result)
+
+
+def _count_uncacheable():
+    global _uncacheable
+    with _stats_lock:
+        _uncacheable += 1
+
+
+def _lookup(key, document_size):
+    global _bytes_saved
+    cached = ocr_cache.get(key)
+    if cached is None:
+        return None
+    with _stats_lock:
+        _bytes_saved += document_size or 0
+    return json.loads(cached)
+
+
+def _store(key, result):
+    pages = pages_from_result(result)
+    ocr_cache.set(key, json.dumps(pages, ensure_ascii=False).encode("utf-8"))
+    return pages
+
+
+def ocr_cache_stats():
+    stats = ocr_cache.get_stats()
+    with _stats_lock:
+        stats["document_bytes_saved"] = _bytes_saved
+        stats["uncacheable_requests"] = _uncacheable
+    return stats
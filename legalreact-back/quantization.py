@@ -0,0 +1,138 @@
+"""
+Compact codes for the local vector index.
+
+A 1536-dim ada-002 vector is 6 KB as float32. The quantizers here shrink what a
+query has to scan:
+
+- int8: one byte per dimension (8-bit scalar quantization, per-dimension
+  range), 1.5 KB per vector, ~4x smaller.
+- pq:   product quantization; the vector is split into `subvectors` pieces and
+  each piece stored as the id of its nearest of 256 centroids, e.g. 96 bytes
+  per vector (64x smaller) with 96 subvectors.
+
+Scores from codes are approximate; LocalIndex re-ranks the best candidates
+with the full-precision vectors, which stay on disk in vectors.f32. int8 keeps
+recall@5 at 1.00 with the default VECTOR_STORE_RERANK_CANDIDATES (20). PQ codes
+are much coarser: bench_quantized_store.py measures recall@5 of 0.21 / 0.46 /
+0.69 at re-rank factors 10 / 50 / 200, so a PQ index needs the re-rank factor
+raised to the hundreds, and int8 is the default of `vectorstore.py quantize`.
+"""
+import numpy as np
+
+# Re-rank factor below which PQ recall drops sharply (vectorstore.py quantize warns)
+PQ_MIN_RERANK_CANDIDATES = 200
+
+# Rows decoded at a time while scoring, so the float32 temporaries stay in cache
+SCORE_BLOCK_ROWS = 1024
+PQ_SCORE_BLOCK_ROWS = 8192
+
+
+def _kmeans(sample, clusters, iterations, rng):
+    """Euclidean k-means; returns (clusters, dim) float32 centroids."""
+    centroids = sample[rng.choice(len(sample), clusters, replace=len(sample) < clusters)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(sample, centroids)
+        counts = np.bincount(assignment, minlength=clusters)
+        sums = np.stack([np.bincount(assignment, weights=sample[:, d], minlength=clusters) for d in range(sample.shape[1])], axis=1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids.astype(np.float32)
+
+
+def _nearest(vectors, centroids):
+    # argmin |x - c|^2 == argmax (2 x.c - |c|^2)
+    return np.argmax(2 * vectors @ centroids.T - (centroids ** 2).sum(axis=1), axis=1)
+
+
+class ScalarQuantizer:
+    """8-bit codes: each dimension's [low, high] range (from a training sample) mapped onto 0..255."""
+
+    kind = "int8"
+
+    def __init__(self, low, step):
+        self.low = np.asarray(low, dtype=np.float32)
+        self.step = np.asarray(step, dtype=np.float32)
+        self.code_size = len(self.low)
+
+    @classmethod
+    def train(cls, sample, **_):
+        low, high = sample.min(axis=0), sample.max(axis=0)
+        step = np.where(high > low, (high - low) / 255, 1.0)
+        return cls(low, step)
+
+    def encode(self, vectors):
+        return np.clip(np.rint((vectors - self.low) / self.step), 0, 255).astype(np.uint8)
+
+    def prepare(self, query):
+        # query . (low + code * step) == query . low + code . (query * step)
+        return (query * self.step).astype(np.float32), float(query @ self.low)
+
+    def score(self, prepared, codes):
+        weights, bias = prepared
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_BLOCK_ROWS):
+            block = np.asarray(codes[start:start + SCORE_BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + len(block)] = block @ weights + bias
+        return scores
+
+    def to_arrays(self):
+        return {"low": self.low, "step": self.step}
+
+
+class ProductQuantizer:
+    """One byte per subvector: the id of the nearest of 256 centroids trained for that slice of the dimensions."""
+
+    kind = "pq"
+
+    def __init__(self, centroids):
+        self.centroids = np.asarray(centroids, dtype=np.float32)  # (subvectors, 256, dimension / subvectors)
+        self.subvectors, _, self.subdimension = self.centroids.shape
+        self.code_size = self.subvectors
+
+    @classmethod
+    def train(cls, sample, subvectors=96, iterations=10, seed=0, **_):
+        dimension = sample.shape[1]
+        if dimension % subvectors:
+            raise ValueError(f"PQ subvectors ({subvectors}) must divide the dimension ({dimension})")
+        rng = np.random.default_rng(seed)
+        width = dimension // subvectors
+        return cls(np.stack([
+            _kmeans(sample[:, j * width:(j + 1) * width], 256, iterations, rng) for j in range(subvectors)
+        ]))
+
+    def encode(self, vectors):
+        pieces = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), self.subvectors, self.subdimension)
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j in range(self.subvectors):
+            codes[:, j] = _nearest(pieces[:, j], self.centroids[j])
+        return codes
+
+    def prepare(self, query):
+        # Lookup table: the query piece's inner product with every centroid of its subvector
+        return np.einsum("jkd,jd->jk", self.centroids, query.reshape(self.subvectors, self.subdimension))
+
+    def score(self, table, codes):
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), PQ_SCORE_BLOCK_ROWS):
+            block = np.asarray(codes[start:start + PQ_SCORE_BLOCK_ROWS])
+            total = np.zeros(len(block), dtype=np.float32)
+            for j in range(self.subvectors):
+                total += table[j][block[:, j]]
+            scores[start:start + len(block)] = total
+        return scores
+
+    def to_arrays(self):
+        return {"centroids": self.centroids}
+
+
+QUANTIZERS = {quantizer.kind: quantizer for quantizer in (ScalarQuantizer, ProductQuantizer)}
+
+
+def save_quantizer(quantizer, path):
+    with open(path, "wb") as f:
+        np.savez(f, kind=np.array(quantizer.kind), **quantizer.to_arrays())
+
+
+def load_quantizer(path):
+    arrays = dict(np.load(path))
+    return QUANTIZERS[str(arrays.pop("kind"))](**arrays)
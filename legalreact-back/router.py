@@ -0,0 +1,338 @@
+"""
+Local query router that sits in front of the LLM classifier in main.classify_query.
+
+Clear-cut queries are answered by keyword rules, then (once trained) by
+nearest embedding centroid. Only low-confidence queries fall back to the LLM.
+Those fallbacks are logged and become training data for the centroids:
+
+    python router.py train
+
+The log holds client queries verbatim. It rotates at ROUTER_LOG_MAX_MB,
+keeping ROUTER_LOG_BACKUPS old files, and ROUTER_LOG_ENABLED=false turns it
+off (the centroids then cannot be retrained from new traffic).
+
+Decisions are cached per normalized query for ROUTER_CACHE_TTL seconds, keyed
+with the centroid file's mtime, so retraining takes effect at once. When an
+audit disagrees with a local label, the LLM's label is served and cached.
+"""
+import os
+import re
+import json
+import random
+import argparse
+import logging
+import threading
+import logging.handlers
+import numpy as np
+from cache import TieredCache
+
+LABELS = ["case_search", "verdict_prediction", "document_generation"]
+
+ROUTER_CONFIDENCE_THRESHOLD = float(os.getenv("ROUTER_CONFIDENCE_THRESHOLD", "0.6"))
+ROUTER_AUDIT_RATE = float(os.getenv("ROUTER_AUDIT_RATE", "0.02"))  # share of local decisions re-checked by the LLM
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH", "router_log.jsonl")
+ROUTER_LOG_ENABLED = os.getenv("ROUTER_LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+ROUTER_LOG_MAX_MB = float(os.getenv("ROUTER_LOG_MAX_MB", "16"))
+ROUTER_LOG_BACKUPS = int(os.getenv("ROUTER_LOG_BACKUPS", "2"))
+ROUTER_CENTROIDS_PATH = os.getenv("ROUTER_CENTROIDS_PATH", "router_centroids.npz")
+ROUTER_CACHE_TTL = int(os.getenv("ROUTER_CACHE_TTL", str(7 * 24 * 3600)))  # seconds a routing decision is reused
+CENTROID_TEMPERATURE = 0.05
+
+# (pattern, label, weight): weights are combined per label as a noisy-or
+RULES = [
+    (r"\b(draft|drafting|prepare|create|generate|write|make)\b.{0,40}\b(agreement|nda|contract|deed|document|letter|notice|partnership)\b", "document_generation", 0.9),
+    (r"\b(non[- ]disclosure agreement|nda|partnership agreement|business partnership)\b", "document_generation", 0.5),
+    (r"\btemplate\b", "document_generation", 0.4),
+    (r"\b(verdict|outcome|predict|prediction|likely|chances?|will (i|we|they|he|she) win)\b", "verdict_prediction", 0.7),
+    (r"\b(guilty|acquitt\w*|convict\w*|liable|liability|sentence|punishment|penalty)\b", "verdict_prediction", 0.4),
+    (r"\b(what (would|will) (the )?court|how would (a|the) court)\b", "verdict_prediction", 0.7),
+    (r"\b(similar|past|previous|prior|related|relevant)\s+(cases|judgments|judgements|rulings|decisions)\b", "case_search", 0.9),
+    (r"\b(precedents?|case law|find (me )?(cases|judgments))\b", "case_search", 0.8),
+    (r"\b(search|find|look up|show)\b.{0,30}\b(cases?|judgments?|judgements?)\b", "case_search", 0.7),
+]
+_compiled_rules = [(re.compile(pattern, re.IGNORECASE), label, weight) for pattern, label, weight in RULES]
+
+_routing_cache = TieredCache("router", max_memory_items=5000, max_disk_bytes=16 * 1024 * 1024)
+_centroids = None
+_centroids_version = None  # mtime of the loaded centroid file, part of every routing cache key
+_centroids_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_decision_log = None
+_decision_log_lock = threading.Lock()
+stats = {
+    "queries": 0,
+    "cache_hits": 0,
+    "rules": 0,
+    "centroids": 0,
+    "llm_fallbacks": 0,
+    "audits": 0,
+    "audits_agreed": 0,
+}
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        stats[key] += amount
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+def _decide(scores):
+    """Returns (label, confidence) where confidence is the margin between the best two labels."""
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    (best, best_score), (_, second_score) = ranked[0], ranked[1]
+    return best, best_score - second_score
+
+
+def classify_by_rules(query):
+    scores = {label: 0.0 for label in LABELS}
+    for pattern, label, weight in _compiled_rules:
+        if pattern.search(query):
+            scores[label] = 1 - (1 - scores[label]) * (1 - weight)
+    return _decide(scores)
+
+
+def _centroid_file_version(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def load_centroids(path=ROUTER_CENTROIDS_PATH):
+    """
+    Loads trained label centroids, or returns None if the router has not been
+    trained. A retrained file (new mtime) is picked up on the next call.
+    """
+    global _centroids, _centroids_version
+    version = _centroid_file_version(path)
+    with _centroids_lock:
+        if version != _centroids_version:
+            _centroids = None
+            if version is not None:
+                data = np.load(path)
+                _centroids = {label: data[label] for label in LABELS if label in data}
+            _centroids_version = version
+        return _centroids
+
+
+def _centroid_decision(centroids, embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    vector /= np.linalg.norm(vector) or 1.0
+    sims = np.array([float(centroids[label] @ vector) if label in centroids else -1.0 for label in LABELS])
+    probs = np.exp((sims - sims.max()) / CENTROID_TEMPERATURE)
+    probs /= probs.sum()
+    return _decide(dict(zip(LABELS, probs)))
+
+
+def classify_by_centroids(query):
+    centroids = load_centroids()
+    if not centroids:
+        return None, 0.0
+    from embeddings import get_embedding  # cached, and reused by case search / verdict for the same text
+
+    return _centroid_decision(centroids, get_embedding(query))
+
+
+async def aclassify_by_centroids(query):
+    centroids = load_centroids()
+    if not centroids:
+        return None, 0.0
+    from embeddings import aget_embedding
+
+    return _centroid_decision(centroids, await aget_embedding(query))
+
+
+def _get_decision_log():
+    """The rotating JSONL logger behind _log_decision, opened on first use."""
+    global _decision_log
+    with _decision_log_lock:
+        if _decision_log is None:
+            handler = logging.handlers.RotatingFileHandler(
+                ROUTER_LOG_PATH, maxBytes=int(ROUTER_LOG_MAX_MB * 1024 * 1024),
+                backupCount=ROUTER_LOG_BACKUPS, encoding="utf-8",
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger = logging.getLogger("router.decisions")
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            _decision_log = logger
+        return _decision_log
+
+
+def _log_decision(query, label, source):
+    if not ROUTER_LOG_ENABLED:
+        return
+    try:
+        _get_decision_log().info(json.dumps({"query": query, "label": label, "source": source}, ensure_ascii=False))
+    except OSError as e:
+        print(f"Router log write failed: {e}")
+
+
+def _log_entries(log_path):
+    """Entries of the router log, oldest rotated file first."""
+    paths = [f"{log_path}.{n}" for n in range(ROUTER_LOG_BACKUPS, 0, -1)] + [log_path]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+
+def _route_key(query):
+    """The routing cache key: the normalized query and the centroids it was routed with."""
+    load_centroids()
+    return f"{_centroids_version}:{normalize_query(query)}"
+
+
+def _cached_route(key):
+    _count("queries")
+    cached = _routing_cache.get(key)
+    if cached is not None:
+        _count("cache_hits")
+        return cached.decode("utf-8")
+    return None
+
+
+def _confident(label, confidence, source):
+    if label is not None and confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+        _count(source)
+        return True
+    return False
+
+
+def _record_audit(query, label, llm_label):
+    """Logs the audit and returns the label to serve: the LLM's when it disagrees with a valid label."""
+    _count("audits")
+    _count("audits_agreed", int(llm_label == label))
+    _log_decision(query, llm_label, "llm_audit")
+    return llm_label if llm_label in LABELS else label
+
+
+def _record_fallback(query, label):
+    _count("llm_fallbacks")
+    _log_decision(query, label, "llm")
+
+
+def _remember(key, label):
+    if label in LABELS:
+        _routing_cache.set(key, label.encode("utf-8"), ttl=ROUTER_CACHE_TTL)
+    return label
+
+
+def route_query(query, llm_classify):
+    """
+    Returns one of LABELS or "unknown". llm_classify(query) is only called when
+    neither the rules nor the centroids are confident (or for sampled audits).
+    """
+    key = _route_key(query)
+    cached = _cached_route(key)
+    if cached is not None:
+        return cached
+
+    label, confidence = classify_by_rules(query)
+    source = "rules"
+    if confidence < ROUTER_CONFIDENCE_THRESHOLD:
+        label, confidence = classify_by_centroids(query)
+        source = "centroids"
+
+    if _confident(label, confidence, source):
+        if random.random() < ROUTER_AUDIT_RATE:
+            label = _record_audit(query, label, llm_classify(query))
+    else:
+        label = llm_classify(query)
+        _record_fallback(query, label)
+    return _remember(key, label)
+
+
+async def aroute_query(query, allm_classify):
+    """route_query for async callers; allm_classify is a coroutine function."""
+    key = _route_key(query)
+    cached = _cached_route(key)
+    if cached is not None:
+        return cached
+
+    label, confidence = classify_by_rules(query)
+    source = "rules"
+    if confidence < ROUTER_CONFIDENCE_THRESHOLD:
+        label, confidence = await aclassify_by_centroids(query)
+        source = "centroids"
+
+    if _confident(label, confidence, source):
+        if random.random() < ROUTER_AUDIT_RATE:
+            label = _record_audit(query, label, await allm_classify(query))
+    else:
+        label = await allm_classify(query)
+        _record_fallback(query, label)
+    return _remember(key, label)
+
+
+def router_stats():
+    with _stats_lock:
+        snapshot = dict(stats)
+    snapshot["fallback_rate"] = round(snapshot["llm_fallbacks"] / snapshot["queries"], 4) if snapshot["queries"] else 0.0
+    snapshot["audit_accuracy"] = round(snapshot["audits_agreed"] / snapshot["audits"], 4) if snapshot["audits"] else None
+    snapshot["centroids_loaded"] = bool(load_centroids())
+    snapshot["cache"] = _routing_cache.get_stats()
+    return snapshot
+
+
+def train_centroids(log_path=ROUTER_LOG_PATH, output_path=ROUTER_CENTROIDS_PATH, batch_size=16):
+    """Builds one mean embedding per label from LLM-labelled queries in the router log (and its rotated files)."""
+    from embeddings import get_embeddings
+
+    examples = {}
+    for entry in _log_entries(log_path):
+        if entry.get("source") in ("llm", "llm_audit") and entry.get("label") in LABELS:
+            examples[normalize_query(entry["query"])] = entry["label"]
+
+    queries = list(examples)
+    vectors = []
+    for start in range(0, len(queries), batch_size):
+        vectors.extend(get_embeddings(queries[start:start + batch_size]))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    labels = np.array([examples[q] for q in queries])
+    centroids = {}
+    for label in LABELS:
+        members = vectors[labels == label]
+        if len(members):
+            centroid = members.mean(axis=0)
+            centroids[label] = centroid / np.linalg.norm(centroid)
+    np.savez(output_path, **centroids)
+
+    # Leave-in accuracy of the nearest-centroid rule on the training queries
+    correct = sum(
+        max(centroids, key=lambda label: float(centroids[label] @ vector)) == label
+        for vector, label in zip(vectors, labels)
+    )
+    return {"examples": len(queries), "per_label": {l: int((labels == l).sum()) for l in LABELS},
+            "training_accuracy": round(correct / len(queries), 4) if queries else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query router maintenance.")
+    parser.add_argument("command", choices=["train", "evaluate"])
+    parser.add_argument("--log", default=ROUTER_LOG_PATH)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        print(train_centroids(args.log))
+    else:
+        # Accuracy of the keyword rules alone against LLM labels in the log
+        total = confident = correct = 0
+        for entry in _log_entries(args.log):
+            if entry.get("label") not in LABELS:
+                continue
+            total += 1
+            label, confidence = classify_by_rules(entry["query"])
+            if confidence >= ROUTER_CONFIDENCE_THRESHOLD:
+                confident += 1
+                correct += label == entry["label"]
+        print({"examples": total, "rule_coverage": round(confident / total, 4) if total else None,
+               "rule_accuracy": round(correct / confident, 4) if confident else None})
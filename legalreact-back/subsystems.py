@@ -0,0 +1,131 @@
+"""
+Agent subsystems, imported on first use.
+
+main.py only imports Flask and the shared infrastructure; each agent module (and
+the SDKs it pulls in) is imported the first time a request needs it, so a
+worker starts fast and a subsystem that fails to load (e.g. Pinecone not
+configured) only fails its own endpoints. A failed load is retried after
+SUBSYSTEM_RETRY_SECONDS.
+
+Two optional startup stages, each "all", "none" or a comma-separated list of
+subsystem names:
+
+- STARTUP_PRELOAD imports the modules. Importing builds no clients and starts
+  no threads. Any SQLite database opened at import goes through
+  cache.SQLiteConnection, which reopens per pid, so a forked worker never uses
+  the master's connection. That makes preloading safe in a gunicorn --preload
+  master, and the forked workers share the imported code copy-on-write.
+- STARTUP_WARMUP additionally runs each module's warm_up() (clients, indexes,
+  templates, glossaries). Warm-up is per process: gunicorn.conf.py runs it in
+  each worker after the fork.
+"""
+import os
+import time
+import logging
+import importlib
+import threading
+
+SUBSYSTEMS = {
+    "case_search": "casesearch",
+    "verdict": "verdict",
+    "documents": "formatter",
+    "summarisation": "summarisation",
+    "translation": "translate",
+}
+SUBSYSTEM_RETRY_SECONDS = float(os.getenv("SUBSYSTEM_RETRY_SECONDS", "30"))
+
+_lock = threading.Lock()
+_state = {name: {"module": None, "import_seconds": None, "warmup_seconds": None, "error": None, "failed_at": 0.0}
+          for name in SUBSYSTEMS}
+_process_started = time.time()
+
+
+class SubsystemUnavailable(Exception):
+    def __init__(self, name, error):
+        super().__init__(f"The {name} service is unavailable: {error}")
+        self.name = name
+
+
+def subsystem(name):
+    """Returns the module behind a subsystem, importing it on first use; raises SubsystemUnavailable."""
+    state = _state[name]
+    module = state["module"]
+    if module is not None:
+        return module
+    with _lock:
+        if state["module"] is None:
+            if state["error"] and time.time() - state["failed_at"] < SUBSYSTEM_RETRY_SECONDS:
+                raise SubsystemUnavailable(name, state["error"])
+            started = time.perf_counter()
+            try:
+                state["module"] = importlib.import_module(SUBSYSTEMS[name])
+                state["error"] = None
+            except Exception as e:
+                state["error"], state["failed_at"] = f"{type(e).__name__}: {e}", time.time()
+                logging.error(f"Failed to load {name}: {state['error']}")
+                raise SubsystemUnavailable(name, state["error"])
+            finally:
+                state["import_seconds"] = round(time.perf_counter() - started, 4)
+        return state["module"]
+
+
+def loaded(name):
+    return _state[name]["module"] is not None
+
+
+def _selected(value):
+    value = (value or "").strip().lower()
+    if value in ("", "none", "false", "0"):
+        return []
+    if value in ("all", "true", "1"):
+        return list(SUBSYSTEMS)
+    return [name.strip() for name in value.split(",") if name.strip() in SUBSYSTEMS]
+
+
+def preload(names=None):
+    """Imports the subsystems in names (default: STARTUP_PRELOAD); failures are logged, not raised."""
+    for name in _selected(os.getenv("STARTUP_PRELOAD")) if names is None else names:
+        try:
+            subsystem(name)
+        except SubsystemUnavailable:
+            pass
+
+
+def warm_up(names=None):
+    """Imports the subsystems in names (default: STARTUP_WARMUP) and runs their warm_up() hooks."""
+    for name in _selected(os.getenv("STARTUP_WARMUP")) if names is None else names:
+        started = time.perf_counter()
+        try:
+            hook = getattr(subsystem(name), "warm_up", None)
+            if hook:
+                hook()
+        except Exception as e:
+            logging.error(f"Warm-up of {name} failed: {e}")
+            continue
+        _state[name]["warmup_seconds"] = round(time.perf_counter() - started, 4)
+
+
+def _rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def startup_stats():
+    subsystems = {
+        name: {
+            "loaded": state["module"] is not None,
+            "import_seconds": state["import_seconds"],
+            "warmup_seconds": state["warmup_seconds"],
+            "error": state["error"],
+        }
+        for name, state in _state.items()
+    }
+    return {
+        "pid": os.getpid(),
+        "uptime_seconds": round(time.time() - _process_started, 1),
+        "rss_bytes": _rss_bytes(),
+        "subsystems": subsystems,
+    }
@@ -1,59 +1,63 @@
 import os
+import re
 import json
+import time
+import asyncio
 from datetime import datetime, timedelta
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.core.credentials import AzureKeyCredential
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions, ContentSettings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from azure.storage.blob import generate_blob_sas, BlobSasPermissions, ContentSettings
 from langchain.schema import SystemMessage, HumanMessage
-from langchain_openai import AzureChatOpenAI
+from uploads import record_upload, get_latest_upload, unique_blob_name
+from ocr_cache import analyze_cached, aanalyze_cached
+from tokens import estimate_tokens
+from chunking import split_sentences
+from llm_cache import cached_invoke, cached_stream, acached_invoke, acached_stream
+from clients import get_chat_llm, get_blob_service_client, get_document_analysis_client
+from clients import get_async_chat_llm, get_async_blob_service_client, get_async_document_analysis_client
 
 # Azure Configuration
 AZURE_BLOB_ACCOUNT = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
 AZURE_BLOB_CONTAINER = os.getenv("AZURE_CONTAINER_NAME")
 AZURE_BLOB_KEY = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
-AZURE_FORM_RECOGNIZER_ENDPOINT = os.getenv("AZURE_DOC_INTELLIGENCE_ENDPOINT")
-AZURE_FORM_RECOGNIZER_KEY = os.getenv("AZURE_DOC_INTELLIGENCE_KEY")
-
-# Initialize Azure OpenAI GPT Model
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o-mini",
-    azure_endpoint=os.getenv("OPENAI_GPT_ENDPOINT"),
-    api_key=os.getenv("OPENAI_GPT_API_KEY"),
-    api_version="2024-10-21",
-    temperature=0.2
-)
+
+# Contracts above SUMMARY_SINGLE_CALL_TOKENS are summarized map-reduce style in chunks of SUMMARY_CHUNK_TOKENS
+SUMMARY_SINGLE_CALL_TOKENS = int(os.getenv("SUMMARY_SINGLE_CALL_TOKENS", "12000"))
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+SUMMARY_FIELDS = ["parties", "dates", "financial_terms", "confidentiality", "termination", "governing_law"]
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", "4"))
+summary_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS, thread_name_prefix="summary")
 
 def upload_pdf_to_blob(file_path, file_name):
     """
-    Uploads a PDF file to Azure Blob Storage.
+    Uploads a PDF file to Azure Blob Storage and returns its document handle.
     """
-    blob_service_client = BlobServiceClient(
-        account_url=f"https://{AZURE_BLOB_ACCOUNT}.blob.core.windows.net",
-        credential=AZURE_BLOB_KEY
-    )
-    blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=file_name)
+    blob_name = unique_blob_name(file_name)
+    blob_service_client = get_blob_service_client(account_name=AZURE_BLOB_ACCOUNT, account_key=AZURE_BLOB_KEY)
+    blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_name)
+
+    with open(file_path, "rb") as data:
+        upload_result = blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type="application/pdf"))
+
+    return record_upload(AZURE_BLOB_CONTAINER, blob_name, upload_result, file_path)
+
+async def aupload_pdf_to_blob(file_path, file_name):
+    blob_name = unique_blob_name(file_name)
+    blob_service_client = get_async_blob_service_client(account_name=AZURE_BLOB_ACCOUNT, account_key=AZURE_BLOB_KEY)
+    blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_name)
 
     with open(file_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type="application/pdf"))
+        upload_result = await blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type="application/pdf"))
 
-    return f"File {file_name} uploaded successfully."
+    return await asyncio.to_thread(record_upload, AZURE_BLOB_CONTAINER, blob_name, upload_result, file_path)
 
 def get_latest_contract():
     """
-    Fetches the latest uploaded contract file from Azure Blob Storage.
+    Returns the most recently uploaded contract from the local upload index (never lists the container).
     """
-    blob_service_client = BlobServiceClient(
-        account_url=f"https://{AZURE_BLOB_ACCOUNT}.blob.core.windows.net",
-        credential=AZURE_BLOB_KEY
-    )
-    container_client = blob_service_client.get_container_client(AZURE_BLOB_CONTAINER)
-    
-    blobs = list(container_client.list_blobs())
-    if not blobs:
+    latest = get_latest_upload(AZURE_BLOB_CONTAINER)
+    if not latest:
         return None, "No contract files found in Azure Blob Storage."
-    
-    latest_blob = max(blobs, key=lambda x: x.last_modified)
-    return latest_blob.name, None  # Return latest filename
+    return latest["blob_name"], None  # Return latest filename
 
 def generate_sas_url(blob_name):
     """
@@ -69,30 +73,39 @@ def generate_sas_url(blob_name):
     )
     return f"https://{AZURE_BLOB_ACCOUNT}.blob.core.windows.net/{AZURE_BLOB_CONTAINER}/{blob_name}?{sas_token}"
 
-def extract_summary(file_path, file_name):
+def extract_contract_text(file_path, file_name):
     """
-    Uploads a PDF, fetches the latest contract, extracts legal entities, and generates a summary.
+    Uploads the PDF, runs Document Intelligence layout analysis on it and returns (text, error).
     """
     # Step 1: Upload PDF first
-    upload_pdf_to_blob(file_path, file_name)
+    document = upload_pdf_to_blob(file_path, file_name)
 
-    # Step 2: Fetch the latest uploaded contract
-    latest_file, error = get_latest_contract()
-    if error:
-        return {"error": error}
-    
-    # Step 3: Generate SAS URL for latest file
-    blob_url = generate_sas_url(latest_file)
+    # Step 2: Analyze document layout (text extraction), skipped when this exact PDF was seen before
+    def analyze():
+        # Generate SAS URL for the uploaded file (the handle, not a "latest" lookup)
+        blob_url = generate_sas_url(document["blob_name"])
+        poller = get_document_analysis_client().begin_analyze_document_from_url("prebuilt-layout", blob_url)
+        return poller.result()
 
-    # Step 4: Initialize Document Intelligence client
-    client = DocumentAnalysisClient(AZURE_FORM_RECOGNIZER_ENDPOINT, AzureKeyCredential(AZURE_FORM_RECOGNIZER_KEY))
-    
-    # Analyze document layout (text extraction)
-    poller = client.begin_analyze_document_from_url("prebuilt-layout", blob_url)
-    result = poller.result()
-    extracted_text = "\n".join([line.content for page in result.pages for line in page.lines])
+    pages = analyze_cached(document["sha256"], "prebuilt-layout", analyze, document["size"])
+    return join_pages(pages), None
+
+async def aextract_contract_text(file_path, file_name):
+    document = await aupload_pdf_to_blob(file_path, file_name)
+
+    async def analyze():
+        blob_url = generate_sas_url(document["blob_name"])
+        poller = await get_async_document_analysis_client().begin_analyze_document_from_url("prebuilt-layout", blob_url)
+        return await poller.result()
 
-    # Step 5: Generate legal summary using GPT
+    pages = await aanalyze_cached(document["sha256"], "prebuilt-layout", analyze, document["size"])
+    return join_pages(pages), None
+
+def join_pages(pages):
+    # Pages are separated by a blank line so long contracts can be chunked on page boundaries
+    return "\n\n".join("\n".join(page) for page in pages if page)
+
+def build_summary_messages(extracted_text):
     prompt = f"""
     Extract key legal details from the following contract text:
     
@@ -101,13 +114,13 @@ def extract_summary(file_path, file_name):
     
     Return the result as a JSON object with keys: "parties", "dates", "financial_terms", "confidentiality", "termination", "governing_law".
     """
-    messages = [
+    return [
         SystemMessage(content="You are a legal document assistant."),
         HumanMessage(content=prompt)
     ]
-    
-    response = llm.invoke(messages)
-    raw_response = response.content.strip()
+
+def parse_summary_response(raw_response):
+    raw_response = raw_response.strip()
 
     # Cleanup GPT response
     if raw_response.startswith("```json"):
@@ -117,7 +130,347 @@ def extract_summary(file_path, file_name):
 
     try:
         parsed_response = json.loads(raw_response)
-        return parsed_response
     except json.JSONDecodeError:
         return {"error": "Failed to parse response from GPT."}
+    if not isinstance(parsed_response, dict):
+        return {"error": "Failed to parse response from GPT."}
+    return parsed_response
+
+def _usage(response, messages):
+    """Prompt/completion token counts from the response, estimated when the API did not report them."""
+    if getattr(response, "response_metadata", {}).get("cached"):
+        return {"prompt_tokens": 0, "completion_tokens": 0, "cached": True}
+    usage = getattr(response, "usage_metadata", None) or {}
+    if usage.get("input_tokens") is not None:
+        return {"prompt_tokens": usage["input_tokens"], "completion_tokens": usage.get("output_tokens", 0)}
+    return {
+        "prompt_tokens": sum(estimate_tokens(message.content) for message in messages),
+        "completion_tokens": estimate_tokens(response.content),
+        "estimated": True,
+    }
+
+SECTION_HEADING = re.compile(r"\n(?=(?:ARTICLE|Article|SECTION|Section|Clause|CLAUSE|SCHEDULE|Schedule)\b|\d{1,2}\.\s+[A-Z])")
+
+def chunk_contract(text, max_tokens=SUMMARY_CHUNK_TOKENS):
+    """
+    Splits contract text into chunks of about max_tokens. Whole pages are packed
+    together; a page that is too long on its own is split at section headings,
+    then at lines, then at sentences and finally between words.
+    """
+    pieces = []
+    for page in re.split(r"\n\s*\n", text):
+        if not page.strip():
+            continue
+        if estimate_tokens(page) <= max_tokens:
+            pieces.append(page)
+            continue
+        for section in SECTION_HEADING.split(page):
+            if estimate_tokens(section) <= max_tokens:
+                pieces.append(section)
+                continue
+            for line in section.split("\n"):
+                if estimate_tokens(line) <= max_tokens:
+                    pieces.append(line)
+                    continue
+                for sentence in split_sentences(line):
+                    if estimate_tokens(sentence) <= max_tokens:
+                        pieces.append(sentence)
+                    else:
+                        pieces.extend(_split_words(sentence, max_tokens))
+
+    chunks, current, size = [], [], 0
+    for piece in pieces:
+        tokens = estimate_tokens(piece)
+        if current and size + tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def _split_words(text, max_tokens):
+    """Cuts text that has no sentence break into runs of whole words of at most max_tokens."""
+    piece, size = [], 0
+    for word in text.split():
+        tokens = estimate_tokens(word)
+        if piece and size + tokens > max_tokens:
+            yield " ".join(piece)
+            piece, size = [], 0
+        piece.append(word)
+        size += tokens
+    if piece:
+        yield " ".join(piece)
+
+def build_chunk_messages(chunk, index, total):
+    prompt = f"""
+    The following is part {index + 1} of {total} of a contract. Extract the key legal details that appear in this part:
+
+    **Contract Text:**
+    {chunk}
+
+    Return a JSON object with keys: "parties", "dates", "financial_terms", "confidentiality", "termination", "governing_law".
+    Each value must be a list of short strings; use an empty list when this part does not mention it.
+    """
+    return [
+        SystemMessage(content="You are a legal document assistant."),
+        HumanMessage(content=prompt)
+    ]
+
+def _failed_chunk(index, error):
+    """The (partial, usage) result of a chunk whose completion raised; _reduce counts it as failed."""
+    print(f"⚠️ Summarizing chunk {index + 1} failed: {error}")
+    return {"error": str(error)}, {"prompt_tokens": 0, "completion_tokens": 0}
+
+def _summarize_chunk(chunk, index, total):
+    messages = build_chunk_messages(chunk, index, total)
+    try:
+        response = cached_invoke(get_chat_llm(), messages, "summarize_chunk")
+    except Exception as e:
+        return _failed_chunk(index, e)
+    return parse_summary_response(response.content), _usage(response, messages)
+
+async def _asummarize_chunk(chunk, index, total, limit):
+    messages = build_chunk_messages(chunk, index, total)
+    try:
+        async with limit:
+            response = await acached_invoke(get_async_chat_llm(), messages, "summarize_chunk")
+    except Exception as e:
+        return _failed_chunk(index, e)
+    return parse_summary_response(response.content), _usage(response, messages)
+
+def _flatten(value):
+    if value is None or value == "":
+        return []
+    if isinstance(value, list):
+        return [item for element in value for item in _flatten(element)]
+    if isinstance(value, dict):
+        return [f"{key}: {', '.join(_flatten(item))}" for key, item in value.items() if _flatten(item)]
+    return [str(value).strip()]
+
+def _dedupe_tokens(item):
+    """Lower-cased word and number tokens; "5,000" stays one number token, "5000"."""
+    return tuple(token.replace(",", "") for token in re.findall(r"\d+(?:[.,]\d+)*|[^\W\d_]+", item.casefold()))
+
+def _numbers(tokens):
+    return [token for token in tokens if token[0].isdigit()]
+
+def _contained(tokens, other):
+    """Whether tokens is a run of whole tokens of other that carries the same numbers (so "2020" is not part of "12 March 2020")."""
+    if len(tokens) >= len(other) or _numbers(tokens) != _numbers(other):
+        return False
+    return any(other[start:start + len(tokens)] == tokens for start in range(len(other) - len(tokens) + 1))
+
+def merge_summaries(partials):
+    """
+    Merges per-chunk summaries field by field. Items repeated across chunks, and
+    items whose words appear in order in a longer item with the same numbers,
+    are dropped; order of first appearance is kept.
+    """
+    merged = {}
+    for field in SUMMARY_FIELDS:
+        items, keys = [], []
+        for partial in partials:
+            for item in _flatten(partial.get(field)):
+                key = _dedupe_tokens(item)
+                if key and key not in keys:
+                    items.append(item)
+                    keys.append(key)
+        merged[field] = [
+            item for item, key in zip(items, keys)
+            if not any(_contained(key, other) for other in keys)
+        ]
+    return merged
+
+def _reduce(results):
+    """Merges the (partial, usage) results of every chunk into (summary, usage); chunks that failed to parse, or are not JSON objects, are skipped."""
+    partials = [partial for partial, _ in results if isinstance(partial, dict) and "error" not in partial]
+    usage = {
+        "mode": "map_reduce",
+        "chunks": len(results),
+        "failed_chunks": len(results) - len(partials),
+        "prompt_tokens": sum(chunk_usage["prompt_tokens"] for _, chunk_usage in results),
+        "completion_tokens": sum(chunk_usage["completion_tokens"] for _, chunk_usage in results),
+    }
+    if any(chunk_usage.get("estimated") for _, chunk_usage in results):
+        usage["estimated"] = True
+    summary = merge_summaries(partials) if partials else {"error": "Failed to parse response from GPT."}
+    return summary, usage
+
+def summarize_text(extracted_text):
+    """
+    Summarizes contract text, returning (summary, usage). Short contracts take a
+    single completion; longer ones are chunked, the chunks are summarized
+    concurrently and the partial results merged.
+    """
+    started = time.perf_counter()
+    document_tokens = estimate_tokens(extracted_text)
+    if document_tokens <= SUMMARY_SINGLE_CALL_TOKENS:
+        messages = build_summary_messages(extracted_text)
+        response = cached_invoke(get_chat_llm(), messages, "extract_summary")
+        usage = {"mode": "single", "chunks": 1, **_usage(response, messages)}
+        summary = parse_summary_response(response.content)
+    else:
+        chunks = chunk_contract(extracted_text)
+        summary, usage = _reduce(list(summary_executor.map(_summarize_chunk, chunks, range(len(chunks)), [len(chunks)] * len(chunks))))
+    usage["document_tokens"] = document_tokens
+    usage["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return summary, usage
+
+async def asummarize_text(extracted_text):
+    """summarize_text on the async model client; at most SUMMARY_WORKERS chunks are in flight per contract."""
+    started = time.perf_counter()
+    document_tokens = await asyncio.to_thread(estimate_tokens, extracted_text)
+    if document_tokens <= SUMMARY_SINGLE_CALL_TOKENS:
+        messages = build_summary_messages(extracted_text)
+        response = await acached_invoke(get_async_chat_llm(), messages, "extract_summary")
+        usage = {"mode": "single", "chunks": 1, **_usage(response, messages)}
+        summary = parse_summary_response(response.content)
+    else:
+        chunks = await asyncio.to_thread(chunk_contract, extracted_text)
+        limit = asyncio.Semaphore(SUMMARY_WORKERS)
+        summary, usage = _reduce(await asyncio.gather(*(_asummarize_chunk(chunk, i, len(chunks), limit) for i, chunk in enumerate(chunks))))
+    usage["document_tokens"] = document_tokens
+    usage["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return summary, usage
+
+def extract_summary(file_path, file_name):
+    """
+    Uploads a PDF, extracts legal entities from it, and generates a summary.
+    """
+    extracted_text, error = extract_contract_text(file_path, file_name)
+    if error:
+        return {"error": error}
+
+    # Step 3: Generate legal summary using GPT
+    summary, usage = summarize_text(extracted_text)
+    return {**summary, "usage": usage}
+
+def extract_summary_stream(file_path, file_name):
+    """
+    Streaming variant of extract_summary. Yields (event, data) tuples: text_extracted
+    once OCR finishes, one token event per completion chunk (or, for long contracts,
+    one chunk_summarized event per chunk), then the parsed summary as a result event
+    (or a single error event, also when OCR or a completion raises).
+    """
+    try:
+        yield from _summary_events(file_path, file_name)
+    except Exception as e:
+        print(f"❌ Summary stream failed: {e}")
+        yield "error", {"error": str(e)}
+
+
+def _summary_events(file_path, file_name):
+    extracted_text, error = extract_contract_text(file_path, file_name)
+    if error:
+        yield "error", {"error": error}
+        return
+    document_tokens = estimate_tokens(extracted_text)
+    yield "text_extracted", {"characters": len(extracted_text), "tokens": document_tokens}
+
+    started = time.perf_counter()
+    if document_tokens > SUMMARY_SINGLE_CALL_TOKENS:
+        chunks = chunk_contract(extracted_text)
+        futures = {summary_executor.submit(_summarize_chunk, chunk, i, len(chunks)): i for i, chunk in enumerate(chunks)}
+        results = [None] * len(chunks)
+        try:
+            for future in as_completed(futures):
+                results[futures[future]] = future.result()
+                yield "chunk_summarized", {"chunk": futures[future] + 1, "of": len(chunks)}
+        finally:
+            for future in futures:
+                future.cancel()  # no-op for finished futures
+        summary, usage = _reduce(results)
+    else:
+        messages = build_summary_messages(extracted_text)
+        tokens = []
+        for chunk in cached_stream(get_chat_llm(), messages, "extract_summary"):
+            if chunk.content:
+                tokens.append(chunk.content)
+                yield "token", {"text": chunk.content}
+        completion = "".join(tokens)
+        usage = {
+            "mode": "single",
+            "chunks": 1,
+            "prompt_tokens": sum(estimate_tokens(message.content) for message in messages),
+            "completion_tokens": estimate_tokens(completion),
+            "estimated": True,
+        }
+        summary = parse_summary_response(completion)
+    usage["document_tokens"] = document_tokens
+    usage["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    yield "result", {**summary, "usage": usage}
+
+
+async def aextract_summary(file_path, file_name):
+    extracted_text, error = await aextract_contract_text(file_path, file_name)
+    if error:
+        return {"error": error}
+    summary, usage = await asummarize_text(extracted_text)
+    return {**summary, "usage": usage}
+
+async def aextract_summary_stream(file_path, file_name):
+    """extract_summary_stream for the async serving mode: an async generator of the same events."""
+    try:
+        async for event in _asummary_events(file_path, file_name):
+            yield event
+    except Exception as e:
+        print(f"❌ Summary stream failed: {e}")
+        yield "error", {"error": str(e)}
+
+
+async def _asummary_events(file_path, file_name):
+    extracted_text, error = await aextract_contract_text(file_path, file_name)
+    if error:
+        yield "error", {"error": error}
+        return
+    document_tokens = await asyncio.to_thread(estimate_tokens, extracted_text)
+    yield "text_extracted", {"characters": len(extracted_text), "tokens": document_tokens}
+
+    started = time.perf_counter()
+    if document_tokens > SUMMARY_SINGLE_CALL_TOKENS:
+        chunks = await asyncio.to_thread(chunk_contract, extracted_text)
+        limit = asyncio.Semaphore(SUMMARY_WORKERS)
+
+        async def summarize(i, chunk):
+            return i, await _asummarize_chunk(chunk, i, len(chunks), limit)
+
+        results = [None] * len(chunks)
+        tasks = [asyncio.ensure_future(summarize(i, chunk)) for i, chunk in enumerate(chunks)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                i, result = await next_done
+                results[i] = result
+                yield "chunk_summarized", {"chunk": i + 1, "of": len(chunks)}
+        finally:
+            for task in tasks:
+                task.cancel()  # no-op for finished tasks
+        summary, usage = _reduce(results)
+    else:
+        messages = build_summary_messages(extracted_text)
+        tokens = []
+        async for chunk in acached_stream(get_async_chat_llm(), messages, "extract_summary"):
+            if chunk.content:
+                tokens.append(chunk.content)
+                yield "token", {"text": chunk.content}
+        completion = "".join(tokens)
+        usage = {
+            "mode": "single",
+            "chunks": 1,
+            "prompt_tokens": sum(estimate_tokens(message.content) for message in messages),
+            "completion_tokens": estimate_tokens(completion),
+            "estimated": True,
+        }
+        summary = parse_summary_response(completion)
+    usage["document_tokens"] = document_tokens
+    usage["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    yield "result", {**summary, "usage": usage}
+
 
+def warm_up():
+    """Builds the service clients and loads the tokenizer before the first contract."""
+    get_chat_llm()
+    get_blob_service_client(account_name=AZURE_BLOB_ACCOUNT, account_key=AZURE_BLOB_KEY)
+    get_document_analysis_client()
+    estimate_tokens("warm up")
@@ -0,0 +1,49 @@
+import os
+import re
+import logging
+
+# gpt-4o / gpt-4o-mini use o200k_base. tiktoken downloads the encoding on first use,
+# so when that is not possible the character-class estimate below is used instead.
+TOKEN_ENCODING = os.getenv("TOKEN_ENCODING", "o200k_base")
+# text-embedding-ada-002 uses cl100k_base
+EMBEDDING_TOKEN_ENCODING = os.getenv("EMBEDDING_TOKEN_ENCODING", "cl100k_base")
+
+_encodings = {}
+_failed_encodings = set()
+
+_WORD = re.compile(r"[A-Za-z]+|[0-9]+|[^\sA-Za-z0-9]")
+
+
+def _get_encoding(name=TOKEN_ENCODING):
+    if name not in _encodings and name not in _failed_encodings:
+        try:
+            import tiktoken
+            _encodings[name] = tiktoken.get_encoding(name)
+        except Exception as e:
+            _failed_encodings.add(name)
+            logging.warning(f"tiktoken encoding {name} unavailable, estimating tokens instead: {str(e)}")
+    return _encodings.get(name)
+
+
+def estimate_tokens(text, encoding_name=TOKEN_ENCODING):
+    """
+    Token count of text for the chat models (or, with encoding_name=EMBEDDING_TOKEN_ENCODING,
+    the embedding model); exact with tiktoken, otherwise a close upper estimate.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding(encoding_name)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    # Latin words average about 1.3 tokens, digits about 3 per token, other scripts about 2.5 characters per token
+    count = 0.0
+    for piece in _WORD.findall(text):
+        if piece[0].isascii() and piece[0].isalpha():
+            count += 1 + len(piece) // 8
+        elif piece[0].isdigit():
+            count += (len(piece) + 2) // 3
+        elif piece.isascii():
+            count += 1
+        else:
+            count += 0.4
+    return int(count) + 1
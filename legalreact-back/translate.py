@@ -1,65 +1,66 @@
 import os
-import json
+import re
+import time
+import asyncio
 import tempfile
+import httpx
 import requests
 import logging
 from datetime import datetime, timedelta
-from azure.ai.formrecognizer import DocumentAnalysisClient
-from azure.ai.translation.text import TextTranslationClient
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions, ContentSettings
-from azure.core.credentials import AzureKeyCredential
+from concurrent.futures import ThreadPoolExecutor
+from azure.storage.blob import generate_blob_sas, BlobSasPermissions, ContentSettings
+from uploads import record_upload, get_latest_upload, unique_blob_name
+from clients import get_blob_service_client, get_document_analysis_client, get_translator_session
+from clients import get_async_blob_service_client, get_async_document_analysis_client, get_async_translator_client
+from ocr_cache import analyze_cached, aanalyze_cached
+from glossary import glossaries
+from language_detect import LanguageDetector, LANGUAGE_MIN_CONFIDENCE, sample_text
+from translation_memory import lookup_segments, store_segments, normalize_segment
 
 AZURE_BLOB_ACCOUNT = os.getenv("AZURE_STORAGE_ACCOUNT_NAME")
 AZURE_BLOB_CONTAINER = os.getenv("AZURE_CONTAINER_NAME")
 AZURE_BLOB_KEY = os.getenv("AZURE_STORAGE_ACCOUNT_KEY")
-AZURE_FORM_RECOGNIZER_ENDPOINT = os.getenv("AZURE_DOC_INTELLIGENCE_ENDPOINT")
-AZURE_FORM_RECOGNIZER_KEY = os.getenv("AZURE_DOC_INTELLIGENCE_KEY")
 AZURE_TRANSLATOR_REGION = os.getenv("AZURE_TRANSLATOR_REGION")
 AZURE_TRANSLATOR_KEY = os.getenv("AZURE_TRANSLATOR_KEY")
 
+# Translator v3 accepts at most 50,000 characters and 1,000 elements per request
+TRANSLATOR_URL = "https://api.cognitive.microsofttranslator.com"
+TRANSLATOR_MAX_REQUEST_CHARS = int(os.getenv("TRANSLATOR_MAX_REQUEST_CHARS", "50000"))
+TRANSLATOR_MAX_ELEMENTS = int(os.getenv("TRANSLATOR_MAX_ELEMENTS", "1000"))
+TRANSLATOR_SEGMENT_CHARS = int(os.getenv("TRANSLATOR_SEGMENT_CHARS", "5000"))
+TRANSLATOR_WORKERS = int(os.getenv("TRANSLATOR_WORKERS", "4"))
+TRANSLATOR_RETRIES = int(os.getenv("TRANSLATOR_RETRIES", "3"))
+
 logging.basicConfig(level=logging.INFO)
 
-blob_service_client = BlobServiceClient(
-    account_url=f"https://{AZURE_BLOB_ACCOUNT}.blob.core.windows.net",
-    credential=AZURE_BLOB_KEY
-)
+translator_executor = ThreadPoolExecutor(max_workers=TRANSLATOR_WORKERS, thread_name_prefix="translate")
 
-document_analysis_client = DocumentAnalysisClient(
-    endpoint=AZURE_FORM_RECOGNIZER_ENDPOINT,
-    credential=AzureKeyCredential(AZURE_FORM_RECOGNIZER_KEY)
-)
+language_detector = LanguageDetector()
+detection_stats = {"local": 0, "remote": 0}
 
-translator_client = TextTranslationClient(
-    endpoint="https://api.cognitive.microsofttranslator.com",
-    credential=AzureKeyCredential(AZURE_TRANSLATOR_KEY)
-)
+def upload_pdf_to_blob(file_path, original_filename):
+    blob_name = unique_blob_name(original_filename)
+    blob_client = get_blob_service_client(account_name=AZURE_BLOB_ACCOUNT, account_key=AZURE_BLOB_KEY).get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_name)
 
-def load_glossary(file_path="glossary.json"):
-    try:
-        with open(file_path, "r", encoding="utf-8") as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Failed to load glossary: {str(e)}")
-        return {}
+    with open(file_path, "rb") as data:
+        upload_result = blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type="application/pdf"))
 
-GLOSSARY = load_glossary()
+    return record_upload(AZURE_BLOB_CONTAINER, blob_name, upload_result, file_path)
 
-def upload_pdf_to_blob(file_path, original_filename):
-    timestamped_filename = f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{original_filename}"
-    blob_client = blob_service_client.get_blob_client(container=AZURE_BLOB_CONTAINER, blob=timestamped_filename)
+async def aupload_pdf_to_blob(file_path, original_filename):
+    blob_name = unique_blob_name(original_filename)
+    blob_client = get_async_blob_service_client(account_name=AZURE_BLOB_ACCOUNT, account_key=AZURE_BLOB_KEY).get_blob_client(container=AZURE_BLOB_CONTAINER, blob=blob_name)
 
     with open(file_path, "rb") as data:
-        blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type="application/pdf"))
+        upload_result = await blob_client.upload_blob(data, overwrite=True, content_settings=ContentSettings(content_type="application/pdf"))
 
-    return timestamped_filename
+    return await asyncio.to_thread(record_upload, AZURE_BLOB_CONTAINER, blob_name, upload_result, file_path)
 
 def get_latest_contract():
-    container_client = blob_service_client.get_container_client(AZURE_BLOB_CONTAINER)
-    blobs = list(container_client.list_blobs())
-    if not blobs:
+    latest = get_latest_upload(AZURE_BLOB_CONTAINER)
+    if not latest:
         return None, "No contract files found in Azure Blob Storage."
-    latest_blob = max(blobs, key=lambda x: x.last_modified)
-    return latest_blob.name, None
+    return latest["blob_name"], None
 
 def generate_sas_url(blob_name):
     sas_token = generate_blob_sas(
@@ -72,61 +73,289 @@ def generate_sas_url(blob_name):
     )
     return f"https://{AZURE_BLOB_ACCOUNT}.blob.core.windows.net/{AZURE_BLOB_CONTAINER}/{blob_name}?{sas_token}"
 
-def extract_text_from_document(blob_name):
-    document_url = generate_sas_url(blob_name)
+def extract_text_from_document(blob_name, content_hash=None, document_size=None):
+    def analyze():
+        document_url = generate_sas_url(blob_name)
+        poller = get_document_analysis_client().begin_analyze_document_from_url("prebuilt-read", document_url)
+        return poller.result()
+
     try:
-        poller = document_analysis_client.begin_analyze_document_from_url("prebuilt-read", document_url)
-        result = poller.result()
-        return "\n".join([line.content for page in result.pages for line in page.lines]) or None
+        pages = analyze_cached(content_hash, "prebuilt-read", analyze, document_size)
+        return join_pages(pages)
     except Exception as e:
         logging.error(f"Document text extraction failed: {str(e)}")
         return None
 
-def detect_language(text):
-    url = "https://api.cognitive.microsofttranslator.com/detect?api-version=3.0"
-    headers = {
-        "Ocp-Apim-Subscription-Key": AZURE_TRANSLATOR_KEY,
-        "Ocp-Apim-Subscription-Region": AZURE_TRANSLATOR_REGION,
-        "Content-Type": "application/json"
-    }
-    body = [{"text": text}]
+async def aextract_text_from_document(blob_name, content_hash=None, document_size=None):
+    async def analyze():
+        document_url = generate_sas_url(blob_name)
+        poller = await get_async_document_analysis_client().begin_analyze_document_from_url("prebuilt-read", document_url)
+        return await poller.result()
+
     try:
-        response = requests.post(url, headers=headers, json=body)
+        pages = await aanalyze_cached(content_hash, "prebuilt-read", analyze, document_size)
+        return join_pages(pages)
+    except Exception as e:
+        logging.error(f"Document text extraction failed: {str(e)}")
+        return None
+
+def join_pages(pages):
+    # Pages are separated by a blank line so they segment cleanly for translation
+    return "\n\n".join("\n".join(page) for page in pages if page) or None
+
+def detect_language_remote(text):
+    try:
+        response = get_translator_session().post(f"{TRANSLATOR_URL}/detect", params={"api-version": "3.0"}, json=[{"text": text}], timeout=30)
         return response.json()[0].get("language") if response.status_code == 200 else None
     except Exception as e:
         logging.error(f"Language detection failed: {str(e)}")
         return None
 
-def apply_glossary_replacements(translated_text):
-    for eng_term, hindi_term in GLOSSARY.items():
-        translated_text = translated_text.replace(eng_term, hindi_term)
-    return translated_text
-
-def translate_text(text, target_language):
-    url = "https://api.cognitive.microsofttranslator.com/translate?api-version=3.0"
-    headers = {
-        "Ocp-Apim-Subscription-Key": AZURE_TRANSLATOR_KEY,
-        "Ocp-Apim-Subscription-Region": AZURE_TRANSLATOR_REGION,
-        "Content-Type": "application/json"
-    }
-    body = [{"text": text}]
-    
+async def adetect_language_remote(text):
     try:
-        response = requests.post(url, headers=headers, json=body, params={"to": target_language})
-        if response.status_code == 200:
-            translated_text = response.json()[0]["translations"][0]["text"]
-            return apply_glossary_replacements(translated_text)
+        response = await get_async_translator_client().post(f"{TRANSLATOR_URL}/detect", params={"api-version": "3.0"}, json=[{"text": text}], timeout=30)
+        return response.json()[0].get("language") if response.status_code == 200 else None
+    except Exception as e:
+        logging.error(f"Language detection failed: {str(e)}")
+        return None
+
+def detect_language(text):
+    """Detects locally from a sample of the text; only low-confidence samples go to the Translator /detect API."""
+    language, confidence = language_detector.detect(text)
+    if language and confidence >= LANGUAGE_MIN_CONFIDENCE:
+        detection_stats["local"] += 1
+        return language
+    detection_stats["remote"] += 1
+    return detect_language_remote(sample_text(text)) or language
+
+async def adetect_language(text):
+    language, confidence = language_detector.detect(text)
+    if language and confidence >= LANGUAGE_MIN_CONFIDENCE:
+        detection_stats["local"] += 1
+        return language
+    detection_stats["remote"] += 1
+    return await adetect_language_remote(sample_text(text)) or language
+
+def language_detection_stats():
+    total = detection_stats["local"] + detection_stats["remote"]
+    return dict(detection_stats, local_ratio=round(detection_stats["local"] / total, 4) if total else 0.0)
+
+def apply_glossary_replacements(translated_text, target_language):
+    return glossaries.apply(translated_text, target_language)
+
+def _split_long(text, max_chars):
+    """Splits text longer than max_chars at line, then sentence, then hard boundaries."""
+    for pattern in (r"(?<=\n)", r"(?<=[.;:!?])(?=\s)"):
+        parts = [part for part in re.split(pattern, text) if part]
+        if len(parts) > 1:
+            break
+    else:
+        return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+
+    pieces, current = [], ""
+    for part in parts:
+        if current and len(current) + len(part) > max_chars:
+            pieces.append(current)
+            current = ""
+        if len(part) > max_chars:
+            pieces.extend(_split_long(part, max_chars))
         else:
-            return None
+            current += part
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def segment_text(text, max_chars=TRANSLATOR_SEGMENT_CHARS):
+    """
+    Splits text into translation segments at paragraph/page boundaries (blank
+    lines), falling back to lines and sentences for blocks over max_chars.
+    Returns (segment, separator) pairs with the whitespace between segments kept
+    in the separators, so joining them gives back text.lstrip().
+    """
+    pieces = []
+    for block in re.split(r"(?<=\n)(?=\s*\n)", text):
+        pieces.extend(_split_long(block, max_chars) if len(block) > max_chars else [block])
+
+    segments = []
+    for piece in pieces:
+        core = piece.strip()
+        if not core:
+            if segments:
+                segments[-1][1] += piece
+            continue
+        start = piece.index(core[0])
+        if segments:
+            segments[-1][1] += piece[:start]
+        segments.append([core, piece[start + len(core):]])
+    return [tuple(segment) for segment in segments]
+
+
+def pack_batches(segments, max_chars=TRANSLATOR_MAX_REQUEST_CHARS, max_elements=TRANSLATOR_MAX_ELEMENTS):
+    """Groups segment indexes into request bodies within the Translator size limits."""
+    batches, current, size = [], [], 0
+    for index, segment in enumerate(segments):
+        if current and (size + len(segment) > max_chars or len(current) >= max_elements):
+            batches.append(current)
+            current, size = [], 0
+        current.append(index)
+        size += len(segment)
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _translate_batch(texts, target_language, source_language=None, retries=TRANSLATOR_RETRIES):
+    """Translates one request body, retrying throttling, server errors and connection failures."""
+    params = {"api-version": "3.0", "to": target_language}
+    if source_language:
+        params["from"] = source_language
+    body = [{"text": text} for text in texts]
+
+    for attempt in range(retries + 1):
+        delay = 2 ** attempt
+        try:
+            response = get_translator_session().post(f"{TRANSLATOR_URL}/translate", params=params, json=body, timeout=60)
+            if response.status_code == 200:
+                return [item["translations"][0]["text"] for item in response.json()]
+            if response.status_code != 429 and response.status_code < 500:
+                raise RuntimeError(f"Translator returned {response.status_code}: {response.text[:200]}")
+            delay = float(response.headers.get("Retry-After", delay))
+            error = f"Translator returned {response.status_code}"
+        except requests.RequestException as e:
+            error = str(e)
+        if attempt < retries:
+            logging.warning(f"Translation batch failed ({error}), retrying in {delay}s")
+            time.sleep(delay)
+    raise RuntimeError(f"Translation batch failed after {retries + 1} attempts: {error}")
+
+
+async def _atranslate_batch(texts, target_language, source_language=None, retries=TRANSLATOR_RETRIES):
+    params = {"api-version": "3.0", "to": target_language}
+    if source_language:
+        params["from"] = source_language
+    body = [{"text": text} for text in texts]
+
+    for attempt in range(retries + 1):
+        delay = 2 ** attempt
+        try:
+            response = await get_async_translator_client().post(f"{TRANSLATOR_URL}/translate", params=params, json=body, timeout=60)
+            if response.status_code == 200:
+                return [item["translations"][0]["text"] for item in response.json()]
+            if response.status_code != 429 and response.status_code < 500:
+                raise RuntimeError(f"Translator returned {response.status_code}: {response.text[:200]}")
+            delay = float(response.headers.get("Retry-After", delay))
+            error = f"Translator returned {response.status_code}"
+        except httpx.TransportError as e:
+            error = str(e)
+        if attempt < retries:
+            logging.warning(f"Translation batch failed ({error}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError(f"Translation batch failed after {retries + 1} attempts: {error}")
+
+
+def translate_segments(segments, target_language, source_language=None):
+    """Translates a list of strings, batched and in parallel; results keep the input order."""
+    translated = [None] * len(segments)
+    batches = pack_batches(segments)
+    futures = [
+        translator_executor.submit(_translate_batch, [segments[i] for i in batch], target_language, source_language)
+        for batch in batches
+    ]
+    for batch, future in zip(batches, futures):
+        for index, text in zip(batch, future.result()):
+            translated[index] = text
+    return translated
+
+
+async def atranslate_segments(segments, target_language, source_language=None):
+    """translate_segments on the async client, with at most TRANSLATOR_WORKERS batches in flight."""
+    limit = asyncio.Semaphore(TRANSLATOR_WORKERS)
+
+    async def send(batch):
+        async with limit:
+            return await _atranslate_batch([segments[i] for i in batch], target_language, source_language)
+
+    batches = pack_batches(segments)
+    translated = [None] * len(segments)
+    for batch, texts in zip(batches, await asyncio.gather(*(send(batch) for batch in batches))):
+        for index, text in zip(batch, texts):
+            translated[index] = text
+    return translated
+
+
+def translate_with_memory(text, target_language, source_language=None):
+    """
+    Translates text segment by segment, reusing the translation memory. Only the
+    segments missing from it are sent to the Translator; their translations (after
+    the glossary) are stored for next time. Returns the translated text and
+    reuse statistics.
+    """
+    plan = _plan_translation(text, target_language, source_language)
+    fresh = translate_segments(plan["to_translate"], target_language, source_language) if plan["missing"] else []
+    return _finish_translation(plan, fresh, target_language)
+
+
+async def atranslate_with_memory(text, target_language, source_language=None):
+    plan = await asyncio.to_thread(_plan_translation, text, target_language, source_language)
+    fresh = await atranslate_segments(plan["to_translate"], target_language, source_language) if plan["missing"] else []
+    return await asyncio.to_thread(_finish_translation, plan, fresh, target_language)
+
+
+def _plan_translation(text, target_language, source_language):
+    """Segments the text and looks the segments up in the translation memory."""
+    segments = segment_text(text)
+    sources = [segment for segment, _ in segments]
+    memory_key = (source_language or "auto", target_language, glossaries.version(target_language))
+    translated = lookup_segments(sources, *memory_key)
+
+    missing = [index for index in range(len(sources)) if index not in translated]
+    # Repeated clauses within the document are sent once
+    unique = {}
+    for index in missing:
+        unique.setdefault(normalize_segment(sources[index]), index)
+    return {
+        "segments": segments, "sources": sources, "memory_key": memory_key, "translated": translated,
+        "missing": missing, "unique": unique, "to_translate": [sources[index] for index in unique.values()],
+    }
+
+
+def _finish_translation(plan, fresh, target_language):
+    """Applies the glossary to the fresh translations, stores them and assembles the document."""
+    segments, sources, translated, missing, unique = plan["segments"], plan["sources"], plan["translated"], plan["missing"], plan["unique"]
+    if missing:
+        fresh = [apply_glossary_replacements(t, target_language) for t in fresh]
+        by_segment = dict(zip(unique, fresh))
+        translated.update((index, by_segment[normalize_segment(sources[index])]) for index in missing)
+        store_segments([(sources[index], t) for index, t in zip(unique.values(), fresh)], *plan["memory_key"])
+
+    reused_chars = sum(len(sources[index]) for index in range(len(sources)) if index not in missing)
+    total_chars = sum(len(source) for source in sources)
+    return {
+        "translated_text": "".join(translated[index] + separator for index, (_, separator) in enumerate(segments)),
+        "translation_memory": {
+            "segments": len(sources),
+            "reused_segments": len(sources) - len(missing),
+            "reuse_ratio": round(reused_chars / total_chars, 4) if total_chars else 0.0,
+            "characters_translated": total_chars - reused_chars,
+        },
+    }
+
+
+def translate_text(text, target_language, source_language=None):
+    try:
+        return translate_with_memory(text, target_language, source_language)["translated_text"]
     except Exception as e:
         logging.error(f"Translation failed: {str(e)}")
         return None
 
-def process_uploaded_document(target_language):
-    latest_contract, error = get_latest_contract()
-    if error:
-        return {"error": error}
-    extracted_text = extract_text_from_document(latest_contract)
+def process_uploaded_document(target_language, document=None):
+    """Translates the uploaded document (a handle from upload_pdf_to_blob), or the latest upload."""
+    if document is None:
+        document = get_latest_upload(AZURE_BLOB_CONTAINER)
+        if not document:
+            return {"error": "No contract files found in Azure Blob Storage."}
+    extracted_text = extract_text_from_document(document["blob_name"], document.get("sha256"), document.get("size"))
     if not extracted_text:
         return {"error": "Failed to extract text from document."}
     detected_lang = detect_language(extracted_text)
@@ -134,5 +363,35 @@ def process_uploaded_document(target_language):
         return {"error": "Failed to detect source language."}
     if detected_lang == target_language:
         return {"message": "Document is already in the target language.", "translated_text": extracted_text}
-    translated_text = translate_text(extracted_text, target_language)
-    return {"source_language": detected_lang, "translated_text": translated_text} if translated_text else {"error": "Translation failed."}
\ No newline at end of file
+    try:
+        translation = translate_with_memory(extracted_text, target_language, detected_lang)
+    except Exception as e:
+        logging.error(f"Translation failed: {str(e)}")
+        return {"error": "Translation failed."}
+    return {"source_language": detected_lang, **translation}
+
+async def aprocess_uploaded_document(target_language, document):
+    """process_uploaded_document for the async serving mode (the document handle is required)."""
+    extracted_text = await aextract_text_from_document(document["blob_name"], document.get("sha256"), document.get("size"))
+    if not extracted_text:
+        return {"error": "Failed to extract text from document."}
+    detected_lang = await adetect_language(extracted_text)
+    if not detected_lang:
+        return {"error": "Failed to detect source language."}
+    if detected_lang == target_language:
+        return {"message": "Document is already in the target language.", "translated_text": extracted_text}
+    try:
+        translation = await atranslate_with_memory(extracted_text, target_language, detected_lang)
+    except Exception as e:
+        logging.error(f"Translation failed: {str(e)}")
+        return {"error": "Translation failed."}
+    return {"source_language": detected_lang, **translation}
+
+
+def warm_up():
+    """Builds the service clients and compiles every glossary before the first document."""
+    get_blob_service_client(account_name=AZURE_BLOB_ACCOUNT, account_key=AZURE_BLOB_KEY)
+    get_document_analysis_client()
+    get_translator_session()
+    for language in glossaries.languages():
+        glossaries.get(language)
@@ -0,0 +1,156 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+import unicodedata
+from cache import SQLiteConnection
+
+# Segment-level translation memory: translations are reused for any segment seen
+# before with the same source language, target language and glossary version.
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "translation_memory.db")
+
+_lock = threading.Lock()
+_db = SQLiteConnection(TRANSLATION_MEMORY_PATH)
+_db.execute("""
+    CREATE TABLE IF NOT EXISTS segments (
+        segment_hash TEXT, source_language TEXT, target_language TEXT, glossary_version TEXT,
+        source_text TEXT, target_text TEXT, created_at REAL, hits INTEGER DEFAULT 0,
+        PRIMARY KEY (segment_hash, source_language, target_language, glossary_version)
+    )
+""")
+_db.commit()
+
+_stats = {"segments_looked_up": 0, "segments_reused": 0, "characters_looked_up": 0, "characters_reused": 0}
+
+
+def normalize_segment(text):
+    """NFC with whitespace runs collapsed, so re-extracted copies of a clause hash alike."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+def segment_hash(text):
+    return hashlib.sha256(normalize_segment(text).encode("utf-8")).hexdigest()
+
+
+def lookup_segments(segments, source_language, target_language, glossary_version):
+    """Returns {index: translation} for the segments already in the memory."""
+    hashes = [segment_hash(segment) for segment in segments]
+    found = {}
+    with _lock:
+        unique = list(set(hashes))
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            rows = _db.execute(
+                f"SELECT segment_hash, target_text FROM segments WHERE segment_hash IN ({','.join('?' * len(chunk))}) "
+                "AND source_language = ? AND target_language = ? AND glossary_version = ?",
+                [*chunk, source_language, target_language, glossary_version],
+            ).fetchall()
+            found.update(rows)
+        if found:
+            _db.executemany(
+                "UPDATE segments SET hits = hits + 1 WHERE segment_hash = ? AND source_language = ? "
+                "AND target_language = ? AND glossary_version = ?",
+                [(h, source_language, target_language, glossary_version) for h in found],
+            )
+            _db.commit()
+
+        reused = {index: found[h] for index, h in enumerate(hashes) if h in found}
+        _stats["segments_looked_up"] += len(segments)
+        _stats["segments_reused"] += len(reused)
+        _stats["characters_looked_up"] += sum(len(segment) for segment in segments)
+        _stats["characters_reused"] += sum(len(segments[index]) for index in reused)
+    return reused
+
+
+def store_segments(pairs, source_language, target_language, glossary_version):
+    """Saves (source segment, translation) pairs."""
+    now = time.time()
+    rows = [
+        (segment_hash(source), source_language, target_language, glossary_version, normalize_segment(source), target, now)
+        for source, target in pairs
+        if normalize_segment(source) and target is not None
+    ]
+    with _lock:
+        _db.executemany(
+            "INSERT OR REPLACE INTO segments "
+            "(segment_hash, source_language, target_language, glossary_version, source_text, target_text, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        _db.commit()
+    return len(rows)
+
+
+def memory_stats():
+    with _lock:
+        entries = _db.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+        stats = dict(_stats, entries=entries)
+    stats["segment_reuse_ratio"] = round(stats["segments_reused"] / stats["segments_looked_up"], 4) if stats["segments_looked_up"] else 0.0
+    stats["character_reuse_ratio"] = round(stats["characters_reused"] / stats["characters_looked_up"], 4) if stats["characters_looked_up"] else 0.0
+    return stats
+
+
+def _paragraphs(text):
+    return [paragraph.strip() for paragraph in re.split(r"\n\s*\n", text) if paragraph.strip()]
+
+
+def _read_pairs(args):
+    if args.command == "import-jsonl":
+        with open(args.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record["source"], record["target"]
+        return
+
+    with open(args.source_file, "r", encoding="utf-8") as f:
+        sources = _paragraphs(f.read())
+    with open(args.target_file, "r", encoding="utf-8") as f:
+        targets = _paragraphs(f.read())
+    if len(sources) != len(targets):
+        sys.exit(f"{args.source_file} has {len(sources)} paragraphs but {args.target_file} has {len(targets)}; "
+                 "parallel files must be aligned paragraph by paragraph.")
+    yield from zip(sources, targets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm or inspect the translation memory.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    jsonl = sub.add_parser("import-jsonl", help='import {"source": ..., "target": ...} lines')
+    jsonl.add_argument("path")
+    parallel = sub.add_parser("import-parallel", help="import two files aligned paragraph by paragraph")
+    parallel.add_argument("source_file")
+    parallel.add_argument("target_file")
+    for command in (jsonl, parallel):
+        command.add_argument("--from", dest="source_language", required=True)
+        command.add_argument("--to", dest="target_language", required=True)
+        command.add_argument("--glossary-version", help="defaults to the current version of the target glossary")
+    sub.add_parser("stats")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        print(json.dumps(memory_stats(), indent=2))
+        return
+
+    version = args.glossary_version
+    if version is None:
+        from glossary import glossaries
+        version = glossaries.version(args.target_language)
+
+    stored, batch = 0, []
+    for pair in _read_pairs(args):
+        batch.append(pair)
+        if len(batch) >= 1000:
+            stored += store_segments(batch, args.source_language, args.target_language, version)
+            batch = []
+    stored += store_segments(batch, args.source_language, args.target_language, version)
+    print(f"Stored {stored} segments ({args.source_language} -> {args.target_language}, glossary {version}).")
+
+
+if __name__ == "__main__":
+    main()
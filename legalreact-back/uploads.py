@@ -0,0 +1,83 @@
+import os
+import uuid
+import hashlib
+import threading
+from datetime import datetime, timezone
+from cache import SQLiteConnection
+
+# Local index of documents uploaded through this app, so request paths never list a container
+UPLOAD_INDEX_PATH = os.getenv("UPLOAD_INDEX_PATH", "uploads.db")
+
+_lock = threading.Lock()
+_db = SQLiteConnection(UPLOAD_INDEX_PATH)
+_db.execute("""
+    CREATE TABLE IF NOT EXISTS uploads (
+        container TEXT, blob_name TEXT, etag TEXT, size INTEGER, uploaded_at TEXT, sha256 TEXT,
+        PRIMARY KEY (container, blob_name)
+    )
+""")
+if "sha256" not in [column[1] for column in _db.execute("PRAGMA table_info(uploads)")]:
+    _db.execute("ALTER TABLE uploads ADD COLUMN sha256 TEXT")
+_db.execute("CREATE INDEX IF NOT EXISTS uploads_recent ON uploads (container, uploaded_at)")
+_db.commit()
+
+
+_COLUMNS = "container, blob_name, etag, size, uploaded_at, sha256"
+
+
+def _handle(row):
+    container, blob_name, etag, size, uploaded_at, sha256 = row
+    return {"container": container, "blob_name": blob_name, "etag": etag, "size": size,
+            "uploaded_at": uploaded_at, "sha256": sha256}
+
+
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def unique_blob_name(file_name):
+    """Blob name for an upload: a random prefix, so same-named uploads never overwrite each other's blob."""
+    return f"{uuid.uuid4().hex}_{os.path.basename(file_name)}"
+
+
+def record_upload(container, blob_name, upload_result=None, file_path=None):
+    """
+    Records a finished upload and returns its document handle
+    ({"container", "blob_name", "etag", "size", "uploaded_at", "sha256"}).
+    `upload_result` is the dict returned by BlobClient.upload_blob; `file_path` is
+    the local copy that was uploaded, used for the size and content hash.
+    """
+    upload_result = upload_result or {}
+    last_modified = upload_result.get("last_modified") or datetime.now(timezone.utc)
+    size = os.path.getsize(file_path) if file_path else None
+    sha256 = file_sha256(file_path) if file_path else None
+    row = (container, blob_name, upload_result.get("etag"), size, last_modified.isoformat(), sha256)
+    with _lock:
+        _db.execute(f"INSERT OR REPLACE INTO uploads ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)", row)
+        _db.commit()
+    return _handle(row)
+
+
+def get_latest_upload(container):
+    """Returns the handle of the most recent upload to the container, or None."""
+    with _lock:
+        row = _db.execute(
+            f"SELECT {_COLUMNS} FROM uploads WHERE container = ? "
+            "ORDER BY uploaded_at DESC LIMIT 1",
+            (container,),
+        ).fetchone()
+    return _handle(row) if row else None
+
+
+def list_recent_uploads(container, limit=20):
+    with _lock:
+        rows = _db.execute(
+            f"SELECT {_COLUMNS} FROM uploads WHERE container = ? "
+            "ORDER BY uploaded_at DESC LIMIT ?",
+            (container, limit),
+        ).fetchall()
+    return [_handle(row) for row in rows]
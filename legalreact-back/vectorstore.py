@@ -0,0 +1,707 @@
+import os
+import re
+import json
+import time
+import asyncio
+import functools
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from cache import SQLiteConnection
+from quantization import QUANTIZERS, PQ_MIN_RERANK_CANDIDATES, save_quantizer, load_quantizer
+
+# Vector store configuration
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "pinecone")  # "pinecone" or "local"
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "vector_store")
+VECTOR_DIMENSION = int(os.getenv("VECTOR_DIMENSION", "1536"))
+IVF_MIN_VECTORS = int(os.getenv("VECTOR_STORE_IVF_MIN_VECTORS", "50000"))
+IVF_NPROBE = int(os.getenv("VECTOR_STORE_IVF_NPROBE", "16"))
+
+# Metadata keys the local index partitions rows by; filters on them only score the matching partitions
+PARTITION_KEYS = [key.strip() for key in os.getenv("VECTOR_STORE_PARTITION_KEYS", "jurisdiction,act,section").split(",") if key.strip()]
+# A filter selecting more than this share of the index scans it sequentially (with a mask) instead of gathering rows
+PARTITION_SCAN_FRACTION = float(os.getenv("VECTOR_STORE_PARTITION_SCAN_FRACTION", "0.15"))
+
+# With int8/PQ codes, this many times top_k candidates are re-ranked with the full-precision vectors
+RERANK_CANDIDATES = int(os.getenv("VECTOR_STORE_RERANK_CANDIDATES", "20"))
+
+SEARCH_BLOCK_ROWS = 65536
+
+# aquery() runs index queries here so they do not block the event loop of the async serving mode
+VECTOR_QUERY_WORKERS = int(os.getenv("VECTOR_QUERY_WORKERS", "16"))
+query_executor = ThreadPoolExecutor(max_workers=VECTOR_QUERY_WORKERS, thread_name_prefix="vector-query")
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+class QueryResult(dict):
+    """Pinecone-shaped query response: supports both results["matches"] and results.matches."""
+
+    @property
+    def matches(self):
+        return self.get("matches", [])
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(scores, rows, top_k):
+    """Returns (scores, rows) of the top_k highest scores, best first."""
+    if len(scores) > top_k:
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        scores, rows = scores[best], rows[best]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], rows[order]
+
+
+def partition_value(key, value):
+    """Normalizes a metadata value for partition lookups: case and spacing are ignored, and "Section 420" is section "420"."""
+    value = re.sub(r"\s+", " ", str(value)).strip().lower()
+    if key == "section":
+        value = re.sub(r"^(?:section|sec\.?|s\.)\s*", "", value)
+    return value
+
+
+def _partition_entries(metadata, keys):
+    """(key, value) pairs a record belongs to; a list value puts it in several partitions of that key."""
+    entries = []
+    for key in keys:
+        values = metadata.get(key)
+        if values is None:
+            continue
+        for value in values if isinstance(values, list) else [values]:
+            entries.append((key, partition_value(key, value)))
+    return entries
+
+
+_OPERATORS = {
+    "$eq": lambda a, b: a == b,
+    "$ne": lambda a, b: a != b,
+    "$gt": lambda a, b: a is not None and a > b,
+    "$gte": lambda a, b: a is not None and a >= b,
+    "$lt": lambda a, b: a is not None and a < b,
+    "$lte": lambda a, b: a is not None and a <= b,
+    "$in": lambda a, b: a in b,
+    "$nin": lambda a, b: a not in b,
+}
+
+
+def matches_filter(metadata, filter, normalized_keys=()):
+    """
+    Evaluates a Pinecone metadata filter ($eq, $ne, $gt(e), $lt(e), $in, $nin, $and, $or) against one record.
+    Equality operators on normalized_keys compare partition_value()s, the way partition lookups match.
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, part, normalized_keys) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, part, normalized_keys) for part in condition):
+                return False
+        else:
+            value = metadata.get(key)
+            operators = condition if isinstance(condition, dict) else {"$eq": condition}
+            for operator, operand in operators.items():
+                values = value if isinstance(value, list) else [value]
+                if key in normalized_keys and operator in ("$eq", "$ne", "$in", "$nin"):
+                    values = [None if v is None else partition_value(key, v) for v in values]
+                    operand = ({partition_value(key, o) for o in operand} if operator in ("$in", "$nin")
+                               else partition_value(key, operand))
+                if operator in ("$ne", "$nin"):
+                    if not all(_OPERATORS[operator](v, operand) for v in values):
+                        return False
+                elif not any(_OPERATORS[operator](v, operand) for v in values):
+                    return False
+    return True
+
+
+def _as_records(vectors):
+    """Accepts Pinecone upsert input (dicts or (id, values[, metadata]) tuples)."""
+    records = []
+    for item in vectors:
+        if isinstance(item, dict):
+            records.append((str(item["id"]), item["values"], item.get("metadata") or {}))
+        else:
+            vector_id, values = item[0], item[1]
+            metadata = item[2] if len(item) > 2 else {}
+            records.append((str(vector_id), values, metadata or {}))
+    return records
+
+
+class LocalIndex:
+    """
+    In-process vector index with a Pinecone-like query/upsert API.
+
+    Vectors live in a memory-mapped float32 file, ids and metadata in SQLite.
+    Small indexes are searched exactly; once an IVF index has been built,
+    queries probe only the nearest clusters (plus rows added after the build).
+
+    Rows are also partitioned by the metadata keys in PARTITION_KEYS (e.g.
+    jurisdiction, section). A query whose filter names one of them scores only
+    the rows of the matching partitions, exactly, instead of post-filtering a
+    global top-k; other filter conditions are checked on those rows' metadata.
+
+    Once a quantizer has been built (build_quantizer: int8 or pq), every search
+    path scores compact codes (codes.u8, memory-mapped) instead of the float32
+    vectors, then re-ranks the best RERANK_CANDIDATES x top_k with the float32
+    vectors, so only those rows of vectors.f32 are read.
+    """
+
+    def __init__(self, path, dimension=VECTOR_DIMENSION, metric="cosine", partition_keys=None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._db = SQLiteConnection(os.path.join(path, "index.db"))
+        self._db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (row INTEGER PRIMARY KEY, id TEXT UNIQUE, metadata TEXT, deleted INTEGER DEFAULT 0)"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS partitions (row INTEGER, key TEXT, value TEXT)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS partitions_row ON partitions (row)")
+        self._db.commit()
+        self.partition_keys = list(PARTITION_KEYS if partition_keys is None else partition_keys)
+        self._filter_stats = {}
+
+        settings = dict(self._db.execute("SELECT key, value FROM settings").fetchall())
+        if settings:
+            self.dimension = int(settings["dimension"])
+            self.metric = settings["metric"]
+        else:
+            self.dimension, self.metric = dimension, metric
+            self._db.executemany(
+                "INSERT INTO settings (key, value) VALUES (?, ?)",
+                [("dimension", str(dimension)), ("metric", metric)],
+            )
+            self._db.commit()
+
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._ivf_path = os.path.join(path, "ivf.npz")
+        self._codes_path = os.path.join(path, "codes.u8")
+        self._quantizer_path = os.path.join(path, "quantizer.npz")
+        self._load()
+
+    # ------------------------------------------------------------------ storage
+
+    def _load(self):
+        rows = self._db.execute("SELECT row, id, deleted FROM vectors ORDER BY row").fetchall()
+        self._ids = [vector_id for _, vector_id, _ in rows]
+        self._row_of = {vector_id: row for row, vector_id, deleted in rows if not deleted}
+        self._alive = np.zeros(len(rows), dtype=bool)
+        for row, _, deleted in rows:
+            self._alive[row] = not deleted
+        self._map_vectors(len(rows))
+        self._ivf = dict(np.load(self._ivf_path)) if os.path.exists(self._ivf_path) else None
+        self._quantizer = load_quantizer(self._quantizer_path) if os.path.exists(self._quantizer_path) else None
+        self._map_codes(len(rows))
+        self._load_partitions()
+
+    def _load_partitions(self):
+        stored_keys = self._db.execute("SELECT value FROM settings WHERE key = 'partition_keys'").fetchone()
+        if stored_keys is None or stored_keys[0] != ",".join(self.partition_keys):
+            # New index, an index from before partitioning, or different keys: (re)build from the metadata
+            self._db.execute("DELETE FROM partitions")
+            for start in range(0, len(self._alive), SEARCH_BLOCK_ROWS):
+                fetched = self._db.execute(
+                    "SELECT row, metadata FROM vectors WHERE deleted = 0 AND row >= ? AND row < ?",
+                    (start, start + SEARCH_BLOCK_ROWS),
+                ).fetchall()
+                self._db.executemany(
+                    "INSERT INTO partitions (row, key, value) VALUES (?, ?, ?)",
+                    [(row, key, value) for row, metadata in fetched
+                     for key, value in _partition_entries(json.loads(metadata) if metadata else {}, self.partition_keys)],
+                )
+            self._db.execute(
+                "INSERT OR REPLACE INTO settings (key, value) VALUES ('partition_keys', ?)", (",".join(self.partition_keys),)
+            )
+            self._db.commit()
+
+        self._partitions = {key: {} for key in self.partition_keys}
+        for row, key, value in self._db.execute("SELECT row, key, value FROM partitions"):
+            if key in self._partitions:
+                self._partitions[key].setdefault(value, set()).add(row)
+        self._partition_rows = {}  # (key, value) -> sorted row array, rebuilt after writes
+
+    def _set_partitions(self, rows_metadata, replace):
+        """Records the partition entries of (row, metadata) pairs, dropping the rows' old entries when replace is set."""
+        rows = [row for row, _ in rows_metadata]
+        for start in range(0, len(rows) if replace else 0, 900):  # stay under SQLite's bound-parameter limit
+            batch = rows[start:start + 900]
+            placeholders = ",".join("?" * len(batch))
+            for row, key, value in self._db.execute(
+                f"SELECT row, key, value FROM partitions WHERE row IN ({placeholders})", batch
+            ).fetchall():
+                self._partitions.get(key, {}).get(value, set()).discard(row)
+            self._db.execute(f"DELETE FROM partitions WHERE row IN ({placeholders})", batch)
+        entries = [(row, key, value) for row, metadata in rows_metadata
+                   for key, value in _partition_entries(metadata, self.partition_keys)]
+        for row, key, value in entries:
+            self._partitions[key].setdefault(value, set()).add(row)
+        self._db.executemany("INSERT INTO partitions (row, key, value) VALUES (?, ?, ?)", entries)
+        self._partition_rows = {}
+
+    def _map_vectors(self, count):
+        if count == 0:
+            self._vectors = np.zeros((0, self.dimension), dtype=np.float32)
+        else:
+            self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode="r+", shape=(count, self.dimension))
+
+    def _map_codes(self, count):
+        """Maps codes.u8 over `count` rows, first encoding any rows it is missing (e.g. after an interrupted upsert)."""
+        if self._quantizer is None:
+            self._codes = None
+            return
+        code_size = self._quantizer.code_size
+        encoded = os.path.getsize(self._codes_path) // code_size if os.path.exists(self._codes_path) else 0
+        if encoded < count:
+            with open(self._codes_path, "r+b" if os.path.exists(self._codes_path) else "wb") as f:
+                f.seek(encoded * code_size)
+                for start in range(encoded, count, SEARCH_BLOCK_ROWS):
+                    f.write(self._quantizer.encode(np.asarray(self._vectors[start:min(start + SEARCH_BLOCK_ROWS, count)])).tobytes())
+                f.truncate()
+        if count == 0:
+            self._codes = np.zeros((0, code_size), dtype=np.uint8)
+        else:
+            self._codes = np.memmap(self._codes_path, dtype=np.uint8, mode="r+", shape=(count, code_size))
+
+    def _prepare(self, values):
+        vectors = np.asarray(values, dtype=np.float32).reshape(-1, self.dimension)
+        return _normalize(vectors) if self.metric == "cosine" else vectors
+
+    def upsert(self, vectors, namespace=None):
+        """Inserts or overwrites vectors; returns {"upserted_count": n} like Pinecone."""
+        records = _as_records(vectors)
+        if not records:
+            return {"upserted_count": 0}
+
+        with self._lock:
+            # Later duplicates of an id win, as they would with sequential upserts
+            latest = {vector_id: (values, metadata) for vector_id, values, metadata in records}
+            updates, appends = [], []
+            for vector_id, (values, metadata) in latest.items():
+                (updates if vector_id in self._row_of else appends).append((vector_id, values, metadata))
+
+            for vector_id, values, metadata in updates:
+                row = self._row_of[vector_id]
+                self._vectors[row] = self._prepare(values)[0]
+                if self._codes is not None:
+                    self._codes[row] = self._quantizer.encode(self._vectors[row:row + 1])[0]
+                self._db.execute("UPDATE vectors SET metadata = ? WHERE row = ?", (json.dumps(metadata), row))
+            if updates:
+                self._set_partitions([(self._row_of[vector_id], metadata) for vector_id, _, metadata in updates], replace=True)
+
+            if appends:
+                start = len(self._alive)
+                block = self._prepare([values for _, values, _ in appends])
+                if isinstance(self._vectors, np.memmap):
+                    self._vectors.flush()
+                # Write at the committed row count so bytes left by an interrupted upsert are overwritten
+                with open(self._vectors_path, "r+b" if os.path.exists(self._vectors_path) else "wb") as f:
+                    f.seek(start * self.dimension * 4)
+                    f.write(block.astype(np.float32).tobytes())
+                    f.truncate()
+                if self._quantizer is not None:
+                    if isinstance(self._codes, np.memmap):
+                        self._codes.flush()
+                    with open(self._codes_path, "r+b" if os.path.exists(self._codes_path) else "wb") as f:
+                        f.seek(start * self._quantizer.code_size)
+                        f.write(self._quantizer.encode(block).tobytes())
+                        f.truncate()
+                self._db.executemany(
+                    "INSERT INTO vectors (row, id, metadata, deleted) VALUES (?, ?, ?, 0)",
+                    [(start + i, vector_id, json.dumps(metadata)) for i, (vector_id, _, metadata) in enumerate(appends)],
+                )
+                for i, (vector_id, _, _) in enumerate(appends):
+                    self._row_of[vector_id] = start + i
+                    self._ids.append(vector_id)
+                self._set_partitions([(start + i, metadata) for i, (_, _, metadata) in enumerate(appends)], replace=False)
+                self._alive = np.concatenate([self._alive, np.ones(len(appends), dtype=bool)])
+                self._map_vectors(len(self._alive))
+                self._map_codes(len(self._alive))
+            elif isinstance(self._vectors, np.memmap):
+                self._vectors.flush()
+                if isinstance(self._codes, np.memmap):
+                    self._codes.flush()
+
+            self._db.commit()
+        return {"upserted_count": len(records)}
+
+    def delete(self, ids=None, delete_all=False, namespace=None):
+        """Removes vectors by id (rows are tombstoned and skipped by queries)."""
+        with self._lock:
+            if delete_all:
+                ids = list(self._row_of)
+            rows = [self._row_of.pop(str(vector_id)) for vector_id in ids or [] if str(vector_id) in self._row_of]
+            if rows:
+                self._alive[rows] = False
+                self._db.executemany("UPDATE vectors SET deleted = 1, id = NULL WHERE row = ?", [(row,) for row in rows])
+                self._set_partitions([(row, {}) for row in rows], replace=True)
+                self._db.commit()
+        return {}
+
+    def fetch(self, ids, namespace=None):
+        """Returns {"vectors": {id: {"id", "values", "metadata"}}} for the ids that exist."""
+        found = {}
+        with self._lock:
+            for vector_id in ids:
+                row = self._row_of.get(str(vector_id))
+                if row is None:
+                    continue
+                found[str(vector_id)] = {
+                    "id": str(vector_id),
+                    "values": self._vectors[row].tolist(),
+                    "metadata": self._metadata_for([row])[row],
+                }
+        return {"vectors": found}
+
+    def list(self, prefix=None, limit=100, namespace=None):
+        """Yields pages of up to `limit` ids (optionally starting with prefix), like Pinecone's list()."""
+        with self._lock:
+            ids = sorted(vector_id for vector_id in self._row_of if prefix is None or vector_id.startswith(prefix))
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def describe_index_stats(self):
+        return {
+            "dimension": self.dimension,
+            "metric": self.metric,
+            "total_vector_count": len(self._row_of),
+            "ivf_lists": 0 if self._ivf is None else len(self._ivf["centroids"]),
+            "quantization": None if self._quantizer is None else self._quantizer.kind,
+            "bytes_per_vector": self.dimension * 4 if self._quantizer is None else self._quantizer.code_size,
+            "partitions": {key: len([v for v, rows in values.items() if rows]) for key, values in self._partitions.items()},
+        }
+
+    def partition_values(self, key):
+        """The normalized values of a partition key that have at least one row."""
+        return sorted(value for value, rows in self._partitions.get(key, {}).items() if rows)
+
+    def filter_stats(self):
+        """Per filter (partition values it selected, or "unpartitioned"): queries, selectivity and latency."""
+        with self._lock:
+            return {
+                label: {
+                    "queries": stats["queries"],
+                    "avg_rows_scanned": round(stats["rows_scanned"] / stats["queries"], 1),
+                    "selectivity": round(stats["rows_scanned"] / stats["rows_total"], 6) if stats["rows_total"] else None,
+                    "avg_ms": round(stats["seconds"] / stats["queries"] * 1000, 3),
+                    "max_ms": round(stats["max_seconds"] * 1000, 3),
+                }
+                for label, stats in self._filter_stats.items()
+            }
+
+    def _metadata_for(self, rows):
+        placeholders = ",".join("?" * len(rows))
+        fetched = self._db.execute(
+            f"SELECT row, metadata FROM vectors WHERE row IN ({placeholders})", [int(r) for r in rows]
+        ).fetchall()
+        return {row: json.loads(metadata) if metadata else {} for row, metadata in fetched}
+
+    # ------------------------------------------------------------------ search
+
+    def _rows_for(self, key, value):
+        rows = self._partition_rows.get((key, value))
+        if rows is None:
+            rows = np.array(sorted(self._partitions[key].get(value, ())), dtype=np.int64)
+            self._partition_rows[(key, value)] = rows
+        return rows
+
+    def _filtered_rows(self, filter):
+        """
+        Returns (rows, label): the live rows matching filter, and a label naming
+        the partitions it selected. Conditions on partition keys ($eq/$in, at the
+        top level or inside $and) select partitions; the rest is checked on the
+        metadata of the selected rows, with partition-key values normalized the
+        same way, so {"jurisdiction": "india"} matches "India" inside $or too.
+        """
+        conditions = [
+            (key, condition)
+            for part in [filter] + list(filter.get("$and", []))
+            for key, condition in part.items() if key != "$and"
+        ]
+        residual, selected, labels = [], None, []
+        for key, condition in conditions:
+            operators = condition if isinstance(condition, dict) else {"$eq": condition}
+            if key in self._partitions and set(operators) <= {"$eq", "$in"}:
+                values = set()
+                for operator, operand in operators.items():
+                    values.update([operand] if operator == "$eq" else operand)
+                values = sorted({partition_value(key, value) for value in values})
+                rows = np.unique(np.concatenate([self._rows_for(key, value) for value in values])) if values else np.empty(0, dtype=np.int64)
+                selected = rows if selected is None else np.intersect1d(selected, rows, assume_unique=True)
+                labels.append(f"{key}={'|'.join(values)}")
+            else:
+                residual.append({key: condition})
+        if selected is None:
+            selected = np.flatnonzero(self._alive)
+        if residual and len(selected):
+            metadata = {}
+            for start in range(0, len(selected), 900):  # stay under SQLite's bound-parameter limit
+                metadata.update(self._metadata_for(selected[start:start + 900]))
+            residual = {"$and": residual}
+            selected = np.array([row for row in selected if matches_filter(metadata.get(int(row), {}), residual, self._partitions)], dtype=np.int64)
+        return selected, "&".join(labels) or "unpartitioned"
+
+    def _record_filter(self, label, rows_scanned, seconds):
+        if label not in self._filter_stats and len(self._filter_stats) >= 256:
+            label = "other"
+        stats = self._filter_stats.setdefault(
+            label, {"queries": 0, "rows_scanned": 0, "rows_total": 0, "seconds": 0.0, "max_seconds": 0.0}
+        )
+        stats["queries"] += 1
+        stats["rows_scanned"] += rows_scanned
+        stats["rows_total"] += len(self._row_of)
+        stats["seconds"] += seconds
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def _read_vectors(self, rows):
+        """
+        Reads rows of vectors.f32 with pread instead of through the memory map:
+        a page fault can map a whole large folio of the file into the process,
+        so a few hundred re-ranked rows would otherwise pin most of the file.
+        """
+        row_bytes = self.dimension * 4
+        with open(self._vectors_path, "rb") as f:
+            data = b"".join(os.pread(f.fileno(), row_bytes, int(row) * row_bytes) for row in rows)
+        return np.frombuffer(data, dtype=np.float32).reshape(len(rows), self.dimension)
+
+    def _snapshot(self):
+        """
+        The arrays a search reads, taken under the lock so the scan itself can run
+        without it. Appends and re-quantization swap these objects rather than
+        resize them, so a snapshot stays consistent; the tombstone mask is copied
+        because deletes clear it in place.
+        """
+        return {
+            "alive": self._alive.copy(),
+            "vectors": self._vectors,
+            "codes": self._codes,
+            "quantizer": self._quantizer,
+            "ivf": self._ivf,
+            "ids": self._ids,
+        }
+
+    def _scorer(self, snapshot, query, quantized):
+        """Returns a function scoring rows (a slice or row array) against query, from the codes if quantized."""
+        vectors, codes, quantizer = snapshot["vectors"], snapshot["codes"], snapshot["quantizer"]
+        if not quantized:
+            return lambda rows: np.asarray(vectors[rows] @ query)
+        prepared = quantizer.prepare(query)
+        return lambda rows: quantizer.score(prepared, codes[rows])
+
+    def _score_rows(self, scorer, rows):
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = rows[start:start + SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = scorer(block)
+        return scores
+
+    def _search_exact(self, snapshot, scorer, top_k, mask=None):
+        """Scans every row; only rows set in mask (default: the live rows) are candidates."""
+        mask = snapshot["alive"] if mask is None else mask
+        best_scores = np.empty(0, dtype=np.float32)
+        best_rows = np.empty(0, dtype=np.int64)
+        total = len(snapshot["alive"])
+        for start in range(0, total, SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, total)
+            scores = scorer(slice(start, stop))
+            scores[~mask[start:stop]] = -np.inf
+            rows = np.arange(start, stop)
+            best_scores, best_rows = _top_k(
+                np.concatenate([best_scores, scores]), np.concatenate([best_rows, rows]), top_k
+            )
+        keep = np.isfinite(best_scores)
+        return best_scores[keep], best_rows[keep]
+
+    def _search_ivf(self, snapshot, query, scorer, top_k, nprobe):
+        ivf, alive = snapshot["ivf"], snapshot["alive"]
+        centroids, order, offsets = ivf["centroids"], ivf["order"], ivf["offsets"]
+        probe = np.argsort(-(centroids @ query))[:nprobe]
+        candidates = [order[offsets[c]:offsets[c + 1]] for c in probe]
+        # Rows appended after the IVF build are not in any list; scan them exactly
+        indexed_rows = int(ivf["rows"])
+        if indexed_rows < len(alive):
+            candidates.append(np.arange(indexed_rows, len(alive)))
+        rows = np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+        rows = rows[alive[rows]]
+        if len(rows) == 0:
+            return np.empty(0, dtype=np.float32), rows
+        return _top_k(self._score_rows(scorer, rows), rows, top_k)
+
+    def query(self, vector, top_k=10, include_metadata=False, include_values=False,
+              filter=None, namespace=None, nprobe=None, exact=False):
+        """
+        Returns the top_k nearest vectors (matching filter, if given) as a Pinecone-shaped QueryResult.
+        Only the snapshot, the filter's row selection and the metadata lookup hold
+        the lock; scoring and re-ranking run outside it, so concurrent queries on
+        one index overlap.
+        """
+        query = self._prepare(vector)[0]
+        started = time.perf_counter()
+        with self._lock:
+            if len(self._row_of) == 0:
+                return QueryResult(matches=[])
+            snapshot = self._snapshot()
+            rows, label = self._filtered_rows(filter) if filter else (None, None)
+
+        alive = snapshot["alive"]
+        use_ivf = snapshot["ivf"] is not None and not exact and len(alive) >= IVF_MIN_VECTORS
+        quantized = snapshot["quantizer"] is not None and not exact
+        scorer = self._scorer(snapshot, query, quantized)
+        candidates = top_k * RERANK_CANDIDATES if quantized else top_k
+        if filter:
+            scanned = len(rows)
+            if scanned > PARTITION_SCAN_FRACTION * len(alive):
+                mask = np.zeros(len(alive), dtype=bool)
+                mask[rows] = True
+                scores, rows = self._search_exact(snapshot, scorer, candidates, mask)
+            elif scanned:
+                scores, rows = _top_k(self._score_rows(scorer, rows), rows, candidates)
+            else:
+                scores = np.empty(0, dtype=np.float32)
+        elif use_ivf:
+            scores, rows = self._search_ivf(snapshot, query, scorer, candidates, nprobe or IVF_NPROBE)
+        else:
+            scores, rows = self._search_exact(snapshot, scorer, candidates)
+        if quantized and len(rows):
+            # Re-rank the candidates with their full-precision vectors
+            rows = np.sort(rows)
+            scores, rows = _top_k(self._read_vectors(rows) @ query, rows, top_k)
+        with self._lock:
+            metadata = self._metadata_for(rows) if include_metadata and len(rows) else {}
+            if filter:
+                self._record_filter(label, scanned, time.perf_counter() - started)
+
+        matches = []
+        for score, row in zip(scores, rows):
+            match = {"id": snapshot["ids"][int(row)], "score": float(score)}
+            if include_metadata:
+                match["metadata"] = metadata.get(int(row), {})
+            if include_values:
+                match["values"] = snapshot["vectors"][row].tolist()
+            matches.append(match)
+        return QueryResult(matches=matches)
+
+    # ------------------------------------------------------------------ IVF
+
+    def build_ivf(self, nlist=None, iterations=10, sample_size=None, seed=0):
+        """Clusters the live vectors with k-means and writes the IVF lists to disk."""
+        with self._lock:
+            alive_rows = np.flatnonzero(self._alive)
+            if len(alive_rows) == 0:
+                return None
+            nlist = nlist or max(1, int(np.sqrt(len(alive_rows))))
+            rng = np.random.default_rng(seed)
+            sample_size = min(len(alive_rows), sample_size or 64 * nlist)
+            sample = np.asarray(self._vectors[np.sort(rng.choice(alive_rows, sample_size, replace=False))])
+
+            centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = sample[assignment == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids).astype(np.float32)
+
+            assignment = np.empty(len(alive_rows), dtype=np.int32)
+            for start in range(0, len(alive_rows), SEARCH_BLOCK_ROWS):
+                block = alive_rows[start:start + SEARCH_BLOCK_ROWS]
+                assignment[start:start + len(block)] = np.argmax(self._vectors[block] @ centroids.T, axis=1)
+
+            by_list = np.argsort(assignment, kind="stable")
+            order = alive_rows[by_list].astype(np.int64)
+            offsets = np.searchsorted(assignment[by_list], np.arange(nlist + 1)).astype(np.int64)
+            self._ivf = {
+                "centroids": centroids,
+                "order": order,
+                "offsets": offsets,
+                "rows": np.array(len(self._alive)),
+            }
+            with open(self._ivf_path, "wb") as f:
+                np.savez(f, **self._ivf)
+        return nlist
+
+    # ------------------------------------------------------------------ quantization
+
+    def build_quantizer(self, kind, sample_size=20000, seed=0, **options):
+        """
+        Trains an int8 or pq quantizer (options: subvectors, iterations) on a sample
+        of the live vectors and encodes every row into codes.u8; kind None removes it.
+        Returns the code size in bytes per vector.
+        """
+        with self._lock:
+            for path in (self._quantizer_path, self._codes_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._quantizer = None
+            if kind is None:
+                self._codes = None
+                return self.dimension * 4
+            alive_rows = np.flatnonzero(self._alive)
+            if len(alive_rows) == 0:
+                raise ValueError("Cannot train a quantizer on an empty index")
+            rng = np.random.default_rng(seed)
+            sample_rows = np.sort(rng.choice(alive_rows, min(len(alive_rows), sample_size), replace=False))
+            quantizer = QUANTIZERS[kind].train(np.asarray(self._vectors[sample_rows]), seed=seed, **options)
+            save_quantizer(quantizer, self._quantizer_path)
+            self._quantizer = quantizer
+            self._map_codes(len(self._alive))
+        return quantizer.code_size
+
+
+def get_index(name):
+    """Returns the vector index called `name` from the configured backend."""
+    with _indexes_lock:
+        if name in _indexes:
+            return _indexes[name]
+
+        if VECTOR_STORE_BACKEND == "local":
+            index = LocalIndex(os.path.join(VECTOR_STORE_DIR, name))
+        else:
+            from clients import get_pinecone_client
+
+            index = get_pinecone_client().Index(name)
+
+        _indexes[name] = index
+        return index
+
+
+def filter_stats():
+    """Filtered-query stats (selectivity, latency per partition) of the local indexes opened so far."""
+    with _indexes_lock:
+        indexes = dict(_indexes)
+    return {name: index.filter_stats() for name, index in indexes.items() if isinstance(index, LocalIndex)}
+
+
+async def aquery(index, **kwargs):
+    """index.query(**kwargs) for async callers, on query_executor (numpy search, or the Pinecone client)."""
+    return await asyncio.get_running_loop().run_in_executor(query_executor, functools.partial(index.query, **kwargs))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain local vector indexes.")
+    parser.add_argument("command", choices=["build-ivf", "quantize", "stats"])
+    parser.add_argument("index", help="Index name, e.g. past-cases or law-kb")
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--kind", choices=[*QUANTIZERS, "none"], default="int8",
+                        help="quantize: code format; pq needs a much larger VECTOR_STORE_RERANK_CANDIDATES (see quantization.py)")
+    parser.add_argument("--subvectors", type=int, default=96, help="quantize: PQ bytes per vector")
+    args = parser.parse_args()
+
+    local_index = LocalIndex(os.path.join(VECTOR_STORE_DIR, args.index))
+    if args.command == "build-ivf":
+        print(f"Built IVF index with {local_index.build_ivf(nlist=args.nlist)} lists.")
+    elif args.command == "quantize":
+        kind = None if args.kind == "none" else args.kind
+        options = {"subvectors": args.subvectors} if kind == "pq" else {}
+        if kind == "pq" and RERANK_CANDIDATES < PQ_MIN_RERANK_CANDIDATES:
+            print(f"⚠️ PQ recall is low with VECTOR_STORE_RERANK_CANDIDATES={RERANK_CANDIDATES}; "
+                  f"set it to {PQ_MIN_RERANK_CANDIDATES} or more before serving from this index.")
+        print(f"Encoded vectors at {local_index.build_quantizer(kind, **options)} bytes each.")
+    print(local_index.describe_index_stats())
@@ -1,41 +1,39 @@
 import os
+import re
 import json
-import openai
-import pinecone
-from langchain_openai import AzureChatOpenAI
-
-# Load environment variables
-OPENAI_API_KEY = os.getenv("OPENAI_GPT_API_KEY")
-AZURE_ENDPOINT = os.getenv("OPENAI_GPT_ENDPOINT")
-PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
-
-# Initialize OpenAI & Pinecone
-openai_client = openai.AzureOpenAI(
-    api_key=os.getenv("EMBEDDING_API_KEY"),
-    api_version=os.getenv("EMBEDDING_API_VERSION"),
-    azure_endpoint=os.getenv("EMBEDDING_API_ENDPOINT")
-)
-
-llm = AzureChatOpenAI(
-    azure_deployment="gpt-4o-mini",
-    azure_endpoint=AZURE_ENDPOINT,
-    api_key=OPENAI_API_KEY,
-    api_version="2024-10-21",
-    temperature=0.2
-)
-
-pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
-knowledge_index = pc.Index("law-kb")
-cases_index = pc.Index("past-cases")
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from embeddings import get_embedding, aget_embedding
+from vectorstore import get_index, aquery, partition_value
+from lexical import STATUTE_REFERENCE
+from llm_cache import cached_invoke, cached_stream, acached_invoke, acached_stream
+from clients import get_chat_llm, get_async_chat_llm, get_embedding_client
+
+# Vector indexes, opened on first use
+KNOWLEDGE_INDEX_NAME = "law-kb"
+CASES_INDEX_NAME = "past-cases"
+
+# Run independent stages of process_case in parallel (set VERDICT_CONCURRENT=false for the serial path)
+VERDICT_CONCURRENT = os.getenv("VERDICT_CONCURRENT", "true").lower() in ("1", "true", "yes")
+verdict_executor = ThreadPoolExecutor(max_workers=int(os.getenv("VERDICT_WORKERS", "16")), thread_name_prefix="verdict")
+
+# Pre-filter the law search by the case's jurisdiction and cited sections (set VERDICT_LAW_FILTERS=false to search everything)
+VERDICT_LAW_FILTERS = os.getenv("VERDICT_LAW_FILTERS", "true").lower() in ("1", "true", "yes")
+# "attempted" counts the narrowest filter each search started with, "served" the one whose results it returned
+_law_search_stats = {
+    "searches": 0, "widened": 0,
+    "attempted": {"by_section": 0, "by_jurisdiction": 0, "unfiltered": 0},
+    "served": {"by_section": 0, "by_jurisdiction": 0, "unfiltered": 0},
+}
+_law_search_stats_lock = threading.Lock()
 
 import json
 import re
 
-def extract_case_details(case_input):
-    """Extracts structured case details from input text using GPT."""
-    print(f"📜 Extracting case details for: {case_input}")
-
-    prompt = f"""
+def build_case_details_prompt(case_input):
+    return f"""
     Extract key details from the following legal case text:
     - Case Description
     - Involved Parties
@@ -52,9 +50,19 @@ def extract_case_details(case_input):
 
     Case: "{case_input}"
     """
-    
-    response = llm.invoke(prompt)
-    raw_text = response.content.strip()
+
+def extract_case_details(case_input):
+    """Extracts structured case details from input text using GPT."""
+    print(f"📜 Extracting case details for: {case_input}")
+    response = cached_invoke(get_chat_llm(), build_case_details_prompt(case_input), "extract_case_details")
+    return parse_case_details(response.content)
+
+async def aextract_case_details(case_input):
+    response = await acached_invoke(get_async_chat_llm(), build_case_details_prompt(case_input), "extract_case_details")
+    return parse_case_details(response.content)
+
+def parse_case_details(raw_text):
+    raw_text = raw_text.strip()
 
     print(f"🧐 GPT Raw Response: {raw_text}")  # Debug print
 
@@ -71,18 +79,107 @@ def extract_case_details(case_input):
         return {"error": "Invalid JSON format returned by GPT"}
 
 def generate_embeddings(text):
-    """Generates an embedding for the given text."""
-    response = openai_client.embeddings.create(model="text-embedding-ada-002", input=text)
-    return response.data[0].embedding
+    """Generates an embedding for the given text (cached, shared with case search)."""
+    return get_embedding(text)
 
-def search_pinecone(index, query_embedding, top_k=5):
-    """Searches Pinecone for similar cases or laws."""
-    results = index.query(vector=query_embedding, top_k=top_k, include_metadata=True)
+def search_pinecone(index, query_embedding, top_k=5, filter=None):
+    """Searches the vector index (Pinecone or local) for similar cases or laws, optionally with a metadata filter."""
+    kwargs = {"filter": filter} if filter else {}
+    results = index.query(vector=query_embedding, top_k=top_k, include_metadata=True, **kwargs)
     return results.matches if results.matches else []
 
-def get_verdict(case_description, relevant_laws, similar_cases):
-    """Predicts a verdict based on case details, laws, and past cases."""
-    prompt = f"""
+async def asearch_pinecone(index, query_embedding, top_k=5, filter=None):
+    kwargs = {"filter": filter} if filter else {}
+    results = await aquery(index, vector=query_embedding, top_k=top_k, include_metadata=True, **kwargs)
+    return results.matches if results.matches else []
+
+def _jurisdiction_values(index, jurisdiction):
+    """
+    Filter values for an extracted jurisdiction. The local index knows its values,
+    so the ones named in the text are used ("Delhi High Court, India" -> "india");
+    for Pinecone the text and its comma-separated parts are passed as they are.
+    """
+    if not jurisdiction:
+        return []
+    known = getattr(index, "partition_values", None)
+    if known:
+        text = partition_value("jurisdiction", jurisdiction)
+        return [value for value in known("jurisdiction") if re.search(rf"\b{re.escape(value)}\b", text)]
+    parts = [jurisdiction] + re.split(r",|\band\b", jurisdiction)
+    return list(dict.fromkeys(part.strip() for part in parts if part.strip()))
+
+def _section_values(index, case_details):
+    """Sections cited in the alleged violations or description, e.g. "Section 420 IPC" -> "420"."""
+    text = " ".join(str(case_details.get(key, "")) for key in ("alleged_violations", "case_description"))
+    references = [ref for ref in STATUTE_REFERENCE.findall(text) if re.match(r"(?:section|sec|s)\b", ref, re.IGNORECASE)]
+    sections = list(dict.fromkeys(partition_value("section", ref) for ref in references))
+    known = getattr(index, "partition_values", None)
+    if known:
+        available = set(known("section"))
+        return [section for section in sections if section in available]
+    return sections + [f"Section {section}" for section in sections]
+
+def law_filters(index, case_details):
+    """(label, filter) pairs for the law search, narrowest first: jurisdiction and section, jurisdiction, none."""
+    if not VERDICT_LAW_FILTERS:
+        return [("unfiltered", None)]
+    jurisdictions = _jurisdiction_values(index, case_details.get("jurisdiction"))
+    sections = _section_values(index, case_details)
+    base = {"jurisdiction": {"$in": jurisdictions}} if jurisdictions else {}
+    filters = []
+    if sections:
+        filters.append(("by_section", {**base, "section": {"$in": sections}}))
+    if base:
+        filters.append(("by_jurisdiction", base))
+    filters.append(("unfiltered", None))
+    return filters
+
+def _collect(found, matches, top_k):
+    seen = {match["id"] for match in found}
+    found.extend(match for match in matches if match["id"] not in seen)
+    return len(found) >= top_k
+
+def _record_law_search(filters, used):
+    with _law_search_stats_lock:
+        _law_search_stats["searches"] += 1
+        _law_search_stats["attempted"][filters[0][0]] += 1
+        _law_search_stats["served"][filters[used - 1][0]] += 1
+        if used > 1:
+            _law_search_stats["widened"] += 1
+
+def search_laws(index, query_embedding, case_details, top_k=5):
+    """
+    Searches the law index with the case's jurisdiction/section pre-filters,
+    widening to the next filter while fewer than top_k laws are found.
+    """
+    filters = law_filters(index, case_details)
+    found = []
+    for used, (_, filter) in enumerate(filters, start=1):
+        if _collect(found, search_pinecone(index, query_embedding, top_k, filter=filter), top_k):
+            break
+    _record_law_search(filters, used)
+    return found[:top_k]
+
+async def asearch_laws(index, query_embedding, case_details, top_k=5):
+    filters = law_filters(index, case_details)
+    found = []
+    for used, (_, filter) in enumerate(filters, start=1):
+        if _collect(found, await asearch_pinecone(index, query_embedding, top_k, filter=filter), top_k):
+            break
+    _record_law_search(filters, used)
+    return found[:top_k]
+
+def law_search_stats():
+    """How often the law search started and ended narrowed by section or jurisdiction, and how often it had to widen."""
+    with _law_search_stats_lock:
+        return {
+            **_law_search_stats,
+            "attempted": dict(_law_search_stats["attempted"]),
+            "served": dict(_law_search_stats["served"]),
+        }
+
+def build_verdict_prompt(case_description, relevant_laws, similar_cases):
+    return f"""
     A legal case was submitted with the following details:
     Case Description: {case_description}
     Relevant Laws:
@@ -92,35 +189,147 @@ def get_verdict(case_description, relevant_laws, similar_cases):
     
     Based on the above, predict the most likely verdict and explain why.
     """
+
+def get_verdict(case_description, relevant_laws, similar_cases):
+    """Predicts a verdict based on case details, laws, and past cases."""
+    prompt = build_verdict_prompt(case_description, relevant_laws, similar_cases)
     try:
-        response = llm.invoke(prompt)
+        response = cached_invoke(get_chat_llm(), prompt, "get_verdict")
         return response.content
     except Exception as e:
         return f"Error generating verdict: {e}"
 
-def process_case(case_input):
-    """Processes a legal case and returns structured insights."""
-    print(f"🔍 Received case input: {case_input}")  
+def stream_verdict(case_description, relevant_laws, similar_cases):
+    """Same as get_verdict, but yields the completion token by token."""
+    prompt = build_verdict_prompt(case_description, relevant_laws, similar_cases)
+    try:
+        for chunk in cached_stream(get_chat_llm(), prompt, "get_verdict"):
+            if chunk.content:
+                yield chunk.content
+    except Exception as e:
+        yield f"Error generating verdict: {e}"
+
+async def aget_verdict(case_description, relevant_laws, similar_cases):
+    prompt = build_verdict_prompt(case_description, relevant_laws, similar_cases)
+    try:
+        response = await acached_invoke(get_async_chat_llm(), prompt, "get_verdict")
+        return response.content
+    except Exception as e:
+        return f"Error generating verdict: {e}"
+
+async def astream_verdict(case_description, relevant_laws, similar_cases):
+    prompt = build_verdict_prompt(case_description, relevant_laws, similar_cases)
+    try:
+        async for chunk in acached_stream(get_async_chat_llm(), prompt, "get_verdict"):
+            if chunk.content:
+                yield chunk.content
+    except Exception as e:
+        yield f"Error generating verdict: {e}"
 
-    # Step 1: Extract case details
-    case_details = extract_case_details(case_input)
+def format_laws(relevant_laws):
+    return "\n".join([f"Title: {law['metadata'].get('title', 'No Title')}" for law in relevant_laws])
+
+def format_cases(similar_cases):
+    return "\n".join([f"Title: {case['metadata'].get('title', 'No Title')}\nSummary: {case['metadata'].get('summary_chunk', 'No Summary')}" for case in similar_cases])
+
+def build_case_result(case_details, verdict, laws_text, cases_text):
+    return {
+        "case_description": case_details.get("case_description", "No description available"),
+        "involved_parties": case_details.get("involved_parties", "Unknown parties"),
+        "jurisdiction": case_details.get("jurisdiction", "Unknown jurisdiction"),
+        "alleged_violations": case_details.get("alleged_violations", "Unknown violations"),
+        "verdict": verdict,
+        "relevant_laws": laws_text,
+        "similar_cases": cases_text
+    }
+
+def _timed(timings, stage, func, *args):
+    """Calls func(*args) and records its wall time in milliseconds under timings[stage]."""
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+async def _atimed(timings, stage, awaitable):
+    start = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        timings[stage] = round((time.perf_counter() - start) * 1000, 1)
+
+def _gather_sequential(case_input, timings):
+    """Runs extraction, embedding and both index searches one after another."""
+    case_details = _timed(timings, "extract_case_details", extract_case_details, case_input)
     if not case_details or "error" in case_details:
         print("❌ Error extracting case details:", case_details)
         return {"error": "Failed to extract case details"}
 
-    case_description = case_details.get("case_description", "No description available")
-    print(f"📜 Case Description: {case_description}")
-
-    # Step 2: Generate embeddings
-    case_embedding = generate_embeddings(case_input)
+    case_embedding = _timed(timings, "generate_embeddings", generate_embeddings, case_input)
     if case_embedding is None:
         print("❌ Error: Failed to generate embeddings.")
         return {"error": "Failed to generate embeddings"}
 
-    # Step 3: Search for relevant laws and similar cases
-    relevant_laws = search_pinecone(knowledge_index, case_embedding)
-    similar_cases = search_pinecone(cases_index, case_embedding)
+    relevant_laws = _timed(timings, "search_laws", search_laws, get_index(KNOWLEDGE_INDEX_NAME), case_embedding, case_details)
+    similar_cases = _timed(timings, "search_cases", search_pinecone, get_index(CASES_INDEX_NAME), case_embedding)
+    return case_details, relevant_laws, similar_cases
+
+def _gather_concurrent(case_input, timings):
+    """
+    Overlaps the independent stages: extraction runs alongside embedding, the case
+    search starts as soon as the embedding is ready and the law search (filtered by
+    the extracted jurisdiction and sections) once both are. Queued work is cancelled
+    as soon as any stage fails.
+    """
+    details_future = verdict_executor.submit(_timed, timings, "extract_case_details", extract_case_details, case_input)
+    embedding_future = verdict_executor.submit(_timed, timings, "generate_embeddings", generate_embeddings, case_input)
+    pending = [details_future, embedding_future]
+    try:
+        case_embedding = embedding_future.result()
+        if case_embedding is None:
+            print("❌ Error: Failed to generate embeddings.")
+            return {"error": "Failed to generate embeddings"}
+
+        cases_future = verdict_executor.submit(_timed, timings, "search_cases", search_pinecone, get_index(CASES_INDEX_NAME), case_embedding)
+        pending.append(cases_future)
+
+        case_details = details_future.result()
+        if not case_details or "error" in case_details:
+            print("❌ Error extracting case details:", case_details)
+            return {"error": "Failed to extract case details"}
+
+        relevant_laws = _timed(timings, "search_laws", search_laws, get_index(KNOWLEDGE_INDEX_NAME), case_embedding, case_details)
+        return case_details, relevant_laws, cases_future.result()
+    finally:
+        for future in pending:
+            future.cancel()  # no-op for finished futures
+
+def process_case(case_input, concurrent=None):
+    """Processes a legal case and returns structured insights."""
+    print(f"🔍 Received case input: {case_input}")  
+    concurrent = VERDICT_CONCURRENT if concurrent is None else concurrent
+    timings = {}
+    start = time.perf_counter()
+
+    # Steps 1-3: Extract case details, generate embeddings, search for relevant laws and similar cases
+    gathered = _gather_concurrent(case_input, timings) if concurrent else _gather_sequential(case_input, timings)
+    if isinstance(gathered, dict):
+        return gathered
+
+    # Step 4: Format results
+    inputs = _verdict_inputs(*gathered)
+    if isinstance(inputs, dict):
+        return inputs
+    case_description, laws_text, cases_text = inputs
+
+    # Step 5: Get verdict
+    verdict = _timed(timings, "get_verdict", get_verdict, case_description, laws_text, cases_text)
+    return _case_result(gathered[0], verdict, laws_text, cases_text, timings, start, "concurrent" if concurrent else "sequential")
 
+def _verdict_inputs(case_details, relevant_laws, similar_cases):
+    """Checks the gathered stages and formats them for the verdict prompt; returns an error dict or (description, laws, cases)."""
+    case_description = case_details.get("case_description", "No description available")
+    print(f"📜 Case Description: {case_description}")
     print(f"📚 Found {len(relevant_laws)} relevant laws.")
     print(f"⚖️ Found {len(similar_cases)} similar cases.")
 
@@ -130,27 +339,214 @@ def process_case(case_input):
     if not similar_cases:
         return {"error": "No similar cases found"}
 
-    # Step 4: Format results
-    laws_text = "\n".join([f"Title: {law['metadata'].get('title', 'No Title')}" for law in relevant_laws])
-    cases_text = "\n".join([f"Title: {case['metadata'].get('title', 'No Title')}\nSummary: {case['metadata'].get('summary_chunk', 'No Summary')}" for case in similar_cases])
+    return case_description, format_laws(relevant_laws), format_cases(similar_cases)
 
-    # Step 5: Get verdict
-    verdict = get_verdict(case_description, laws_text, cases_text)
+def _case_result(case_details, verdict, laws_text, cases_text, timings, start, execution_mode):
     if verdict is None:
         print("❌ Error: Verdict generation failed.")
         return {"error": "Verdict generation failed"}
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
 
     # Step 6: Return final response
-    result = {
-        "case_description": case_description,
-        "involved_parties": case_details.get("involved_parties", "Unknown parties"),
-        "jurisdiction": case_details.get("jurisdiction", "Unknown jurisdiction"),
-        "alleged_violations": case_details.get("alleged_violations", "Unknown violations"),
-        "verdict": verdict,
-        "relevant_laws": laws_text,
-        "similar_cases": cases_text
-    }
+    result = build_case_result(case_details, verdict, laws_text, cases_text)
+    result["timings_ms"] = timings
+    result["execution_mode"] = execution_mode
 
     print("✅ Final Processed Case:", result)  
     return result
 
+async def aprocess_case(case_input):
+    """process_case for the async serving mode, with the stages overlapped as in _gather_concurrent."""
+    timings = {}
+    start = time.perf_counter()
+    details_task = asyncio.create_task(_atimed(timings, "extract_case_details", aextract_case_details(case_input)))
+    cases_task = None
+    try:
+        case_embedding = await _atimed(timings, "generate_embeddings", aget_embedding(case_input))
+        if case_embedding is None:
+            print("❌ Error: Failed to generate embeddings.")
+            return {"error": "Failed to generate embeddings"}
+        cases_task = asyncio.create_task(_atimed(timings, "search_cases", asearch_pinecone(get_index(CASES_INDEX_NAME), case_embedding)))
+        case_details = await details_task
+        if not case_details or "error" in case_details:
+            print("❌ Error extracting case details:", case_details)
+            return {"error": "Failed to extract case details"}
+        relevant_laws, similar_cases = await asyncio.gather(
+            _atimed(timings, "search_laws", asearch_laws(get_index(KNOWLEDGE_INDEX_NAME), case_embedding, case_details)),
+            cases_task,
+        )
+    finally:
+        # Also on errors: a stage still running is not needed, and a failed one's error is already moot
+        for task in (details_task, cases_task):
+            if task is None:
+                continue
+            task.cancel()  # no-op once finished
+            if task.done() and not task.cancelled():
+                task.exception()  # retrieve it, so it is not logged as "never retrieved"
+
+    inputs = _verdict_inputs(case_details, relevant_laws, similar_cases)
+    if isinstance(inputs, dict):
+        return inputs
+    case_description, laws_text, cases_text = inputs
+
+    verdict = await _atimed(timings, "get_verdict", aget_verdict(case_description, laws_text, cases_text))
+    return _case_result(case_details, verdict, laws_text, cases_text, timings, start, "async")
+
+def process_case_stream(case_input):
+    """
+    Streaming variant of process_case. Yields (event, data) tuples as stages finish:
+    details_extracted, laws_found, cases_found, then one token event per verdict
+    chunk and a final result event carrying the same payload as process_case.
+    Failures, including exceptions raised by a stage, are reported as a single
+    error event: the response has already started, so they cannot become a 500.
+    """
+    try:
+        yield from _process_case_events(case_input)
+    except Exception as e:
+        print(f"❌ Verdict stream failed: {e}")
+        yield "error", {"error": str(e)}
+
+
+def _process_case_events(case_input):
+    timings = {}
+    start = time.perf_counter()
+    futures = {
+        verdict_executor.submit(_timed, timings, "extract_case_details", extract_case_details, case_input): "details",
+        verdict_executor.submit(_timed, timings, "generate_embeddings", generate_embeddings, case_input): "embedding",
+    }
+    gathered = {}
+    try:
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = futures.pop(future)
+                value = future.result()
+                if stage == "details":
+                    if not value or "error" in value:
+                        yield "error", {"error": "Failed to extract case details"}
+                        return
+                    yield "details_extracted", value
+                elif stage == "embedding":
+                    if value is None:
+                        yield "error", {"error": "Failed to generate embeddings"}
+                        return
+                    futures[verdict_executor.submit(_timed, timings, "search_cases", search_pinecone, get_index(CASES_INDEX_NAME), value)] = "cases"
+                elif stage == "laws":
+                    yield "laws_found", {"count": len(value), "titles": [law["metadata"].get("title", "No Title") for law in value]}
+                elif stage == "cases":
+                    yield "cases_found", {"count": len(value), "titles": [case["metadata"].get("title", "No Title") for case in value]}
+                gathered[stage] = value
+                # The law search is filtered by the extracted details, so it waits for both
+                if stage in ("details", "embedding") and "details" in gathered and "embedding" in gathered:
+                    futures[verdict_executor.submit(_timed, timings, "search_laws", search_laws, get_index(KNOWLEDGE_INDEX_NAME), gathered["embedding"], gathered["details"])] = "laws"
+    finally:
+        for future in futures:
+            future.cancel()
+
+    if not gathered["laws"]:
+        yield "error", {"error": "No relevant laws found"}
+        return
+    if not gathered["cases"]:
+        yield "error", {"error": "No similar cases found"}
+        return
+
+    case_details = gathered["details"]
+    laws_text = format_laws(gathered["laws"])
+    cases_text = format_cases(gathered["cases"])
+    case_description = case_details.get("case_description", "No description available")
+
+    verdict_start = time.perf_counter()
+    tokens = []
+    for token in stream_verdict(case_description, laws_text, cases_text):
+        if not tokens:
+            timings["first_verdict_token"] = round((time.perf_counter() - start) * 1000, 1)
+        tokens.append(token)
+        yield "token", {"text": token}
+    timings["get_verdict"] = round((time.perf_counter() - verdict_start) * 1000, 1)
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+
+    result = build_case_result(case_details, "".join(tokens), laws_text, cases_text)
+    result["timings_ms"] = timings
+    result["execution_mode"] = "streaming"
+    yield "result", result
+
+
+async def aprocess_case_stream(case_input):
+    """process_case_stream for the async serving mode: an async generator of the same events."""
+    try:
+        async for event in _aprocess_case_events(case_input):
+            yield event
+    except Exception as e:
+        print(f"❌ Verdict stream failed: {e}")
+        yield "error", {"error": str(e)}
+
+
+async def _aprocess_case_events(case_input):
+    timings = {}
+    start = time.perf_counter()
+    tasks = {
+        asyncio.create_task(_atimed(timings, "extract_case_details", aextract_case_details(case_input))): "details",
+        asyncio.create_task(_atimed(timings, "generate_embeddings", aget_embedding(case_input))): "embedding",
+    }
+    gathered = {}
+    try:
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                stage = tasks.pop(task)
+                value = task.result()
+                if stage == "details":
+                    if not value or "error" in value:
+                        yield "error", {"error": "Failed to extract case details"}
+                        return
+                    yield "details_extracted", value
+                elif stage == "embedding":
+                    if value is None:
+                        yield "error", {"error": "Failed to generate embeddings"}
+                        return
+                    tasks[asyncio.create_task(_atimed(timings, "search_cases", asearch_pinecone(get_index(CASES_INDEX_NAME), value)))] = "cases"
+                elif stage == "laws":
+                    yield "laws_found", {"count": len(value), "titles": [law["metadata"].get("title", "No Title") for law in value]}
+                elif stage == "cases":
+                    yield "cases_found", {"count": len(value), "titles": [case["metadata"].get("title", "No Title") for case in value]}
+                gathered[stage] = value
+                if stage in ("details", "embedding") and "details" in gathered and "embedding" in gathered:
+                    tasks[asyncio.create_task(_atimed(timings, "search_laws", asearch_laws(get_index(KNOWLEDGE_INDEX_NAME), gathered["embedding"], gathered["details"])))] = "laws"
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not gathered["laws"]:
+        yield "error", {"error": "No relevant laws found"}
+        return
+    if not gathered["cases"]:
+        yield "error", {"error": "No similar cases found"}
+        return
+
+    case_details = gathered["details"]
+    laws_text = format_laws(gathered["laws"])
+    cases_text = format_cases(gathered["cases"])
+    case_description = case_details.get("case_description", "No description available")
+
+    verdict_start = time.perf_counter()
+    tokens = []
+    async for token in astream_verdict(case_description, laws_text, cases_text):
+        if not tokens:
+            timings["first_verdict_token"] = round((time.perf_counter() - start) * 1000, 1)
+        tokens.append(token)
+        yield "token", {"text": token}
+    timings["get_verdict"] = round((time.perf_counter() - verdict_start) * 1000, 1)
+    timings["total"] = round((time.perf_counter() - start) * 1000, 1)
+
+    result = build_case_result(case_details, "".join(tokens), laws_text, cases_text)
+    result["timings_ms"] = timings
+    result["execution_mode"] = "streaming"
+    yield "result", result
+
+
+def warm_up():
+    """Builds the model and embedding clients and opens both indexes before the first request."""
+    get_chat_llm()
+    get_embedding_client()
+    get_index(KNOWLEDGE_INDEX_NAME)
+    get_index(CASES_INDEX_NAME)